@@ -7,6 +7,4 @@
 import cui
 
 if __name__ == "__main__":
-    app = cui.create_application()[0]
-    app.start()
-    print("\n\x1b[J")
+    cui.main_app()
@@ -0,0 +1,842 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""
+Headless benchmarks of the console user interface hot paths.
+
+The CUI is driven through ApplicationHandler.handle_event() and drawn on a fake
+screen. The journal, psutil, pamela and some tools are replaced by the stand-ins
+below bench/stubs and all system files are read from a generated root tree
+(see GROMMUNIO_CUI_ROOT), so this runs on a plain Linux box without systemd or
+grommunio installed.
+
+The download server is replaced by a local HTTP stand-in (see
+GROMMUNIO_CUI_REPO_SERVER) answering slowly, like a busy server does.
+
+With --check, the counted (not timed) results are checked against the
+bounds of CHECKS, f.e. that scrolling does not render the rows again, and
+the exit code is 1 if any is exceeded.
+
+Usage: python3 bench/cui_bench.py [--output=result.json] [--repeat=N]
+       [--sizes=1000,10000,100000] [--screen=COLSxROWS] [--check]
+"""
+import base64
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+BENCH_DIR: Path = Path(__file__).resolve().parent
+STUBS_DIR: Path = BENCH_DIR / "stubs"
+REPO_DIR: Path = BENCH_DIR.parent
+
+ROOT_FILES: Dict[str, str] = {
+    "etc/os-release": 'NAME="grommunio"\nVERSION="2022.05.2"\nID="grommunio"\n',
+    "etc/shadow": "root:$6$bench$hash:19000:0:99999:7:::\n",
+    "etc/vconsole.conf": 'KEYMAP="us"\n',
+    "etc/locale.conf": 'LANG="en_US.UTF-8"\n',
+    "etc/sysconfig/language": 'RC_LANG="en_US.UTF-8"\nROOT_USES_LANG="ctype"\n',
+    "etc/grommunio-common/setup_done": "",
+    "etc/systemd/timesyncd.conf": "[Time]\nNTP=0.pool.ntp.org\n",
+    "etc/zypp/repos.d/grommunio.repo": "[grommunio]\nenabled=1\nautorefresh=1\n"
+                                       "baseurl=https://download.grommunio.com/community/"
+                                       "openSUSE_Leap_15.5/?ssl_verify=no\ntype=rpm-md\n",
+    "proc/loadavg": "0.42 0.37 0.31 1/234 5678\n",
+    "usr/share/kbd/keymaps/i386/qwerty/us.map": "",
+    "usr/share/kbd/keymaps/i386/qwertz/de.map": "",
+    "usr/share/kbd/keymaps/i386/azerty/fr.map": "",
+}
+
+# grommunio-admin config dump with several log units
+GROMMUNIO_ADMIN: str = """#!/bin/sh
+cat <<EOT
+logs:
+  gromox-http:
+    source: gromox-http.service
+  gromox-delivery:
+    source: gromox-delivery.service
+  nginx:
+    source: nginx.service
+  postfix:
+    source: postfix.service
+logging:
+  formatters:
+    mi-default:
+      format: '[%(asctime)s] [%(levelname)s] (%(module)s): "%(message)s"'
+EOT
+"""
+
+
+# Credentials accepted by the download server stand-in and its answer delay (in seconds)
+REPO_USER: str = "bench"
+REPO_PASSWORD: str = "secret"
+REPO_DELAY: float = 0.5
+# The repository key served (big enough to be received in several chunks) and its ETag
+REPO_KEY: bytes = b"-----BEGIN PGP PUBLIC KEY BLOCK-----\n" + b"A" * 256 * 1024
+REPO_KEY_ETAG: str = '"bench-1"'
+
+
+class RepoServerHandler(BaseHTTPRequestHandler):
+    """
+    Answers every GET after REPO_DELAY: the key (revalidated by its ETag) or
+    the repository file, with 200 for the bench credentials only.
+    """
+    requests: int = 0
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer like the download server does."""
+        RepoServerHandler.requests += 1
+        time.sleep(REPO_DELAY)
+        if self.path.endswith("/RPM-GPG-KEY-grommunio"):
+            self.send_key()
+            return
+        token = base64.b64encode(f"{REPO_USER}:{REPO_PASSWORD}".encode()).decode()
+        if self.headers.get("Authorization") == f"Basic {token}":
+            body = b"<repomd/>"
+            self.send_response(200)
+        else:
+            body = b"unauthorized"
+            self.send_response(401)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_key(self):
+        """Send the key, or 304 if the client has it already."""
+        if self.headers.get("If-None-Match") == REPO_KEY_ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(REPO_KEY)))
+        self.send_header("ETag", REPO_KEY_ETAG)
+        self.end_headers()
+        self.wfile.write(REPO_KEY)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keep the output clean."""
+
+
+def start_repo_server() -> ThreadingHTTPServer:
+    """Start the download server stand-in on a free local port."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RepoServerHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# The bounds of the counted results checked by --check: (description, check)
+CHECKS: List[Tuple[str, Callable[[Dict[str, Any]], bool]]] = [
+    ("scroll: at most one row rendered per scroll step",
+     lambda result: result["scroll"]["row_renders"] <= result["scroll"]["steps"]),
+    ("resize: only the shown rows wrapped on a new width",
+     lambda result: all(resize["wrapped_lines"] <= result["meta"]["screen"][1]
+                        for resize in result["resize"]["resizes"])),
+    ("resize: no row wrapped again on a known width",
+     lambda result: result["resize"]["resizes"][-1]["wrapped_lines"] == 0),
+    ("rows: GLine allocates at most half of the memory of GText",
+     lambda result: result["rows"]["GLine"]["alloc_kib"]
+     <= result["rows"]["GText"]["alloc_kib"] / 2),
+]
+
+
+def check_results(result: Dict[str, Any]) -> List[str]:
+    """Return the descriptions of the CHECKS failed by result."""
+    return [description for description, check in CHECKS if not check(result)]
+
+
+def create_root(root: Path):
+    """Create the fake root tree the CUI reads its system files from."""
+    for name, content in ROOT_FILES.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+    admin = root / "usr/sbin/grommunio-admin"
+    admin.parent.mkdir(parents=True, exist_ok=True)
+    admin.write_text(GROMMUNIO_ADMIN, encoding="utf-8")
+    admin.chmod(0o755)
+
+
+def get_arg(name: str, default: str) -> str:
+    """Return the value of --name=value or default."""
+    for arg in sys.argv[1:]:
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def get_rss() -> int:
+    """Return the resident set size of this process in bytes (Linux)."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as file_handle:
+            return int(file_handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Return the statistics of samples (in seconds) in milliseconds."""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "min_ms": ordered[0] * 1000,
+        "median_ms": statistics.median(ordered) * 1000,
+        "mean_ms": statistics.mean(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+class WidgetCounter:
+    """Counts urwid widget instantiations by hooking the widget metaclass."""
+
+    def __init__(self, urwid_module):
+        self.count: int = 0
+        self._meta = type(urwid_module.Widget)
+        self._call = self._meta.__call__
+
+    def __enter__(self):
+        counter = self
+        call = self._call
+
+        def counting_call(cls, *args, **kwargs):
+            counter.count += 1
+            return call(cls, *args, **kwargs)
+
+        self._meta.__call__ = counting_call
+        return self
+
+    def __exit__(self, *exc):
+        self._meta.__call__ = self._call
+
+
+class Bench:
+    """Drives one application instance and collects the measurements."""
+
+    def __init__(self, repeat: int, screen_size: Tuple[int, int]):
+        # pylint: disable=import-outside-toplevel
+        # because the stand-ins and the root prefix must be set up first
+        import urwid
+        import cui
+        from cui.classes.collector import collector
+        self.urwid = urwid
+        self.collector = collector
+        self.symbol = cui.symbol
+        self.repeat = repeat
+        self.screen = make_fake_screen(urwid, screen_size)
+        original_screen = urwid.raw_display.Screen
+        urwid.raw_display.Screen = lambda *args, **kwargs: self.screen
+        try:
+            start = time.perf_counter()
+            self.app = cui.create_application()[0]
+            self.startup = time.perf_counter() - start
+        finally:
+            urwid.raw_display.Screen = original_screen
+        self.loop = self.app.control.app_control.loop
+        self._remove_clock()
+        self.app.prepare_mainscreen()
+        self.loop.widget = self.app.control.app_control.body
+
+    def _remove_clock(self):
+        """Remove the clock alarm, the ticks are driven by the benchmark."""
+        alarm = self.app.control.app_control.clock_alarm
+        if alarm is not None:
+            self.loop.remove_alarm(alarm)
+            self.app.control.app_control.clock_alarm = None
+
+    def draw(self):
+        """Draw like the main loop does after every input."""
+        self.loop.draw_screen()
+
+    def measure(self, setup: Callable, action: Callable) -> Dict[str, Any]:
+        """Time action (plus drawing) repeat times, calling setup untimed before."""
+        samples: List[float] = []
+        with WidgetCounter(self.urwid) as counter:
+            for _ in range(self.repeat):
+                setup()
+                self.draw()
+                counter.count = 0
+                start = time.perf_counter()
+                action()
+                self.draw()
+                samples.append(time.perf_counter() - start)
+        result = summarize(samples)
+        result["widgets_last"] = counter.count
+        return result
+
+    def to_main(self):
+        """Return to the main screen."""
+        self.app.control.app_control.current_window = self.symbol.MAIN
+        self.app.control.log_control.log_finished = False
+        self.app.prepare_mainscreen()
+        self.loop.widget = self.app.control.app_control.body
+
+    def to_main_menu(self):
+        """Open the main menu."""
+        self.to_main()
+        self.app._open_main_menu()  # pylint: disable=protected-access
+
+    def to_log_viewer(self):
+        """Open the log viewer (from the main screen)."""
+        self.to_main()
+        self.app.handle_event("h")
+
+    def key(self, key: str) -> Callable:
+        """Return the action pressing key."""
+        return lambda: self.app.handle_event(key)
+
+    def bench_keys(self) -> Dict[str, Any]:
+        """Measure the latency of single keystrokes in different windows."""
+        scenarios = {
+            "main/tab": (self.to_main, "tab"),
+            "main/colormode": (self.to_main, "c"),
+            "main/open-log-viewer": (self.to_main, "h"),
+            "main/open-keyboard": (self.to_main, "f5"),
+            "main-menu/down": (self.to_main_menu, "down"),
+            "main-menu/up": (self.to_main_menu, "up"),
+            "main-menu/esc": (self.to_main_menu, "esc"),
+            "log-viewer/right": (self.to_log_viewer, "right"),
+            "log-viewer/plus": (self.to_log_viewer, "+"),
+            "log-viewer/esc": (self.to_log_viewer, "esc"),
+        }
+        return {
+            name: self.measure(setup, self.key(key))
+            for name, (setup, key) in scenarios.items()
+        }
+
+    def bench_tick(self) -> Dict[str, Any]:
+        """Measure the cost of one clock tick on the main screen."""
+        def tick():
+            self.app._update_clock(self.loop)  # pylint: disable=protected-access
+            self._remove_clock()
+        return self.measure(self.to_main, tick)
+
+    def bench_dialogs(self) -> Dict[str, Any]:
+        """Measure opening the dialogs (the first open builds them, widgets_last counts the last)."""
+        # pylint: disable=import-outside-toplevel
+        # because the stand-ins and the root prefix must be set up first
+        from cui import parameter
+        # pylint: disable=protected-access
+        # because the password dialog has no public opener
+        scenarios = {
+            "message-box": lambda: self.app.message_box(
+                parameter.MsgBoxParams("Benchmark message", "Benchmark")
+            ),
+            "input-box": lambda: self.app.input_box(
+                parameter.InputBoxParams("Benchmark input", "Benchmark", "text", False, None, True)
+            ),
+            "password": self.app._open_change_system_pw_dialog,
+        }
+        return {name: self.measure(self.to_main, action) for name, action in scenarios.items()}
+
+    def wait_for(self, condition: Callable[[], bool], timeout: float = 30.0) -> float:
+        """Run the event loop until condition is true, return the seconds waited."""
+        start = time.perf_counter()
+        while not condition() and time.perf_counter() - start < timeout:
+            self.loop.event_loop._loop()  # pylint: disable=protected-access
+        return time.perf_counter() - start
+
+    def bench_repo_check(self) -> Dict[str, Any]:
+        """
+        Save the "supported" repository selection against the slow download
+        server stand-in: the latency of the save key, the time until the
+        outcome is shown and the requests the server got. Canceling drops the
+        outcome of the running check.
+        """
+        # pylint: disable=import-outside-toplevel
+        # because the stand-ins and the root prefix must be set up first
+        from cui import util
+        from cui.classes.repo import repo_checker
+        # the selection is saved already, so the repo file stays unchanged
+        repofile = Path(util.root_path("/etc/zypp/repos.d/grommunio.repo"))
+        repofile.write_text(
+            "[grommunio]\nenabled=1\nautorefresh=1\n"
+            f"baseurl=https://{util.get_repo_url(REPO_USER, REPO_PASSWORD)}\ntype=rpm-md\n",
+            encoding="utf-8",
+        )
+        repo_checker.clear()
+        menu_control = self.app.control.menu_control
+
+        def save(user: str, password: str, cancel: bool = False) -> Dict[str, Any]:
+            self.to_main_menu()
+            self.app._open_repo_conf()  # pylint: disable=protected-access
+            body = menu_control.repo_selection_body.base_widget
+            body[3].set_state(True)
+            body[4][1].set_edit_text(user)
+            body[5][1].set_edit_text(password)
+            self.draw()
+            served = RepoServerHandler.requests
+            start = time.perf_counter()
+            self.app.handle_event("hidden Save enter")
+            self.draw()
+            result = {"save_ms": (time.perf_counter() - start) * 1000}
+            pending = menu_control.repo_check
+            if cancel:
+                self.app.handle_event("esc")
+                result["canceled"] = pending is not None and pending.canceled
+                self.wait_for(lambda: pending.done)
+            else:
+                self.wait_for(lambda: menu_control.repo_check is None)
+                result["outcome_ms"] = (time.perf_counter() - start) * 1000
+                result["message"] = self.app.control.app_control.loop.widget.top_w \
+                    .base_widget.body.base_widget[0].text
+            result["server_requests"] = RepoServerHandler.requests - served
+            return result
+
+        return {
+            "delay_ms": REPO_DELAY * 1000,
+            "valid": save(REPO_USER, REPO_PASSWORD),
+            "valid-cached": save(REPO_USER, REPO_PASSWORD),
+            "invalid": save(REPO_USER, "wrong"),
+            "cancel": save("other", REPO_PASSWORD, cancel=True),
+        }
+
+    def bench_repo_refresh(self) -> Dict[str, Any]:
+        """
+        Switch the repository selection to "community" beside several other
+        repositories: the latency of the save key, the time until the key is
+        fetched and imported and the changed repositories are refreshed (by
+        the zypper stand-in, logging its calls), and the refreshed ones.
+        """
+        # pylint: disable=import-outside-toplevel
+        # because the stand-ins and the root prefix must be set up first
+        from cui import util
+        from cui.symbol import MESSAGE_BOX
+        repodir = Path(util.root_path("/etc/zypp/repos.d"))
+        for alias in ("repo-oss", "repo-update", "repo-non-oss"):
+            (repodir / f"{alias}.repo").write_text(
+                f"[{alias}]\nenabled=1\nautorefresh=1\n"
+                f"baseurl=http://download.opensuse.org/{alias}/\ntype=rpm-md\n",
+                encoding="utf-8",
+            )
+        log = Path(util.root_path("/var/log/zypper-stub.log"))
+        log.parent.mkdir(parents=True, exist_ok=True)
+        log.write_text("", encoding="utf-8")
+        os.environ["ZYPPER_STUB_LOG"] = str(log)
+        self.to_main_menu()
+        self.app._open_repo_conf()  # pylint: disable=protected-access
+        self.app.control.menu_control.repo_selection_body.base_widget[1].set_state(True)
+        self.draw()
+        start = time.perf_counter()
+        self.app.handle_event("hidden Save enter")
+        self.draw()
+        saved = time.perf_counter() - start
+        self.wait_for(lambda: self.app.control.app_control.current_window == MESSAGE_BOX)
+        duration = time.perf_counter() - start
+        del os.environ["ZYPPER_STUB_LOG"]
+        return {
+            "save_ms": saved * 1000,
+            "outcome_ms": duration * 1000,
+            "zypper_calls": log.read_text(encoding="utf-8").splitlines(),
+            "message": self.app.control.app_control.loop.widget.top_w
+            .base_widget.body.base_widget[0].text,
+        }
+
+    def bench_key_download(self) -> Dict[str, Any]:
+        """
+        Download the repository key from the stand-in twice, handing the
+        progress over to the loop: the first download is streamed, the second
+        one is answered with 304 (not modified).
+        """
+        # pylint: disable=import-outside-toplevel
+        # because the stand-ins and the root prefix must be set up first
+        from cui.classes.repo import key_fetcher, KEY_URL
+        from cui.classes.worker import ProgressPipe, run_in_background
+        Path(key_fetcher._meta_file()).unlink(missing_ok=True)  # pylint: disable=protected-access
+
+        def download() -> Dict[str, Any]:
+            reports: List[Tuple[int, int]] = []
+            results: List[Any] = []
+            progress = ProgressPipe(self.loop, lambda done, total: reports.append((done, total)))
+            served = RepoServerHandler.requests
+            start = time.perf_counter()
+            run_in_background(
+                self.loop, key_fetcher.fetch,
+                lambda result, error: results.append(result), KEY_URL, progress.report
+            )
+            self.wait_for(lambda: bool(results))
+            duration = time.perf_counter() - start
+            progress.close()
+            return {
+                "ms": duration * 1000,
+                "downloaded": results[0].downloaded,
+                "bytes": results[0].size,
+                "progress_reports": len(reports),
+                "last_report": list(reports[-1]) if reports else None,
+                "server_requests": RepoServerHandler.requests - served,
+            }
+
+        return {
+            "delay_ms": REPO_DELAY * 1000,
+            "first": download(),
+            "unchanged": download(),
+        }
+
+    def bench_session(self, lines: int = 5000) -> Dict[str, Any]:
+        """
+        Run a tool printing lines in the embedded terminal, beside the CUI:
+        the latency of opening it and the time until it has exited, drawing
+        the screen on the way.
+        """
+        self.to_main_menu()
+        start = time.perf_counter()
+        # pylint: disable=protected-access
+        # because the tools are started from the main menu only
+        self.app._open_session(
+            "bench", ["/bin/sh", "-c", f"seq 1 {lines}; sleep 0.2"], "bench"
+        )
+        self.draw()
+        opened = time.perf_counter() - start
+        session = self.app.control.app_control.sessions.get_last()
+        draws: List[float] = []
+
+        def finished() -> bool:
+            draws.append(time.perf_counter())
+            self.draw()
+            return not session.running
+
+        duration = self.wait_for(finished) + opened
+        self.app.handle_event("enter")
+        return {
+            "lines": lines,
+            "open_ms": opened * 1000,
+            "run_ms": duration * 1000,
+            "draws": len(draws),
+            "back_to": self.app.control.app_control.current_window,
+        }
+
+    def bench_update(self) -> Dict[str, Any]:
+        """
+        Update the system in the background by the zypper stand-in replaying
+        recorded --xmlout streams: the latency of starting the update, the time
+        until it is done and the progress shown on the way, while keys are
+        handled beside it.
+        """
+        # pylint: disable=import-outside-toplevel
+        # because the stand-ins and the root prefix must be set up first
+        from cui.classes.zypper import update_job
+        from cui.symbol import SYSTEM_UPDATE
+        self.to_main_menu()
+        start = time.perf_counter()
+        # pylint: disable=protected-access
+        # because the update is started from the main menu only
+        self.app._run_update()
+        self.draw()
+        started = time.perf_counter() - start
+        percents: List[int] = []
+        keys: List[float] = []
+
+        def done() -> bool:
+            if self.app.control.app_control.current_window == SYSTEM_UPDATE:
+                percents.append(update_job.get_status().percent)
+            key_start = time.perf_counter()
+            self.app.handle_event("down")
+            self.draw()
+            keys.append(time.perf_counter() - key_start)
+            return not update_job.running
+
+        duration = self.wait_for(done, timeout=60) + started
+        pile = self.app.control.app_control.dialogs.get("update", lambda: None)[0].base_widget
+        result = {
+            "start_ms": started * 1000,
+            "run_ms": duration * 1000,
+            "progress_updates": len(percents),
+            "monotonic": percents == sorted(percents),
+            "last_percent": percents[-1] if percents else None,
+            "shown_percent": pile[4].current,
+            "key_ms_max": max(keys) * 1000 if keys else None,
+            "packages": len(update_job.progress.packages),
+            "ok": update_job.ok,
+        }
+        self.app.handle_event("enter")
+        result["back_to"] = self.app.control.app_control.current_window
+        return result
+
+    def bench_scroll(self, lines: int = 1000, steps: int = 50) -> Dict[str, Any]:
+        """
+        Scroll a long ScrollBar(Scrollable(Pile)) line by line and count the
+        renders of the wrapped rows (only the first render should run them).
+        """
+        # pylint: disable=import-outside-toplevel
+        # because the stand-ins and the root prefix must be set up first
+        from cui.classes.scroll import ScrollBar, Scrollable
+        urwid = self.urwid
+
+        class CountingText(urwid.Text):
+            """Text counting its (uncached) renders."""
+            renders: int = 0
+
+            def render(self, size, focus=False):
+                CountingText.renders += 1
+                return super().render(size, focus)
+
+        size = self.screen.get_cols_rows()
+        widget = ScrollBar(Scrollable(urwid.Pile(
+            [CountingText(f"line {idx}") for idx in range(lines)]
+        )))
+        widget.render(size)
+        CountingText.renders = 0
+        start = time.perf_counter()
+        for _ in range(steps):
+            widget.keypress(size, "down")
+            widget.render(size)
+        duration = time.perf_counter() - start
+        return {
+            "lines": lines,
+            "steps": steps,
+            "row_renders": CountingText.renders,
+            "per_step_ms": duration * 1000 / steps,
+        }
+
+    @staticmethod
+    def bench_dispatch(counts: Tuple[int, ...] = (15, 150, 1500)) -> Dict[str, Any]:
+        """
+        Measure the keymap dispatch against building a dispatch dict per
+        keystroke (like before the keymap) for growing numbers of windows.
+        """
+        # pylint: disable=import-outside-toplevel
+        # because the stand-ins and the root prefix must be set up first
+        from cui.classes.keymap import Keymap
+
+        def handler(_key):
+            pass
+
+        rounds = 20000
+        results: Dict[str, Any] = {}
+        for count in counts:
+            windows = [f"WINDOW-{i}" for i in range(count)]
+            keymap = Keymap()
+            keymap.add_action("noop", lambda: None)
+            keymap.bind("f4", "noop")
+            for window in windows:
+                keymap.set_window_handler(window, handler)
+            window = windows[-1]
+            start = time.perf_counter()
+            for _ in range(rounds):
+                keymap.dispatch(window, "f4")
+            registry = (time.perf_counter() - start) / rounds
+            start = time.perf_counter()
+            for _ in range(rounds):
+                func = {name: handler for name in windows}.get(window)
+                func("f4")
+            rebuilt = (time.perf_counter() - start) / rounds
+            results[str(count)] = {"keymap_us": registry * 1e6, "dict_per_key_us": rebuilt * 1e6}
+        return results
+
+    def bench_rows(self, count: int = 10000) -> Dict[str, Any]:
+        """
+        Compare creating and rendering count log rows as GLine and as GText:
+        time and RSS growth, then the allocations (blocks and bytes) in a second
+        run under tracemalloc. GLine goes first, so it cannot reuse the memory
+        freed by the GText rows.
+        """
+        # pylint: disable=import-outside-toplevel
+        # because the stand-ins and the root prefix must be set up first
+        from cui.classes.gwidgets import GLine, GText
+        from cui.classes.scroll import ScrollBar, Scrollable
+        size = self.screen.get_cols_rows()
+        lines = [
+            f"[2022-10-19T10:00:{idx % 60:02d}] [6] (gromox-http): \"request {idx} done\""
+            for idx in range(count)
+        ]
+        def create(row_type):
+            widget = ScrollBar(Scrollable(self.urwid.Pile([row_type(line) for line in lines])))
+            return widget, widget.render(size)
+
+        results: Dict[str, Any] = {}
+        for row_type in (GLine, GText):
+            gc.collect()
+            rss = get_rss()
+            start = time.perf_counter()
+            rows = create(row_type)
+            duration = time.perf_counter() - start
+            result = {"create_render_ms": duration * 1000, "rss_kib": (get_rss() - rss) / 1024}
+            del rows
+            gc.collect()
+            tracemalloc.start()
+            rows = create(row_type)
+            stats = tracemalloc.take_snapshot().statistics("filename")
+            tracemalloc.stop()
+            result["alloc_blocks"] = sum(stat.count for stat in stats)
+            result["alloc_kib"] = sum(stat.size for stat in stats) / 1024
+            results[row_type.__name__] = result
+            del rows, stats
+        return results
+
+    def bench_resize(self, count: int = 10000, widths: Tuple[int, ...] = (120, 80, 120)) -> Dict[str, Any]:
+        """
+        Render count long log rows (GLine) after resizing the screen to each of
+        widths: the render time and the lines wrapped (layout cache misses).
+        """
+        # pylint: disable=import-outside-toplevel
+        # because the stand-ins and the root prefix must be set up first
+        from cui.classes.gwidgets import GLine
+        from cui.classes.layout import layout_cache
+        from cui.classes.scroll import ScrollBar, Scrollable
+        rows = self.screen.get_cols_rows()[1]
+        lines = [
+            f"[2022-10-19T10:00:{idx % 60:02d}] [6] (gromox-http): "
+            + " ".join(f"message {idx} part {part}" for part in range(idx % 40))
+            for idx in range(count)
+        ]
+        widget = ScrollBar(Scrollable(self.urwid.Pile([GLine(line) for line in lines])))
+        layout_cache.clear()
+        results: List[Dict[str, Any]] = []
+        for width in widths:
+            misses = layout_cache.misses
+            start = time.perf_counter()
+            widget.render((width, rows))
+            results.append({
+                "width": width,
+                "render_ms": (time.perf_counter() - start) * 1000,
+                "wrapped_lines": layout_cache.misses - misses,
+            })
+        return {"lines": count, "resizes": results}
+
+    def bench_log_viewer(self, sizes: List[int]) -> Dict[str, Any]:
+        """Measure opening the log viewer on journals of different sizes."""
+        # pylint: disable=import-outside-toplevel
+        # because it is the stand-in of bench/stubs
+        from systemd import journal
+        unit = "gromox-http"
+        line_count = self.app.control.log_control.log_line_count
+        results: Dict[str, Any] = {}
+        for size in sizes:
+            journal.Reader.entries = size
+
+            def cold():
+                self.collector.invalidate()
+                self.app._open_log_viewer(unit, line_count)  # pylint: disable=protected-access
+
+            def warm():
+                self.app._open_log_viewer(unit, line_count)  # pylint: disable=protected-access
+
+            self.to_main()
+            gc.collect()
+            tracemalloc.start()
+            cold()
+            self.draw()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[str(size)] = {
+                "cold": self.measure(self.to_main, cold),
+                "warm": self.measure(self.to_main, warm),
+                "peak_kib": peak / 1024,
+            }
+        return results
+
+
+def make_fake_screen(urwid, screen_size: Tuple[int, int]):
+    """Return a screen of fixed size consuming the canvases instead of a terminal."""
+    class FakeScreen(urwid.BaseScreen):
+        """Counts drawn frames and rows instead of writing to a terminal."""
+
+        def __init__(self):
+            super().__init__()
+            self.frames: int = 0
+            self.rows: int = 0
+
+        def get_cols_rows(self):
+            return screen_size
+
+        def draw_screen(self, size, canvas):
+            self.frames += 1
+            for row in canvas.content():
+                for _ in row:
+                    pass
+                self.rows += 1
+
+        def tty_signal_keys(self, *args, **kwargs):
+            """No terminal, no signal keys."""
+            return ["undefined" for _ in range(0, 5)]
+
+        def set_terminal_properties(self, *args, **kwargs):
+            """No terminal, nothing to set."""
+
+        def reset_default_terminal_palette(self, *args):
+            """No terminal, nothing to reset."""
+
+    return FakeScreen()
+
+
+def get_version() -> str:
+    """Return the git version of the benchmarked tree (if available)."""
+    try:
+        return subprocess.check_output(
+            ["git", "-C", str(REPO_DIR), "describe", "--always", "--dirty"],
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    """Run all benchmarks and write the JSON result file."""
+    output = get_arg("output", "cui-bench.json")
+    repeat = int(get_arg("repeat", "20"))
+    sizes = [int(size) for size in get_arg("sizes", "1000,10000,100000").split(",")]
+    cols, rows = (int(val) for val in get_arg("screen", "120x40").split("x"))
+    check = "--check" in sys.argv
+
+    repo_server = start_repo_server()
+    with tempfile.TemporaryDirectory(prefix="cui-bench-") as root:
+        create_root(Path(root))
+        os.environ["GROMMUNIO_CUI_ROOT"] = root
+        os.environ["GROMMUNIO_CUI_REPO_SERVER"] = f"http://127.0.0.1:{repo_server.server_port}"
+        os.environ["PATH"] = f"{STUBS_DIR / 'bin'}{os.pathsep}{os.environ.get('PATH', '')}"
+        sys.path[0:0] = [str(STUBS_DIR), str(REPO_DIR)]
+        # the CUI parses sys.argv itself
+        sys.argv = sys.argv[:1]
+        os.chdir(REPO_DIR)
+
+        bench = Bench(repeat, (cols, rows))
+        result = {
+            "meta": {
+                "version": get_version(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "urwid": getattr(bench.urwid, "__version__", "unknown"),
+                "machine": platform.machine(),
+                "repeat": repeat,
+                "screen": [cols, rows],
+            },
+            "startup_ms": bench.startup * 1000,
+            "keys": bench.bench_keys(),
+            "tick": bench.bench_tick(),
+            "dialogs": bench.bench_dialogs(),
+            "repo_check": bench.bench_repo_check(),
+            "repo_refresh": bench.bench_repo_refresh(),
+            "key_download": bench.bench_key_download(),
+            "session": bench.bench_session(),
+            "update": bench.bench_update(),
+            "dispatch": bench.bench_dispatch(),
+            "scroll": bench.bench_scroll(),
+            "rows": bench.bench_rows(),
+            "resize": bench.bench_resize(),
+            "log_viewer": bench.bench_log_viewer(sizes),
+            "frames": bench.screen.frames,
+        }
+
+    repo_server.shutdown()
+    with open(output, "w", encoding="utf-8") as file_handle:
+        json.dump(result, file_handle, indent=2)
+    print(f"Results written to {output}")
+    if check:
+        failed = check_results(result)
+        for description in failed:
+            print(f"FAILED: {description}")
+        print(f"{len(CHECKS) - len(failed)} of {len(CHECKS)} checks passed")
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
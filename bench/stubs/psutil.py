@@ -0,0 +1,46 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""Stand-in for psutil returning fixed values, so results are comparable"""
+import socket
+from collections import namedtuple
+from typing import Dict, List
+
+scpufreq = namedtuple("scpufreq", ["current", "min", "max"])
+svmem = namedtuple("svmem", ["total", "available", "percent", "used", "free"])
+snicaddr = namedtuple("snicaddr", ["family", "address", "netmask", "broadcast", "ptp"])
+
+GIB: int = 1024 ** 3
+
+
+def cpu_freq() -> scpufreq:
+    """Return a fixed cpu frequency in MHz."""
+    return scpufreq(2400.0, 800.0, 3600.0)
+
+
+def cpu_count(logical: bool = True) -> int:
+    """Return a fixed cpu count."""
+    return 8 if logical else 4
+
+
+def virtual_memory() -> svmem:
+    """Return a fixed memory usage."""
+    return svmem(16 * GIB, 10 * GIB, 37.5, 6 * GIB, 8 * GIB)
+
+
+def net_if_addrs() -> Dict[str, List[snicaddr]]:
+    """Return a loopback and one ethernet interface."""
+    return {
+        "lo": [
+            snicaddr(socket.AF_INET, "127.0.0.1", "255.0.0.0", None, None),
+            snicaddr(socket.AF_INET6, "::1", "ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff", None, None),
+        ],
+        "eth0": [
+            snicaddr(socket.AF_INET, "192.0.2.10", "255.255.255.0", "192.0.2.255", None),
+            snicaddr(socket.AF_INET6, "2001:db8::10%eth0", "ffff:ffff:ffff:ffff::", None, None),
+        ],
+    }
+
+
+def boot_time() -> float:
+    """Return a fixed boot time."""
+    return 1640995200.0
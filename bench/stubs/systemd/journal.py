@@ -0,0 +1,47 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""Stand-in for systemd.journal yielding synthetic journal entries"""
+import datetime
+from typing import Any, Dict, Iterator
+
+# Synthetic entries are timestamped backwards from this point in time
+BASE_TIME: datetime.datetime = datetime.datetime(2022, 1, 1, 0, 0, 0)
+LOG_ERR: int = 3
+
+
+class Reader:
+    """Yields `entries` synthetic entries of the matched unit."""
+    entries: int = 1000
+
+    def __init__(self):
+        self.unit: str = "syslog.service"
+        self.max_priority: int = 7
+        self.since: datetime.datetime = datetime.datetime.min
+
+    def this_boot(self):
+        """Only entries of this boot are synthesized anyway."""
+
+    def add_match(self, **kwargs):
+        """Remember the matched unit."""
+        self.unit = kwargs.get("_SYSTEMD_UNIT", self.unit)
+
+    def log_level(self, level: int):
+        """Only yield entries of level or a higher priority."""
+        self.max_priority = level
+
+    def seek_realtime(self, since: datetime.datetime):
+        """Only yield entries since the given time."""
+        self.since = since
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        count = self.entries
+        for i in range(count):
+            timestamp = BASE_TIME - datetime.timedelta(seconds=count - i)
+            if i % 8 > self.max_priority or timestamp < self.since:
+                continue
+            yield {
+                "__REALTIME_TIMESTAMP": timestamp,
+                "PRIORITY": i % 8,
+                "_SYSTEMD_UNIT": self.unit,
+                "MESSAGE": f"synthetic message {i} of {self.unit} " * (1 + i % 4),
+            }
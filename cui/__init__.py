@@ -2,8 +2,9 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 # SPDX-FileCopyrightText: 2021 grommunio GmbH
 """The main module of grommunio-cui."""
+import math
 import sys
-from typing import Tuple, Union
+from typing import List, Tuple, Union
 # from pudb.remote import set_trace
 import urwid
 from cui import classes
@@ -15,6 +16,9 @@ from cui.classes.handler import ApplicationHandler
 from cui.classes.scroll import ScrollBar, Scrollable
 from cui.classes.button import GButton, GBoxButton
 from cui.classes.interface import BaseApplication, WidgetDrawer
+from cui.classes.console import ConsoleHost
+from cui.classes.exporter import exporter, EXPORT_INTERVAL
+from cui.classes.bandwidth import is_serial_console, LOW_BANDWIDTH_TICK
 from cui.symbol import PRODUCTION, MAIN, MAIN_MENU, TERMINAL, LOGIN, REBOOT, SHUTDOWN, \
     UNSUPPORTED, PASSWORD, MESSAGE_BOX, INPUT_BOX, LOG_VIEWER, ADMIN_WEB_PW, TIMESYNCD, \
     KEYBOARD_SWITCH, REPO_SELECTION
@@ -31,38 +35,152 @@ class Application(ApplicationHandler):
     """Placeholder class for future extensions"""
 
 
-def create_application() -> Tuple[Union[Application, None], bool]:
+def get_consoles() -> List[str]:
+    """Return the consoles given by --consoles=tty1,tty2,... (empty if not given)"""
+    for arg in sys.argv:
+        if arg.startswith("--consoles="):
+            return [tty for tty in arg.split("=", 1)[1].split(",") if tty]
+    return []
+
+
+def get_option(name: str, default: str = None) -> str:
+    """Return the value of --name=value (default if not given)"""
+    for arg in sys.argv:
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def print_usage():
+    """Print the usage message."""
+    print(_("Usage: {%s} [OPTIONS]") % sys.argv[0])
+    print(_("\tOPTIONS:"))
+    print(_("\t\t--help: Show this message."))
+    print(_("\t\t-v/--debug: Verbose/Debugging mode."))
+    print(_("\t\t--consoles=tty1,tty2: Drive several consoles by one process."))
+    print(_("\t\t--profile: Profile from the start (type PERF in the log viewer to stop)."))
+    print(_("\t\t--metrics-textfile=PATH: Export metrics as Prometheus textfile."))
+    print(_("\t\t--metrics-socket=PATH: Serve metrics on a Unix socket."))
+    print(_("\t\t--metrics-interval=SECONDS: Minimum time between two exports."))
+    print(_("\t\t--max-fps=N: Draw at most N frames per second (f.e. on slow consoles)."))
+    print(_("\t\t--tick=SECONDS: Seconds between two clock updates (0 = none)."))
+    print(_("\t\t--low-bandwidth: Save bandwidth (default on serial consoles)."))
+    print(_("\t\t--no-low-bandwidth: Do not save bandwidth on serial consoles."))
+
+
+def get_number_option(name: str, default: float = None, minimum: float = 0.0,
+                      exclusive: bool = False) -> float:
+    """
+    Return the number of --name=value (default if not given).
+
+    :param minimum: The smallest allowed value.
+    :param exclusive: The minimum itself is not allowed.
+    :raises ValueError: If the value is no number or too small.
+    """
+    value = get_option(name)
+    if value is None:
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        number = math.nan
+    if not math.isfinite(number) or number < minimum or (exclusive and number == minimum):
+        relation = _("greater than") if exclusive else _("at least")
+        raise ValueError(
+            _("--{name} needs a number {relation} {minimum}, not \"{value}\".").format(
+                name=name, relation=relation, minimum=f"{minimum:g}", value=value
+            )
+        )
+    return number
+
+
+def check_options():
+    """Check the numeric options, raise ValueError (with the message) on a bad value."""
+    get_number_option("metrics-interval", EXPORT_INTERVAL, exclusive=True)
+    get_number_option("max-fps", exclusive=True)
+    get_number_option("tick")
+
+
+def create_application(
+        tty: str = None, event_loop: urwid.EventLoop = None
+) -> Tuple[Union[Application, None], bool]:
     """Creates and returns the main application"""
     urwid.set_encoding("utf-8")
     production = True
     if "--help" in sys.argv:
-        print(_("Usage: {%s} [OPTIONS]") % sys.argv[0])
-        print(_("\tOPTIONS:"))
-        print(_("\t\t--help: Show this message."))
-        print(_("\t\t-v/--debug: Verbose/Debugging mode."))
+        print_usage()
+        return None, PRODUCTION
+    try:
+        check_options()
+    except ValueError as err:
+        print(err)
+        print_usage()
         return None, PRODUCTION
-    app = Application()
-    if "-v" in sys.argv:
-        app.set_debug(True)
-    else:
-        app.set_debug(False)
+    debug = "-v" in sys.argv
+    low_bandwidth = "--low-bandwidth" in sys.argv or \
+        (is_serial_console(tty) and "--no-low-bandwidth" not in sys.argv)
+    # Counting the screen output costs every write, so only these modes do it
+    app = Application(tty, event_loop, count_output=debug or low_bandwidth)
+    app.set_debug(debug)
 
     app.view.gscreen.quiet = True
 
+    if "--profile" in sys.argv:
+        app.control.app_control.profiler.start()
+
+    if get_option("metrics-textfile") or get_option("metrics-socket"):
+        exporter.configure(
+            get_option("metrics-textfile"),
+            get_option("metrics-socket"),
+            get_number_option("metrics-interval", EXPORT_INTERVAL, exclusive=True),
+        )
+        app.start_metrics_export()
+        # The own performance counters are exported as well
+        app.control.app_control.frame_stats.set_enabled(True)
+
+    if low_bandwidth:
+        app.set_low_bandwidth(get_number_option("tick", LOW_BANDWIDTH_TICK))
+    elif get_option("tick"):
+        app.set_tick_interval(get_number_option("tick"))
+
+    if get_option("max-fps"):
+        app.control.app_control.render.set_max_fps(get_number_option("max-fps", exclusive=True))
+
     if "--hidden-login" in sys.argv:
         production = False
 
     return app, production
 
 
-def main_app(immediate_restart: bool = False):
+def main_consoles(ttys: List[str]):
+    """Starts main application on all ttys sharing one process."""
+    try:
+        check_options()
+    except ValueError as err:
+        print(err)
+        print_usage()
+        return
+    if "--help" in sys.argv:
+        create_application()
+        return
+    host = ConsoleHost(ttys, lambda tty, event_loop: create_application(tty, event_loop)[0])
+    host.run()
+
+
+def main_app():
     """Starts main application."""
+    consoles = get_consoles()
+    if consoles:
+        main_consoles(consoles)
+        return
     # application, PRODUCTION = create_application()
     application = create_application()[0]
+    if application is None:
+        return
     # application.set_debug(True)
     # application.gscreen.quiet = False
     # # PRODUCTION = False
-    application.start(immediate_restart)
+    application.start()
     print("\n\x1b[J")
 
 
@@ -2,9 +2,27 @@
 # SPDX-FileCopyrightText: 2022 grommunio GmbH
 """The console user interface classes module"""
 import cui.classes.application
+import cui.classes.bandwidth
 import cui.classes.button
+import cui.classes.collector
+import cui.classes.console
+import cui.classes.dialog
+import cui.classes.exporter
 import cui.classes.gwidgets
 import cui.classes.interface
+import cui.classes.keyboard
+import cui.classes.keymap
+import cui.classes.layout
 import cui.classes.menu
 import cui.classes.parser
+import cui.classes.profiler
+import cui.classes.render
+import cui.classes.repo
+import cui.classes.runner
 import cui.classes.scroll
+import cui.classes.session
+import cui.classes.snapshot
+import cui.classes.stats
+import cui.classes.translation
+import cui.classes.worker
+import cui.classes.zypper
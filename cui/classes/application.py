@@ -1,9 +1,9 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 # SPDX-FileCopyrightText: 2022 grommunio GmbH
 """In this module all application classes are hold."""
+import collections
 import os
-import subprocess
-from typing import Optional, List, Union, Tuple, Any, Dict
+from typing import Optional, List, Union, Tuple, Any, Deque, Dict
 
 import urwid
 
@@ -15,6 +15,19 @@ import cui.classes.button
 import cui.classes.menu
 import cui.symbol
 import cui.util
+from cui.classes.bandwidth import OutputCounter
+from cui.classes.collector import collector
+from cui.classes.dialog import DialogPool
+from cui.classes.profiler import Profiler
+from cui.classes.render import RenderScheduler
+from cui.classes.repo import PendingCheck, RepoUpdate
+from cui.classes.runner import runner
+from cui.classes.session import SessionHost
+from cui.classes.stats import FrameStats
+from cui.classes.keyboard import KeymapFilter, KeymapList, KeymapWalker
+from cui.classes.keymap import Keymap
+from cui.classes.translation import N_
+from cui.classes.worker import CoalescingJob
 from cui.classes.interface import BaseApplication
 from cui.classes.gwidgets import GText, GEdit
 from cui.classes.scroll import ScrollBar
@@ -24,10 +37,16 @@ from cui.classes.button import GBoxButton
 _ = cui.util.init_localization()
 
 ADMIN_DEPENDENT_MENU_CAPTIONS = [
-    _('Change admin-web password')
+    N_('Change admin-web password')
 ]
 
 
+SETUP_STATE_NAMES = (
+    "is_system_pw_upset", "is_network_upset", "is_grommunio_upset", "is_tymsyncd_upset",
+    "is_nginx_upset", "is_grommunio_admin_installed",
+)
+
+
 class SetupState:
     """Stores states of setup and returns a combined binary number"""
     is_system_pw_upset: bool = False
@@ -42,12 +61,12 @@ class SetupState:
 
     def check_grommunio_setup(self):
         # return os.path.isfile('/etc/grommunio/setup_done')
-        return os.path.isfile("/etc/grammm/setup_done") or os.path.isfile(
-            "/etc/grommunio-common/setup_done"
+        return os.path.isfile(cui.util.root_path("/etc/grammm/setup_done")) or os.path.isfile(
+            cui.util.root_path("/etc/grommunio-common/setup_done")
         )
 
     def check_timesyncd_config(self):
-        out = subprocess.check_output(["timedatectl", "status"]).decode()
+        out = runner.run(["timedatectl", "status"], timeout=5).stdout
         items = {}
         for line in out.splitlines():
             key, value = line.partition(":")[::2]
@@ -63,6 +82,11 @@ class SetupState:
         return cui.util.check_socket("127.0.0.1", 8080)
 
     def set_setup_states(self):
+        self.collect_setup_states()
+        collector.invalidate("sysinfo-bottom")
+
+    def collect_setup_states(self):
+        """Check all states without touching collected texts (f.e. in a thread)"""
         # check if pw is set
         self.is_system_pw_upset = cui.util.check_if_password_is_set("root")
         # check network config (2)
@@ -77,6 +101,17 @@ class SetupState:
         self.is_nginx_upset = self.check_nginx_config()
         self.is_grommunio_admin_installed = cui.util.check_if_gradmin_exists()
 
+    def get_setup_states(self) -> Dict[str, bool]:
+        """Return all states by name, f.e. to save them in a snapshot"""
+        return {name: getattr(self, name) for name in SETUP_STATE_NAMES}
+
+    def restore_setup_states(self, states: Dict[str, bool]):
+        """Restore states returned by get_setup_states()"""
+        for name in SETUP_STATE_NAMES:
+            if name in states:
+                setattr(self, name, states[name])
+        collector.invalidate("sysinfo-bottom")
+
     def check_setup_state(self):
         ret_val = 0
         # check if pw is set
@@ -157,10 +192,14 @@ class Header:
                 text_intro, align=urwid.CENTER, wrap=urwid.SPACE
             )
             text_sysinfo_top = cui.util.get_system_info("top")
+            if collector.is_stale("sysinfo-top"):
+                text_sysinfo_top = ("stale", text_sysinfo_top)
             self.tb_sysinfo_top = GText(
                 text_sysinfo_top, align=urwid.LEFT, wrap=urwid.SPACE
             )
             text_sysinfo_bottom = cui.util.get_system_info("bottom")
+            if collector.is_stale("sysinfo-bottom"):
+                text_sysinfo_bottom = ("stale", text_sysinfo_bottom)
             self.tb_sysinfo_bottom = GText(
                 text_sysinfo_bottom, align=urwid.LEFT, wrap=urwid.SPACE
             )
@@ -181,8 +220,8 @@ class Header:
                 authorized_options=self.info_ref.authorized_options,
             )
 
-    info: Info = Info()
-    tb: TextBlock = TextBlock(info)
+    info: Info
+    tb: TextBlock
     _app: BaseApplication
 
     def __init__(
@@ -191,6 +230,8 @@ class Header:
             kbd_layout: str = None,
             application: BaseApplication = None
     ):
+        self.info = Header.Info()
+        self.tb = Header.TextBlock(self.info)
         if colormode:
             self.info.colormode = colormode
         if kbd_layout:
@@ -513,7 +554,8 @@ class MainMenu:
         for idx, caption in enumerate(items.keys(), 1):
             if getattr(self, "app", None):
                 item = MenuItem(idx, caption, items.get(caption), self.app)
-                if not cui.util.check_if_gradmin_exists() and _(caption) in ADMIN_DEPENDENT_MENU_CAPTIONS:
+                if not cui.util.check_if_gradmin_exists() \
+                        and caption in [_(c) for c in ADMIN_DEPENDENT_MENU_CAPTIONS]:
                     urwid.connect_signal(item, "activate", self.app.handle_nothing)
                     attr = "disabled"
                     item.disable()
@@ -552,8 +594,17 @@ class GScreen:
     old_layout: urwid.Frame = None
     debug: bool = False
     quiet: bool = False
+    tty: Optional[str] = None
+    tty_fileno: Optional[int] = None
+    tty_files: Tuple[Any, ...] = ()
+    output: Optional[OutputCounter] = None
+    low_bandwidth: bool = False
     _app: BaseApplication
 
+    def set_signal_keys(self, keys):
+        """Set the tty signal keys (f.e. old_termios) of the console drawn on."""
+        self.screen.tty_signal_keys(*keys, fileno=self.tty_fileno)
+
     def debug_out(self, msg):
         """Prints all elements of the class. """
         for elem in dir(self):
@@ -656,17 +707,40 @@ class ApplicationControl:
     last_input_box_value: str = ""
     log_file_caller: str = ""
     log_file_caller_body: urwid.Widget = None
+    session_caller: str = ""
+    # If the main-screen data is collected in the background
+    refreshing: bool = False
+    # If the running system update has been started on this console
+    updating: bool = False
     current_event = ""
     current_bottom_info = _("Idle")
     menu_items: List[str] = []
     body: urwid.Widget
     loop: urwid.MainLoop
-    key_counter: Dict[str, int] = {}
+    clock_alarm: Any = None
+    metrics_alarm: Any = None
+    # Seconds between two clock ticks (0 = no tick)
+    tick_interval: float = 1.0
+    events: Deque[Any]
+    handling_events: bool = False
+    profiler: Profiler
+    frame_stats: FrameStats
+    keymap: Keymap
+    render: RenderScheduler
+    dialogs: DialogPool
+    sessions: SessionHost
+    kbd_layout_job: CoalescingJob
     progressbar: urwid.ProgressBar
     _app: BaseApplication
 
     def __init__(self, initial_window):
         self.current_window = initial_window
+        self.events = collections.deque()
+        self.profiler = Profiler()
+        self.frame_stats = FrameStats()
+        self.render = RenderScheduler()
+        self.dialogs = DialogPool()
+        self.sessions = SessionHost()
 
     def debug_out(self, msg):
         """Prints all elements of the class. """
@@ -692,10 +766,15 @@ class MenuControl:
     """The MenuControl class contains all menu controlling code."""
     repo_selection_body: urwid.LineBox
     timesyncd_vars: Dict[str, str] = {}
-    keyboard_rb: List
-    keyboard_content: List
-    keyboard_list: ScrollBar
-    keyboard_switch_body: ScrollBar
+    main_menu_actions: Dict[int, Tuple[Any, Any]] = {}
+    keyboard_content: List[str]
+    keyboard_list: KeymapList
+    keyboard_switch_body: KeymapList
+    keyboard_walker: Optional[KeymapWalker] = None
+    keyboard_header: GText
+    keymap_filter: KeymapFilter
+    repo_check: Optional[PendingCheck] = None
+    repo_update: Optional[RepoUpdate] = None
     _app: BaseApplication
 
     def debug_out(self, msg):
@@ -753,12 +832,14 @@ class LogControl:
 class Control:
     """The Control class contains all controlling code."""
     app_control: ApplicationControl
-    log_control: LogControl = LogControl()
-    menu_control: MenuControl = MenuControl()
+    log_control: LogControl
+    menu_control: MenuControl
     _app: BaseApplication
 
     def __init__(self, initial_window):
         self.app_control = ApplicationControl(initial_window)
+        self.log_control = LogControl()
+        self.menu_control = MenuControl()
 
     def debug_out(self, msg):
         """Prints all elements of the class. """
@@ -809,17 +890,21 @@ class Footer:
 class View:
     """The view class contains all view elements that are visible"""
     main_frame: MainFrame
-    header: Header = Header()
+    header: Header
     top_main_menu: MainMenu
-    main_footer: Footer = Footer()
+    main_footer: Footer
     gscreen: GScreen
-    button_store: ButtonStore = ButtonStore()
-    login_window: LoginWindow = LoginWindow()
+    button_store: ButtonStore
+    login_window: LoginWindow
     _app: BaseApplication
 
     def __init__(self, application: BaseApplication):
         self.app = application
+        self.header = Header()
         self.top_main_menu = MainMenu(self.app)
+        self.main_footer = Footer()
+        self.button_store = ButtonStore()
+        self.login_window = LoginWindow()
 
     def debug_out(self, msg):
         """Prints all elements of the class. """
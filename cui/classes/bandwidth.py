@@ -0,0 +1,63 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the helpers of the low-bandwidth mode for serial consoles"""
+import collections
+import os
+import sys
+import time
+from typing import Any, Deque, Optional, Tuple
+
+# Serial devices, f.e. ttyS1 of an IPMI serial-over-LAN console
+SERIAL_PREFIXES: Tuple[str, ...] = ("ttyS", "ttyUSB", "ttyACM", "ttyAMA", "ttymxc", "hvc")
+# Seconds between two clock ticks in low-bandwidth mode
+LOW_BANDWIDTH_TICK: float = 60.0
+# Frame-rate cap in low-bandwidth mode
+LOW_BANDWIDTH_FPS: float = 4.0
+
+
+def is_serial_console(tty: str = None) -> bool:
+    """
+    Return if tty (the terminal of stdout if None) is a serial device.
+
+    :param tty: The console device, f.e. ttyS1.
+    """
+    if tty is None:
+        try:
+            tty = os.ttyname(sys.stdout.fileno())
+        except (OSError, ValueError):
+            return False
+    return os.path.basename(tty).startswith(SERIAL_PREFIXES)
+
+
+class OutputCounter:
+    """
+    Wraps the output file of a screen and counts the bytes written to it (of
+    the last minute), everything else is passed through to the file.
+    """
+
+    def __init__(self, file: Any):
+        self._file = file
+        self._writes: Deque[Tuple[float, int]] = collections.deque()
+        self.total: int = 0
+
+    def write(self, data: Any) -> Optional[int]:
+        """Write data to the file and count it."""
+        size = len(data.encode("utf-8", "replace")) if isinstance(data, str) else len(data)
+        self.total += size
+        now = time.monotonic()
+        self._writes.append((now, size))
+        self._prune(now)
+        return self._file.write(data)
+
+    def _prune(self, now: float):
+        """Forget the writes older than a minute."""
+        while self._writes and self._writes[0][0] < now - 60:
+            self._writes.popleft()
+
+    def get_bytes_per_minute(self) -> int:
+        """Return the number of bytes written in the last minute."""
+        self._prune(time.monotonic())
+        return sum(size for _, size in self._writes)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._file, name)
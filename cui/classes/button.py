@@ -8,6 +8,7 @@ import urwid
 import cui
 from cui.classes.interface import BaseApplication, WidgetDrawer
 from cui.util import _
+from cui.classes.translation import catalog, N_
 
 _ = cui.util.init_localization()
 
@@ -57,6 +58,20 @@ class GBoxButton(WidgetDrawer):
     _bottom_right_char: str = "┘"
 
     def __init__(self, label, on_press=None, user_data=None):
+        self._texts = (urwid.Text(""), urwid.Text(""), urwid.Text(""))
+        self._draw_label(label)
+
+        self.widget = urwid.Pile(list(self._texts))
+        self._label = label
+        self.label = label
+        self.widget = urwid.AttrMap(self.widget, "buttn", "buttnf")
+        self._hidden_button: GButton = GButton(f"hidden {label}", on_press, user_data)
+        super().__init__(self.widget)
+        urwid.register_signal(self.__class__, ["click"])
+        urwid.connect_signal(self, "click", on_press)
+
+    def _draw_label(self, label):
+        """Draw the surrounding lines of label."""
         padding_size = 2
         border = self._horizontal_border_char * (len(label) + padding_size * 2)
         # cursor_position = len(border) + padding_size
@@ -66,21 +81,20 @@ class GBoxButton(WidgetDrawer):
         self.bottom: str = (
             f"{self._bottom_left_char}{border}{self._bottom_right_char}"
         )
+        for text, line in zip(self._texts, (self.top, self.middle, self.bottom)):
+            text.set_text(line)
 
-        self.widget = urwid.Pile(
-            [
-                urwid.Text(self.top),
-                urwid.Text(self.middle),
-                urwid.Text(self.bottom),
-            ]
-        )
+    def set_label(self, label):
+        """Set the label, f.e. after a language switch"""
+        self._draw_label(label)
         self._label = label
         self.label = label
-        self.widget = urwid.AttrMap(self.widget, "buttn", "buttnf")
-        self._hidden_button: GButton = GButton(f"hidden {label}", on_press, user_data)
-        super().__init__(self.widget)
-        urwid.register_signal(self.__class__, ["click"])
-        urwid.connect_signal(self, "click", on_press)
+        self._hidden_button.set_label(f"hidden {label}")
+        self._invalidate()
+
+    def pack(self, size=None, focus=False):
+        """Return the columns and rows needed to draw the button"""
+        return len(self._label) + 6, 3
 
     def selectable(self):
         """Return if selectable or not"""
@@ -118,17 +132,19 @@ def create_application_buttons(app):
 
     def create_button(label, event, button_func, handle_event_func):
         res = cui.classes.button.GBoxButton(label, button_func)
+        catalog.register(res, label, "set_label")
         urwid.connect_signal(
             res,
             "click",
             lambda button: handle_event_func(event),
         )
-        res = (len(res.label) + 6, res)
+        # packed, so the column follows the label length on language switches
+        res = ("pack", res)
         return res
 
     def create_button_footer(button_ref: Any, which: str = "attrmap"):
         if not isinstance(button_ref, Tuple):
-            button_ref = (len(button_ref.label) + 6, button_ref)
+            button_ref = ("pack", button_ref)
         res = urwid.AttrMap(urwid.Columns([
             ("weight", 1, cui.classes.gwidgets.GText("")),
             ("weight", 1, urwid.Columns([
@@ -147,22 +163,25 @@ def create_application_buttons(app):
         return but, create_button_footer(but, which)
 
     # Login Dialog
-    app.view.login_window.login_header = urwid.AttrMap(
-        cui.classes.gwidgets.GText(("header", _("Login")), align="center"), "header"
-    )
-    app.view.button_store.user_edit = cui.classes.gwidgets.GEdit(
-        (_("Username: "),), edit_text=getuser(), edit_pos=0
-    )
-    app.view.button_store.pass_edit = cui.classes.gwidgets.GEdit(
-        _("Password: "), edit_text="", edit_pos=0, mask="*"
-    )
+    app.view.login_window.login_header = urwid.AttrMap(catalog.register(
+        cui.classes.gwidgets.GText(("header", N_("Login")), align="center"),
+        ("header", N_("Login"))
+    ), "header")
+    app.view.button_store.user_edit = catalog.register(cui.classes.gwidgets.GEdit(
+        (N_("Username: "),), edit_text=getuser(), edit_pos=0
+    ), N_("Username: "), "set_caption")
+    app.view.button_store.pass_edit = catalog.register(cui.classes.gwidgets.GEdit(
+        N_("Password: "), edit_text="", edit_pos=0, mask="*"
+    ), N_("Password: "), "set_caption")
     app.view.login_window.login_body = urwid.Pile(
         [
             app.view.button_store.user_edit,
             app.view.button_store.pass_edit,
         ]
     )
-    login_button = cui.classes.button.GBoxButton(_("Login"), app.check_login)
+    login_button = catalog.register(
+        cui.classes.button.GBoxButton(N_("Login"), app.check_login), N_("Login"), "set_label"
+    )
     urwid.connect_signal(
         login_button,
         "click",
@@ -174,37 +193,37 @@ def create_application_buttons(app):
     ]), "buttonbar")
     # Common OK Button
     app.view.button_store.ok_button, app.view.button_store.ok_button_footer = create_both(
-        _("OK"), "ok enter", "attr"
+        N_("OK"), "ok enter", "attr"
     )
     # Common Cancel Button
     app.view.button_store.cancel_button, app.view.button_store.cancel_button_footer = create_both(
-        _("Cancel"), "cancel enter", "grid"
+        N_("Cancel"), "cancel enter", "grid"
     )
     # Common close Button
     app.view.button_store.close_button, app.view.button_store.close_button_footer = create_both(
-        _("Close"), "close enter", "attr"
+        N_("Close"), "close enter", "attr"
     )
     # Common Add Button
     app.view.button_store.add_button, app.view.button_store.add_button_footer = create_both(
-        _("Add"), "add enter", "grid"
+        N_("Add"), "add enter", "grid"
     )
     # Common Edit Button
     app.view.button_store.edit_button, app.view.button_store.edit_button_footer = create_both(
-        _("Edit"), "edit enter", "attr"
+        N_("Edit"), "edit enter", "attr"
     )
     # Common Save Button
     app.view.button_store.save_button, app.view.button_store.save_button_footer = create_both(
-        _("Save"), "save enter", "grid"
+        N_("Save"), "save enter", "grid"
     )
     # Common Details Button
     app.view.button_store.details_button, app.view.button_store.details_button_footer = create_both(
-        _("Details"), "details enter", "grid"
+        N_("Details"), "details enter", "grid"
     )
     # Common Toggle Button
     app.view.button_store.toggle_button, app.view.button_store.toggle_button_footer = create_both(
-        _("Toggle"), "toggle enter", "grid"
+        N_("Toggle"), "toggle enter", "grid"
     )
     # Common Apply Button
     app.view.button_store.apply_button, app.view.button_store.apply_button_footer = create_both(
-        _("Apply"), "apply enter", "grid"
+        N_("Apply"), "apply enter", "grid"
     )
@@ -0,0 +1,127 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the collector sharing system facts between consoles"""
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+import urwid
+
+from cui.classes.worker import run_in_background
+
+# Time to live (in seconds) of the different kinds of collected facts
+TTL_TICK: float = 1.0
+TTL_SYSINFO: float = 5.0
+TTL_JOURNAL: float = 5.0
+TTL_CONFIG: float = 60.0
+TTL_STATIC: float = float("inf")
+
+
+class Collector:
+    """
+    Caches collected system facts for a limited time, so every console driven by
+    this process shares the same values instead of collecting them on its own.
+    """
+
+    def __init__(self, ttl: float = TTL_TICK):
+        self.ttl = ttl
+        self._cache: Dict[Hashable, Tuple[float, Any]] = {}
+        self._stale: Set[Hashable] = set()
+        self._pending: Dict[Hashable, List[Callable[[Any], Any]]] = {}
+
+    def get(self, key: Hashable, func: Callable, *args, ttl: Optional[float] = None) -> Any:
+        """
+        Return the cached value of key or collect it by calling func(*args).
+
+        :param key: The key the value is cached with.
+        :param func: The function collecting the value.
+        :param ttl: Time to live in seconds. The collectors default if None.
+        :return: The (maybe cached) value.
+        """
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached is not None and now - cached[0] < (self.ttl if ttl is None else ttl):
+            return cached[1]
+        value = func(*args)
+        self._cache[key] = (now, value)
+        return value
+
+    def get_async(
+            self, loop: urwid.MainLoop, key: Hashable, func: Callable,
+            callback: Callable[[Any], Any], *args, ttl: Optional[float] = None
+    ) -> Any:
+        """
+        Return the cached value of key, even if expired, and collect it by
+        calling func(*args) in the background if expired (or not cached).
+
+        :param loop: The main loop the callback is called on.
+        :param key: The key the value is cached with.
+        :param func: The function collecting the value.
+        :param callback: Is called with the fresh value once collected (not on errors).
+        :param ttl: Time to live in seconds. The collectors default if None.
+        :return: The cached value or None.
+        """
+        cached = self._cache.get(key)
+        if cached is not None and \
+                time.monotonic() - cached[0] < (self.ttl if ttl is None else ttl):
+            return cached[1]
+        if key in self._pending:
+            # collected already, f.e. for another console
+            self._pending[key].append(callback)
+        else:
+            self._pending[key] = [callback]
+
+            def done(value: Any, error: Exception):
+                callbacks = self._pending.pop(key, [])
+                if error is not None:
+                    return
+                self.put(key, value)
+                for pending in callbacks:
+                    pending(value)
+
+            run_in_background(loop, func, done, *args)
+        return None if cached is None else cached[1]
+
+    def renew_expired(self, key: Hashable, ttl: Optional[float] = None) -> bool:
+        """
+        Keep the expired cached value of key for another time to live, f.e.
+        while it is collected again in the background.
+
+        :return: True if an expired value has been renewed.
+        """
+        cached = self._cache.get(key)
+        if cached is None or time.monotonic() - cached[0] < (self.ttl if ttl is None else ttl):
+            return False
+        self._cache[key] = (time.monotonic(), cached[1])
+        return True
+
+    def put(self, key: Hashable, value: Any, stale: bool = False):
+        """
+        Cache value as collected right now.
+
+        :param key: The key the value is cached with.
+        :param value: The value to cache.
+        :param stale: The value is outdated (f.e. from a snapshot). It does not
+            expire, but is kept until the next put of a fresh value.
+        """
+        if stale:
+            self._stale.add(key)
+            self._cache[key] = (float("inf"), value)
+        else:
+            self._stale.discard(key)
+            self._cache[key] = (time.monotonic(), value)
+
+    def is_stale(self, key: Hashable) -> bool:
+        """Return if the cached value of key is outdated."""
+        return key in self._stale
+
+    def invalidate(self, key: Hashable = None):
+        """Drop the cached value of key or all values if key is None."""
+        if key is None:
+            self._cache.clear()
+            self._stale.clear()
+        else:
+            self._cache.pop(key, None)
+            self._stale.discard(key)
+
+
+collector: Collector = Collector()
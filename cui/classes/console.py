@@ -0,0 +1,147 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the console host driving several consoles in one process"""
+from typing import Any, Callable, Dict, List, Set
+
+import urwid
+
+
+class ConsoleEventLoop(urwid.EventLoop):
+    """
+    The view of one console on the shared event loop. Every callback of the
+    console (input, alarms, watched files and pipes, idle) is guarded, so
+    leaving the console (urwid.ExitMainLoop) calls on_exit instead of ending
+    the shared loop. close() drops all its callbacks still registered.
+    """
+
+    def __init__(self, event_loop: urwid.EventLoop, on_exit: Callable[[], None]):
+        self.event_loop = event_loop
+        self.on_exit = on_exit
+        self.closed: bool = False
+        self._alarms: Set[Any] = set()
+        self._watches: Set[Any] = set()
+        self._idles: Set[Any] = set()
+
+    def guard(self, callback: Callable) -> Callable:
+        """Return callback calling on_exit (once) instead of leaving the shared loop."""
+        def guarded(*args):
+            if self.closed:
+                return None
+            try:
+                return callback(*args)
+            except urwid.ExitMainLoop:
+                self.closed = True
+                self.event_loop.alarm(0, self.on_exit)
+                return True
+        return guarded
+
+    def alarm(self, seconds: float, callback: Callable[[], Any]) -> Any:
+        guarded = self.guard(callback)
+
+        def fired():
+            self._alarms.discard(handle)
+            guarded()
+
+        handle = self.event_loop.alarm(seconds, fired)
+        self._alarms.add(handle)
+        return handle
+
+    def remove_alarm(self, handle: Any) -> bool:
+        self._alarms.discard(handle)
+        return self.event_loop.remove_alarm(handle)
+
+    def watch_file(self, fd: int, callback: Callable[[], Any]) -> Any:
+        handle = self.event_loop.watch_file(fd, self.guard(callback))
+        self._watches.add(handle)
+        return handle
+
+    def remove_watch_file(self, handle: Any) -> bool:
+        self._watches.discard(handle)
+        return self.event_loop.remove_watch_file(handle)
+
+    def enter_idle(self, callback: Callable[[], Any]) -> Any:
+        handle = self.event_loop.enter_idle(self.guard(callback))
+        self._idles.add(handle)
+        return handle
+
+    def remove_enter_idle(self, handle: Any) -> bool:
+        self._idles.discard(handle)
+        return self.event_loop.remove_enter_idle(handle)
+
+    def run(self):
+        self.event_loop.run()
+
+    def __getattr__(self, name: str) -> Any:
+        # f.e. the _loop() of the SelectEventLoop
+        return getattr(self.event_loop, name)
+
+    def close(self):
+        """Drop all callbacks of the console, f.e. when it is restarted."""
+        self.closed = True
+        for handle in list(self._alarms):
+            self.event_loop.remove_alarm(handle)
+        for handle in list(self._watches):
+            self.event_loop.remove_watch_file(handle)
+        for handle in list(self._idles):
+            self.event_loop.remove_enter_idle(handle)
+        self._alarms.clear()
+        self._watches.clear()
+        self._idles.clear()
+
+
+def shared_event_loop(event_loop: urwid.EventLoop) -> urwid.EventLoop:
+    """Return the event loop all consoles share (event_loop itself if there is no host)."""
+    if isinstance(event_loop, ConsoleEventLoop):
+        return event_loop.event_loop
+    return event_loop
+
+
+class ConsoleHost:
+    """
+    Drives the console UI on several virtual consoles (f.e. tty1, tty2) from a
+    single process. Every console gets its own screen and main loop widget tree,
+    while all of them share one event loop and the collected system facts.
+    """
+
+    def __init__(self, ttys: List[str], factory: Callable[[str, urwid.EventLoop], Any]):
+        """
+        :param ttys: The console devices to drive, f.e. ["tty1", "tty2"].
+        :param factory: Creates the application for a tty on the shared event loop.
+        """
+        self.ttys = ttys
+        self.factory = factory
+        self.event_loop = urwid.SelectEventLoop()
+        self.apps: Dict[str, Any] = {}
+        self.event_loops: Dict[str, ConsoleEventLoop] = {}
+
+    def _attach(self, tty: str):
+        """Create the application on tty and hook it into the shared event loop."""
+        event_loop = ConsoleEventLoop(self.event_loop, lambda: self.restart(tty))
+        app = self.factory(tty, event_loop)
+        loop: urwid.MainLoop = app.control.app_control.loop
+        loop.process_input = event_loop.guard(loop.process_input)
+        app.prepare_mainscreen()
+        loop.widget = app.control.app_control.body
+        loop.start()
+        self.apps[tty] = app
+        self.event_loops[tty] = event_loop
+
+    def restart(self, tty: str):
+        """Restart the console UI on tty, like getty does for a single console."""
+        app = self.apps.pop(tty, None)
+        if app is not None:
+            app.shutdown()
+        event_loop = self.event_loops.pop(tty, None)
+        if event_loop is not None:
+            event_loop.close()
+        self._attach(tty)
+
+    def run(self):
+        """Start all consoles and run the shared event loop."""
+        for tty in self.ttys:
+            self._attach(tty)
+        try:
+            self.event_loop.run()
+        finally:
+            for app in self.apps.values():
+                app.shutdown()
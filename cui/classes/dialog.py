@@ -0,0 +1,37 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the pool of the reusable dialog widgets"""
+from typing import Any, Callable, Dict, Hashable
+
+
+class DialogPool:
+    """
+    Keeps the widgets of the dialogs of one console. Each kind of dialog (f.e.
+    the message box or the password dialog) is built once and reopened with
+    new texts, size and cleared edits instead of building its LineBox, Frame
+    and Overlay stack again on every open.
+    """
+
+    def __init__(self):
+        self.builds: int = 0
+        self.reuses: int = 0
+        self._widgets: Dict[Hashable, Any] = {}
+
+    def get(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """
+        Return the widgets kept as key.
+
+        :param key: The kind of the dialog (or of a part of it).
+        :param build: Builds the widgets on the first call.
+        """
+        widgets = self._widgets.get(key)
+        if widgets is None:
+            self.builds += 1
+            widgets = self._widgets[key] = build()
+        else:
+            self.reuses += 1
+        return widgets
+
+    def clear(self):
+        """Forget all widgets, the next opens build them again."""
+        self._widgets.clear()
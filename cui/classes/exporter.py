@@ -0,0 +1,239 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the exporter of health and performance metrics"""
+import datetime
+import os
+import socket
+import time
+import weakref
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import psutil
+import urwid
+from systemd import journal
+
+import cui.util
+from cui.classes.application import SETUP_STATE_NAMES, setup_state
+from cui.classes.collector import collector
+from cui.classes.console import shared_event_loop
+from cui.classes.runner import runner
+from cui.classes.stats import get_canvas_cache_hit_rate
+from cui.classes.worker import PipeWatcher, run_in_background
+
+# Minimum seconds between two exports
+EXPORT_INTERVAL: float = 15.0
+# Journal errors are counted within this number of seconds
+LOG_ERROR_WINDOW: int = 300
+PROBED_PORTS: Tuple[int, ...] = (22, 8080)
+PREFIX: str = "grommunio_cui"
+
+
+def count_journal_errors(unitname: str, seconds: int = LOG_ERROR_WINDOW) -> int:
+    """Return the number of journal entries of unitname with error priority or worse."""
+    reader = journal.Reader()
+    reader.this_boot()
+    reader.log_level(journal.LOG_ERR)
+    reader.add_match(_SYSTEMD_UNIT=unitname)
+    reader.seek_realtime(datetime.datetime.now() - datetime.timedelta(seconds=seconds))
+    return sum(1 for _ in reader)
+
+
+def _escape(value: Any) -> str:
+    """Return value escaped as Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsWriter:
+    """Collects the lines of one export in the Prometheus text format."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def add(self, name: str, helptext: str, samples: List[Tuple[Dict[str, Any], float]],
+            kind: str = "gauge"):
+        """Add metric name with its samples of (labels, value)."""
+        self.lines.append(f"# HELP {PREFIX}_{name} {helptext}")
+        self.lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            self.lines.append(
+                f"{PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                else f"{PREFIX}_{name} {value}"
+            )
+
+    def get_text(self) -> str:
+        """Return the complete export."""
+        return "\n".join(self.lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Exports the health values the CUI computes anyway plus its own performance
+    counters as Prometheus textfile (for the textfile collector of
+    node_exporter) and/or on a Unix socket. Exports are triggered by an alarm
+    of every console, rate-limited and collected in the background. The socket
+    and the collection are watched on the shared event loop, so they survive
+    the restart of the console that started them.
+    """
+
+    def __init__(self):
+        self.textfile: Optional[str] = None
+        self.socket_path: Optional[str] = None
+        self.interval: float = EXPORT_INTERVAL
+        self.text: str = ""
+        self._apps: "weakref.WeakValueDictionary[str, Any]" = weakref.WeakValueDictionary()
+        self._last: float = 0.0
+        self._busy: bool = False
+        self._server: Optional[socket.socket] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Return if any export target is configured."""
+        return bool(self.textfile or self.socket_path)
+
+    def configure(self, textfile: str = None, socket_path: str = None,
+                  interval: float = EXPORT_INTERVAL):
+        """
+        Configure the export targets.
+
+        :param textfile: The Prometheus textfile to write (atomically).
+        :param socket_path: The Unix socket to serve the metrics on.
+        :param interval: Minimum seconds between two exports.
+        """
+        self.textfile = textfile
+        self.socket_path = socket_path
+        self.interval = interval
+
+    def update(self, app):
+        """Export the metrics (of all consoles) if the interval has passed."""
+        tty = app.view.gscreen.tty or "console"
+        self._apps[tty] = app
+        event_loop = shared_event_loop(app.control.app_control.loop.event_loop)
+        if self.socket_path and self._server is None:
+            self._serve(event_loop)
+        now = time.monotonic()
+        if self._busy or now - self._last < self.interval:
+            return
+        self._busy = True
+        self._last = now
+        run_in_background(
+            PipeWatcher(event_loop), self._collect, self._collected, self._collect_in_loop()
+        )
+
+    def _collect_in_loop(self) -> Dict[str, Any]:
+        """Collect the values only available on the urwid loop (cheap)."""
+        units: Dict[str, str] = {}
+        consoles: Dict[str, Dict[str, float]] = {}
+        for tty, app in list(self._apps.items()):
+            consoles[tty] = dict(app.control.app_control.frame_stats.durations)
+            for name, unit in app.control.log_control.log_units.items():
+                if unit.get("source"):
+                    units[name] = unit["source"]
+        return {
+            "setup_state": setup_state.check_setup_state(),
+            "setup_states": setup_state.get_setup_states(),
+            "units": units,
+            "consoles": consoles,
+            "canvas_cache_hit_rate": get_canvas_cache_hit_rate(),
+            "commands": {
+                name: (metric.calls, metric.failures, metric.timeouts, metric.wall_time)
+                for name, metric in list(runner.metrics.items())
+            },
+        }
+
+    def _collect(self, values: Dict[str, Any]) -> str:
+        """Collect the remaining values and write the export. Runs in a thread."""
+        metrics = MetricsWriter()
+        metrics.add("setup_state", "Combined setup state bits (0 = completely set up).",
+                    [({}, values["setup_state"])])
+        metrics.add("setup_done", "Setup state of the single items (1 = done).",
+                    [({"item": name[3:].replace("_upset", "")},
+                      int(values["setup_states"].get(name, False)))
+                     for name in SETUP_STATE_NAMES])
+        load = collector.get("load", cui.util.get_load)
+        metrics.add("load", "Average system load.",
+                    [({"minutes": minutes}, load[i]) for i, minutes in enumerate((1, 5, 15))])
+        memory = psutil.virtual_memory()
+        metrics.add("memory_bytes", "System memory.",
+                    [({"kind": "total"}, memory.total), ({"kind": "used"}, memory.used),
+                     ({"kind": "available"}, memory.available)])
+        metrics.add("port_open", "Result of the local port probes (1 = open).",
+                    [({"port": port}, int(cui.util.check_socket("127.0.0.1", port)))
+                     for port in PROBED_PORTS])
+        metrics.add("log_errors", f"Journal errors of the log units in the last "
+                                  f"{LOG_ERROR_WINDOW} seconds.",
+                    [({"unit": name}, collector.get(("journal-errors", source),
+                                                    count_journal_errors, source, ttl=60))
+                     for name, source in values["units"].items()])
+        for key, helptext in (("render", "Duration of the last render."),
+                              ("event", "Duration of the last handle_event."),
+                              ("tick", "Duration of the last clock tick.")):
+            metrics.add(f"{key}_seconds", helptext,
+                        [({"console": tty}, durations[key])
+                         for tty, durations in values["consoles"].items()])
+        metrics.add("canvas_cache_hit_ratio", "Hit rate of the urwid canvas cache.",
+                    [({}, values["canvas_cache_hit_rate"] / 100)])
+        commands = values["commands"]
+        for idx, (key, helptext) in enumerate((("command_calls", "Started commands."),
+                                               ("command_failures", "Failed commands."),
+                                               ("command_timeouts", "Timed out commands."),
+                                               ("command_seconds", "Wall time of commands."))):
+            metrics.add(f"{key}_total", helptext,
+                        [({"command": name}, counts[idx]) for name, counts in commands.items()],
+                        kind="counter")
+        text = metrics.get_text()
+        if self.textfile:
+            self._write_textfile(text)
+        return text
+
+    def _write_textfile(self, text: str):
+        """Write the textfile atomically, so the collector never reads a partial one."""
+        target = Path(self.textfile)
+        tmp = target.with_name(f".{target.name}.{os.getpid()}")
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, target)
+        except OSError:
+            if tmp.exists():
+                tmp.unlink()
+
+    def _collected(self, text: str, error: Exception):
+        """Keep the collected export for the socket (on the urwid loop)."""
+        self._busy = False
+        if error is None:
+            self.text = text
+
+    def _serve(self, event_loop: urwid.EventLoop):
+        """Serve the last export on the Unix socket."""
+        path = Path(self.socket_path)
+        try:
+            path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            if path.is_socket():
+                path.unlink()
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(str(path))
+            server.listen(4)
+            server.setblocking(False)
+        except OSError:
+            self.socket_path = None
+            return
+        self._server = server
+        event_loop.watch_file(server.fileno(), self._accept)
+
+    def _accept(self):
+        """Send the last export to a connecting client."""
+        try:
+            conn, _ = self._server.accept()
+        except OSError:
+            return
+        with conn:
+            conn.settimeout(1)
+            try:
+                conn.sendall(self.text.encode())
+            except OSError:
+                pass
+
+
+exporter: MetricsExporter = MetricsExporter()
@@ -1,9 +1,20 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 # SPDX-FileCopyrightText: 2021 grommunio GmbH
 """The gwidgets module contains all grommunio widgets"""
-from typing import Any, Tuple
+from typing import Any, List, Tuple
 
 import urwid
+from urwid.canvas import apply_text_layout
+
+from cui.classes.layout import layout_cache
+
+
+class GCachedText(urwid.Text):
+    """The urwid Text widget sharing its wrapped layouts through the layout cache"""
+
+    def get_line_translation(self, maxcol: int, ta: Tuple[Any, Any] = None) -> List[Any]:
+        text = ta[0] if ta is not None else self.get_text()[0]
+        return layout_cache.get(self, text, maxcol)
 
 
 class GText(urwid.WidgetWrap):
@@ -21,7 +32,7 @@ class GText(urwid.WidgetWrap):
         }
         for (i, key) in enumerate(params.keys()):
             params[key] = kwargs.get(key, args[i] if len(args) > i else params.get(key))
-        self._t = urwid.Text(markup, params["align"], params["wrap"], params["layout"])
+        self._t = GCachedText(markup, params["align"], params["wrap"], params["layout"])
         self._p = urwid.Padding(self._t, left=params["left"], right=params["right"])
         super().__init__(self._p)
         # self._w = t
@@ -60,6 +71,47 @@ class GText(urwid.WidgetWrap):
         return self._selectable
 
 
+class GLine(GCachedText):
+    """
+    A read-only line of text with the margins of GText, f.e. in the log viewer.
+    It is one widget instead of the three of a GText (WidgetWrap, Padding and
+    Text), which counts for contents of thousands of lines. Its rows can be
+    estimated without wrapping it, so a Scrollable only wraps the visible lines.
+    """
+    _sizing = frozenset([urwid.FLOW])
+    left: int = 2
+    right: int = 2
+
+    def _get_text_width(self, maxcol: int) -> int:
+        """Return the columns left for the text between the margins."""
+        return max(1, maxcol - self.left - self.right)
+
+    def rows(self, size: Tuple[int], focus: bool = False) -> int:
+        (maxcol,) = size
+        return len(self.get_line_translation(self._get_text_width(maxcol)))
+
+    def estimate_rows(self, size: Tuple[int]) -> int:
+        """Return the rows from the cached layout or estimated from the text length."""
+        (maxcol,) = size
+        width = self._get_text_width(maxcol)
+        text = self.get_text()[0]
+        layout = layout_cache.peek(self, text, width)
+        if layout is not None:
+            return len(layout)
+        newline = "\n" if isinstance(text, str) else b"\n"
+        return sum(max(1, -(-len(line) // width)) for line in text.split(newline))
+
+    def render(self, size: Tuple[int], focus: bool = False) -> urwid.Canvas:
+        (maxcol,) = size
+        width = self._get_text_width(maxcol)
+        text, attr = self.get_text()
+        canv = urwid.CompositeCanvas(
+            apply_text_layout(text, attr, self.get_line_translation(width, (text, attr)), width)
+        )
+        canv.pad_trim_left_right(self.left, maxcol - width - self.left)
+        return canv
+
+
 class GEdit(urwid.WidgetWrap):
     """The grommunio Edit fiel^d widget"""
     _selectable = True
@@ -150,6 +202,9 @@ class GEdit(urwid.WidgetWrap):
         # p = urwid.Padding(col, left=2, right=2)
         super().__init__(col)
         self.edit_widget = edit_widget
+        self.caption_widget = txt
+        # caption column width is derived from the caption length (see wrap_widget)
+        self._caption_fit = not isinstance(caption_object, tuple) or len(caption_object) == 1
         # self._w = txt
 
     def set_text(self, text):
@@ -157,6 +212,16 @@ class GEdit(urwid.WidgetWrap):
         # self._wrapped_widget.base_widget.base_widget.set_text(text)
         self.edit_widget.set_text(text)
 
+    def set_caption(self, caption):
+        """Set the caption text, f.e. after a language switch"""
+        if isinstance(caption, tuple):
+            caption = caption[len(caption) - 1]
+        self.caption_widget.set_text(caption)
+        if self._caption_fit:
+            p_t = self._w.contents[0][0]
+            width = len(self.caption_widget.text) + p_t.left + p_t.right
+            self._w.contents[0] = (p_t, self._w.options(urwid.GIVEN, width))
+
     def get_edit_text(self):
         """Return the edit widget's edit_text"""
         return self.edit_widget.get_edit_text()
@@ -2,35 +2,106 @@
 # SPDX-FileCopyrightText: 2022 grommunio GmbH
 """The module contains the handling code of grommunio-cui"""
 import os
-import subprocess
-from pathlib import Path
-from typing import Any, Tuple
+import shlex
+from typing import Any, Callable, Tuple
 from getpass import getuser
 
-import requests
 import urwid
 
 import cui.classes
-from cui.classes.application import setup_state
 from cui.classes.menu import MenuItem
 from cui.symbol import LOG_VIEWER, MAIN, MESSAGE_BOX, INPUT_BOX, TERMINAL, PASSWORD, LOGIN, \
     REBOOT, SHUTDOWN, MAIN_MENU, UNSUPPORTED, ADMIN_WEB_PW, TIMESYNCD, REPO_SELECTION, \
-    KEYBOARD_SWITCH, PRODUCTION
+    KEYBOARD_SWITCH, PRODUCTION, PROFILER, SYSTEM_UPDATE, REPO_UPDATE
 from cui import util, parameter
 from cui.classes.model import ApplicationModel
 from cui.util import _
 from cui.classes.interface import WidgetDrawer
 from cui.classes.button import GButton
 from cui.classes.gwidgets import GText
+from cui.classes.session import Session
+from cui.classes.profiler import profiled
+from cui.classes.keymap import Keymap
+from cui.classes.translation import N_
+from cui.classes.stats import timed
+from cui.classes.repo import get_check_url, get_changed_repos, read_repo_files, repo_checker, \
+    RepoCheck, RepoUpdate, KEY_CACHE_FILE, KEY_URL
+from cui.classes.worker import run_in_background
+from cui.classes.runner import runner, CommandResult
+from cui.classes.zypper import update_job, UpdateJob
 
 _ = cui.util.init_localization()
 
+# Events handled at most per input (incl. follow-up events), stops event loops
+MAX_EVENTS_PER_INPUT: int = 16
+
 
 class ApplicationHandler(ApplicationModel):
     """Add the handler functionality in this class"""
+    def __init__(
+            self, tty: str = None, event_loop: urwid.EventLoop = None, count_output: bool = False
+    ):
+        super().__init__(tty, event_loop, count_output)
+        self.control.app_control.keymap = self._create_keymap()
+        self.control.menu_control.main_menu_actions = {
+            1: (self._menu_language, None),
+            2: (self._open_change_password, None),
+            3: (self._run_yast_module, "lan"),
+            4: (self._run_yast_module, "timezone"),
+            5: (self._open_timesyncd_conf, None),
+            6: (self._open_repo_conf, None),
+            7: (self._run_update, None),
+            8: (self._open_setup_wizard, None),
+            9: (self._open_reset_aapi_pw, None),
+            10: (self._open_terminal, None),
+            11: (self._reboot_confirm, None),
+            12: (self._shutdown_confirm, None),
+            13: (self._exit_main_loop, None),
+        }
+
+    def _create_keymap(self) -> Keymap:
+        """Create the keymap of all windows and the global key bindings."""
+        keymap = Keymap()
+        for window, handler in {
+            MAIN: self._key_ev_main,
+            MESSAGE_BOX: self._key_ev_mbox,
+            INPUT_BOX: self._key_ev_ibox,
+            TERMINAL: self._key_ev_term,
+            PASSWORD: self._key_ev_pass,
+            LOGIN: self._key_ev_login,
+            REBOOT: self._key_ev_reboot,
+            SHUTDOWN: self._key_ev_shutdown,
+            MAIN_MENU: self._key_ev_mainmenu,
+            LOG_VIEWER: self._key_ev_logview,
+            UNSUPPORTED: self._key_ev_unsupp,
+            ADMIN_WEB_PW: self._key_ev_aapi,
+            TIMESYNCD: self._key_ev_timesyncd,
+            REPO_SELECTION: self._key_ev_repo_selection,
+            KEYBOARD_SWITCH: self._key_ev_kbd_switch,
+            SYSTEM_UPDATE: self._key_ev_update,
+            REPO_UPDATE: self._key_ev_repo_update,
+        }.items():
+            keymap.set_window_handler(window, handler)
+        for name, func, description, keys in (
+                ("exit", self._exit_main_loop, N_("Exit"), ("f10", "Q")),
+                ("main_menu", self._open_authorized_main_menu, N_("Main menu"), ("f4",)),
+                ("colormode", self._switch_next_colormode, N_("Switch color mode"), ("f1", "c")),
+                ("keyboard", self._open_keyboard_selection_menu, N_("Keyboard layout"), ("f5",)),
+                ("log_viewer", self._open_log_viewer_anytime, N_("Log viewer"),
+                 ("ctrl f1", "H", "h", "L", "l")),
+                ("help", self._open_keymap_help, N_("Key bindings"), ("f12",)),
+                ("session", self._open_last_session, N_("Running tool"), ("f6",)),
+        ):
+            keymap.add_action(name, func, description)
+            for key in keys:
+                keymap.bind(key, name)
+        keymap.load()
+        return keymap
+
     def handle_event(self, event: Any):
         """
-        Handles user input to the console UI.
+        Handles user input to the console UI. Events coming in while another
+        one is handled (f.e. from buttons) are queued and handled afterwards.
 
             :param event: A mouse or keyboard input sequence. While the mouse
                 event has the form ('mouse press or release', button, column,
@@ -38,11 +109,34 @@ class ApplicationHandler(ApplicationModel):
                 the represented value like 'enter', 'up', 'down', etc.
             :type: Any
         """
-        self.control.app_control.current_event = event
-        if isinstance(event, str):
-            self._handle_key_event(event)
-        elif isinstance(event, tuple):
-            self._handle_mouse_event(event)
+        self.post_event(event)
+        if not self.control.app_control.handling_events:
+            self._handle_queued_events()
+
+    def post_event(self, event: Any):
+        """Queue a follow-up event, it is handled after the current one."""
+        self.control.app_control.events.append(event)
+
+    @timed("event")
+    @profiled
+    def _handle_queued_events(self):
+        """Handle the queued events one after another and print once."""
+        events = self.control.app_control.events
+        count = 0
+        self.control.app_control.handling_events = True
+        try:
+            while events and count < MAX_EVENTS_PER_INPUT:
+                event = events.popleft()
+                count += 1
+                self.control.app_control.current_event = event
+                if isinstance(event, str):
+                    self._handle_key_event(event)
+                elif isinstance(event, tuple):
+                    self._handle_mouse_event(event)
+        finally:
+            events.clear()
+            self.control.app_control.handling_events = False
+        self.control.app_control.frame_stats.add_input_events(count)
         self.print(self.control.app_control.current_bottom_info)
 
     def _handle_key_event(self, event: Any):
@@ -52,28 +146,7 @@ class ApplicationHandler(ApplicationModel):
         if self.control.log_control.log_finished and \
                 self.control.app_control.current_window != LOG_VIEWER:
             self.control.log_control.log_finished = False
-        (func, var) = {
-            MAIN: (self._key_ev_main, key),
-            MESSAGE_BOX: (self._key_ev_mbox, key),
-            INPUT_BOX: (self._key_ev_ibox, key),
-            TERMINAL: (self._key_ev_term, key),
-            PASSWORD: (self._key_ev_pass, key),
-            LOGIN: (self._key_ev_login, key),
-            REBOOT: (self._key_ev_reboot, key),
-            SHUTDOWN: (self._key_ev_shutdown, key),
-            MAIN_MENU: (self._key_ev_mainmenu, key),
-            LOG_VIEWER: (self._key_ev_logview, key),
-            UNSUPPORTED: (self._key_ev_unsupp, key),
-            ADMIN_WEB_PW: (self._key_ev_aapi, key),
-            TIMESYNCD: (self._key_ev_timesyncd, key),
-            REPO_SELECTION: (self._key_ev_repo_selection, key),
-            KEYBOARD_SWITCH: (self._key_ev_kbd_switch, key),
-        }.get(self.control.app_control.current_window)
-        if var:
-            func(var)
-        else:
-            func()
-        self._key_ev_anytime(key)
+        self.control.app_control.keymap.dispatch(self.control.app_control.current_window, key)
 
     def _key_ev_main(self, key):
         """Handle event on mainframe."""
@@ -104,6 +177,7 @@ class ApplicationHandler(ApplicationModel):
     def _key_ev_mbox(self, key):
         """Handle event on message box."""
         if key.endswith("enter") or key == "esc":
+            self._cancel_repo_check()
             if self.control.app_control.message_box_caller not in \
                     (self.control.app_control.current_window, MESSAGE_BOX):
                 self.control.app_control.current_window = \
@@ -112,15 +186,11 @@ class ApplicationHandler(ApplicationModel):
             if self.view.gscreen.old_layout:
                 self.view.gscreen.layout = self.view.gscreen.old_layout
             self._reset_layout()
+            # Let the caller handle the key as well (unless still in a message box)
             if self.control.app_control.current_window not in [
-                LOGIN, MAIN_MENU, TIMESYNCD, REPO_SELECTION
+                LOGIN, MAIN_MENU, TIMESYNCD, REPO_SELECTION, MESSAGE_BOX
             ]:
-                if self.control.app_control.key_counter.get(key, 0) < 10:
-                    self.control.app_control.key_counter[key] = \
-                        self.control.app_control.key_counter.get(key, 0) + 1
-                    self.handle_event(key)
-                else:
-                    self.control.app_control.key_counter[key] = 0
+                self.post_event(key)
 
     def _key_ev_ibox(self, key):
         """Handle event on input box."""
@@ -140,14 +210,34 @@ class ApplicationHandler(ApplicationModel):
             if self.view.gscreen.old_layout:
                 self.view.gscreen.layout = self.view.gscreen.old_layout
             self._reset_layout()
-            self.handle_event(key)
+            self.post_event(key)
 
     def _key_ev_term(self, key):
-        """Handle event on terminal."""
-        self._handle_standard_tab_behaviour(key)
-        if key == "f10":
-            raise urwid.ExitMainLoop()
-        self._open_main_menu()
+        """Handle event on terminal (the keys its tool does not get)."""
+        sessions = self.control.app_control.sessions
+        session = sessions.get_last()
+        if session is None:
+            self._return_from_session()
+        elif key in ("page up", "page down"):
+            # the terminal of a finished tool passes all keys
+            session.scroll(up=key == "page up")
+        elif key == "esc" or (key == "enter" and not session.running):
+            if not session.running:
+                sessions.close(session.name)
+            self._return_from_session()
+
+    def _key_ev_update(self, key):
+        """Handle event on the system update dialog (hiding it, the update keeps running)."""
+        if key.endswith("enter") or key == "esc":
+            self._open_main_menu()
+            if update_job.running:
+                self.print(_("The update continues in the background, select Update to see it."))
+
+    def _key_ev_repo_update(self, key):
+        """Handle event on the repository update progress (hiding it, the update keeps running)."""
+        if key == "esc":
+            self._open_main_menu()
+            self.print(_("The repository selection is applied in the background ..."))
 
     def _key_ev_pass(self, key):
         """Handle event on system password reset menu."""
@@ -166,14 +256,11 @@ class ApplicationHandler(ApplicationModel):
             pw2 = self.control.app_control.loop.widget.top_w.base_widget.body.base_widget[
                 4
             ].edit_text
-            if pw1 == pw2:
-                res = util.reset_system_passwd(pw1)
-            else:
-                res = 2
-                success_msg = _("failed due to mismatching password values")
-            if not res:
-                success_msg = _("failed")
             self._open_main_menu()
+            if pw1 == pw2:
+                self._reset_password(util.reset_system_passwd, pw1, _("System password reset"))
+                return
+            success_msg = _("failed due to mismatching password values")
         elif button_type in [_("Cancel"), _("cancel")] or key.lower() in ["esc"]:
             success_msg = _("aborted")
             self._open_main_menu()
@@ -187,6 +274,21 @@ class ApplicationHandler(ApplicationModel):
                 size=parameter.Size(height=10)
             )
 
+    def _reset_password(self, reset: Callable[[str], bool], password: str, title: str):
+        """Reset a password by reset(password) in the background and report the outcome."""
+        self.print(_("Changing the password ..."))
+
+        def done(res: bool, error: Exception):
+            success_msg = _("was successful") if error is None and res else _("failed")
+            msg = f"{title} {success_msg}!"
+            if self.control.app_control.current_window != MAIN_MENU:
+                # the user has gone on meanwhile
+                self.print(msg)
+                return
+            self.message_box(parameter.MsgBoxParams(msg, title), size=parameter.Size(height=10))
+
+        run_in_background(self.control.app_control.loop, reset, done, password)
+
     def _key_ev_login(self, key):
         """Handle event on login menu."""
         self._handle_standard_tab_behaviour(key)
@@ -202,8 +304,8 @@ class ApplicationHandler(ApplicationModel):
             "ok"
         ):
             self.control.app_control.loop.stop()
-            self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.old_termios)
-            os.system("reboot")
+            self.view.gscreen.set_signal_keys(self.view.gscreen.old_termios)
+            runner.run_interactive(["reboot"], self.view.gscreen.tty_files)
             raise urwid.ExitMainLoop()
         self.control.app_control.current_window = MAIN_MENU
 
@@ -214,50 +316,46 @@ class ApplicationHandler(ApplicationModel):
             "ok"
         ):
             self.control.app_control.loop.stop()
-            self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.old_termios)
-            os.system("poweroff")
+            self.view.gscreen.set_signal_keys(self.view.gscreen.old_termios)
+            runner.run_interactive(["poweroff"], self.view.gscreen.tty_files)
             raise urwid.ExitMainLoop()
         self.control.app_control.current_window = MAIN_MENU
 
-    def _key_ev_mainmenu(self, key):
-        """Handle event on main menu."""
-        def menu_language():
-            pre = cui.classes.parser.ConfigParser(infile='/etc/locale.conf')
-            self._run_yast_module("language")
-            post = cui.classes.parser.ConfigParser(infile='/etc/locale.conf')
+    def _menu_language(self):
+        """Run the language module of yast2 and switch to the selected language."""
+        pre = cui.classes.parser.ConfigParser(infile=util.root_path('/etc/locale.conf'))
+
+        def closed(_session: Session):
+            # yast runs in an embedded terminal, the language is set when it has exited
+            post = cui.classes.parser.ConfigParser(infile=util.root_path('/etc/locale.conf'))
             if pre != post:
-                util._ = util.restart_gui()
+                util.switch_language()
+                self.view.header.refresh_header()
+                self.view.top_main_menu.refresh_main_menu()
 
-        def exit_main_loop():
-            raise urwid.ExitMainLoop()
+        self._run_yast_module("language", closed)
+
+    @staticmethod
+    def _exit_main_loop():
+        """Leave the console UI."""
+        raise urwid.ExitMainLoop()
 
+    def _key_ev_mainmenu(self, key):
+        """Handle event on main menu."""
         menu_selected: int = self._handle_standard_menu_behaviour(
             self.view.top_main_menu.main_menu_list,
             key,
             self.view.top_main_menu.main_menu.base_widget.body[1]
         )
         if key.endswith("enter") or key in range(ord("1"), ord("9") + 1):
-            (func, val) = {
-                1: (menu_language, None),
-                2: (self._open_change_password, None),
-                3: (self._run_yast_module, "lan"),
-                4: (self._run_yast_module, "timezone"),
-                5: (self._open_timesyncd_conf, None),
-                6: (self._open_repo_conf, None),
-                7: (self._run_update, None),
-                8: (self._open_setup_wizard, None),
-                9: (self._open_reset_aapi_pw, None),
-                10: (self._open_terminal, None),
-                11: (self._reboot_confirm, None),
-                12: (self._shutdown_confirm, None),
-                13: (exit_main_loop, None),
-            }.get(menu_selected)
+            (func, val) = self.control.menu_control.main_menu_actions.get(menu_selected)
             if val:
                 func(val)
             else:
                 func()
         elif key == "esc":
-            setup_state.set_setup_states()
+            # the setup states are checked in the background, repainting the main screen
+            self._refresh_main_screen_async()
             self._open_mainframe()
 
     def _key_ev_logview(self, key):
@@ -289,18 +387,39 @@ class ApplicationHandler(ApplicationModel):
                 self._get_log_unit_by_id(self.control.log_control.current_log_unit),
                 self.control.log_control.log_line_count,
             )
-        elif (
-                self.control.log_control.hidden_pos < len(UNSUPPORTED)
-                and key == UNSUPPORTED.lower()[self.control.log_control.hidden_pos]
+        elif any(
+                word.lower().startswith(self.control.log_control.hidden_input + key)
+                for word in (UNSUPPORTED, PROFILER)
         ):
             self.control.log_control.hidden_input += key
             self.control.log_control.hidden_pos += 1
             if self.control.log_control.hidden_input == UNSUPPORTED.lower():
                 self._open_log_viewer("syslog")
+            elif self.control.log_control.hidden_input == PROFILER.lower():
+                self.control.log_control.hidden_input = ""
+                self.control.log_control.hidden_pos = 0
+                self.toggle_profiler()
         else:
             self.control.log_control.hidden_input = ""
             self.control.log_control.hidden_pos = 0
 
+    def toggle_profiler(self):
+        """Start the profiler or stop it and show its top-N summary."""
+        profiler = self.control.app_control.profiler
+        if not profiler.active:
+            profiler.start()
+            self.control.app_control.current_bottom_info = _("Profiling ...")
+            return
+        self.control.app_control.current_bottom_info = _("Idle")
+        path, summary = profiler.stop(self.view.gscreen.tty)
+        self.message_box(
+            parameter.MsgBoxParams(
+                "\n".join([_("Profile written to {%s}") % path, ""] + summary),
+                _("Profiler"),
+            ),
+            size=parameter.Size(100, len(summary) + 9)
+        )
+
     def _key_ev_unsupp(self, key):
         """Handle event on unsupported."""
         if key in ["ctrl d", "esc", "ctrl f1", "H", "h", "l", "L"]:
@@ -309,24 +428,33 @@ class ApplicationHandler(ApplicationModel):
             self.control.log_control.log_finished = True
             self._reset_layout()
 
-    def _key_ev_anytime(self, key):
-        """Handle event at anytime."""
-        if key in ["f10", "Q"]:
-            raise urwid.ExitMainLoop()
-        if key == "f4" and len(self.view.header.get_authorized_options()) > 0:
+    def _open_authorized_main_menu(self):
+        """Open the main menu if the user is authorized to use it."""
+        if len(self.view.header.get_authorized_options()) > 0:
             self._open_main_menu()
-        elif key in ("f1", "c"):
-            self._switch_next_colormode()
-        elif key == "f5":
-            self._open_keyboard_selection_menu()
-        elif (
-                key in ["ctrl f1", "H", "h", "L", "l"]
-                and self.control.app_control.current_window != LOG_VIEWER
+
+    def _open_log_viewer_anytime(self):
+        """Open the log viewer unless it is open or has just been closed."""
+        if (
+                self.control.app_control.current_window != LOG_VIEWER
                 and self.control.app_control.current_window != UNSUPPORTED
                 and not self.control.log_control.log_finished
         ):
             self._open_log_viewer("gromox-http", self.control.log_control.log_line_count)
 
+    def _open_keymap_help(self):
+        """Show the key bindings usable on the current window."""
+        bindings = self.control.app_control.keymap.get_help(
+            self.control.app_control.current_window
+        )
+        self.message_box(
+            parameter.MsgBoxParams(
+                "\n".join(f"{keys}: {_(description)}" for keys, description in bindings),
+                _("Key bindings"),
+            ),
+            size=parameter.Size(60, len(bindings) + 8)
+        )
+
     def _key_ev_aapi(self, key):
         """Handle event on admin api password reset menu."""
         self._handle_standard_tab_behaviour(key)
@@ -344,14 +472,11 @@ class ApplicationHandler(ApplicationModel):
             pw2 = self.control.app_control.loop.widget.top_w.base_widget.body.base_widget[
                 4
             ].edit_text
-            if pw1 == pw2:
-                res = util.reset_aapi_passwd(pw1)
-            else:
-                res = 2
-                success_msg = _("failed due to mismatching password values")
-            if not res:
-                success_msg = _("failed")
             self._open_main_menu()
+            if pw1 == pw2:
+                self._reset_password(util.reset_aapi_passwd, pw1, _("Admin password reset"))
+                return
+            success_msg = _("failed due to mismatching password values")
         elif button_type in [_("Cancel"), _("cancel")] or key.lower() in ["esc"]:
             success_msg = _("aborted")
             self._open_main_menu()
@@ -372,23 +497,93 @@ class ApplicationHandler(ApplicationModel):
         if repo_res.get("button_type", "").lower() in [
             t.lower() for t in [_("Ok"), _("Save"), _("ok"), _("save"), _("OK"), _("SAVE")]
         ]:
-            updateable, url = util.check_repo_dialog(self, height)
-            if updateable:
-                repo_res.get("config", None)['grommunio']['baseurl'] = f'https://{url}'
-                repo_res.get("config", None)['grommunio']['type'] = 'rpm-md'
-                config2 = cui.classes.parser.ConfigParser(infile=repo_res.get("repofile", None))
-                repo_res.get("config", None).write()
-                if repo_res.get("config", None) == config2:
-                    self.message_box(
-                        parameter.MsgBoxParams(
-                            _('The repo file has not been changed.')
-                        ),
-                        size=parameter.Size(height=height)
-                    )
-                else:
-                    self._process_changed_repo_config(height, repo_res)
+            supported, user, password = util.get_repo_selection(self)
+            if not supported:
+                # community selected
+                self._save_repo_selection(repo_res, util.get_repo_url(), height)
+                return
+            self.message_box(
+                parameter.MsgBoxParams(
+                    _('Checking the credentials for "supported" ...'),
+                    _('Repository selection'),
+                ),
+                size=parameter.Size(height=height),
+                view_buttons=parameter.ViewOkCancel(False, True),
+            )
+            pending = repo_checker.check_async(
+                self.control.app_control.loop,
+                get_check_url(),
+                user,
+                password,
+                lambda result: self._repo_checked(result, repo_res, user, password, height),
+            )
+            # Closing the message box cancels the check (a kept outcome is there already)
+            if not pending.done:
+                self.control.menu_control.repo_check = pending
+
+    def _cancel_repo_check(self):
+        """Cancel the running check of the repository credentials (if any)."""
+        pending = self.control.menu_control.repo_check
+        if pending is not None and not pending.done:
+            pending.cancel()
+            self.print(_("Repository credentials check canceled."))
+        self.control.menu_control.repo_check = None
+
+    def _repo_checked(self, result: RepoCheck, repo_res, user, password, height):
+        """Save the repository selection if the credentials have been accepted."""
+        self.control.menu_control.repo_check = None
+        # close the "checking" message box
+        if self.control.app_control.current_window == MESSAGE_BOX:
+            self.control.app_control.current_window = \
+                self.control.app_control.message_box_caller
+            self._reset_layout()
+        if result.ok:
+            self._save_repo_selection(repo_res, util.get_repo_url(user, password), height)
+        elif result.error:
+            self.message_box(
+                parameter.MsgBoxParams(
+                    _('The download server could not be reached. Please try again later.'),
+                ),
+                size=parameter.Size(height=height + 1)
+            )
+        else:
+            self.message_box(
+                parameter.MsgBoxParams(
+                    _('Please check the credentials for "supported"'
+                      '-version or use "community"-version.'),
+                ),
+                size=parameter.Size(height=height + 1)
+            )
 
-    def _process_changed_repo_config(self, height, repo_res):
+    def _save_repo_selection(self, repo_res, url, height):
+        """Write the selected repository to the repo file and apply it if changed."""
+        if self.control.menu_control.repo_update is not None:
+            self.message_box(
+                parameter.MsgBoxParams(
+                    _('The last repository selection is still being applied. '
+                      'Please try again later.')
+                ),
+                size=parameter.Size(height=height)
+            )
+            return
+        repo_res.get("config", None)['grommunio']['baseurl'] = f'https://{url}'
+        repo_res.get("config", None)['grommunio']['type'] = 'rpm-md'
+        config2 = cui.classes.parser.ConfigParser(infile=repo_res.get("repofile", None))
+        before = read_repo_files()
+        repo_res.get("config", None).write()
+        if repo_res.get("config", None) == config2:
+            self.message_box(
+                parameter.MsgBoxParams(
+                    _('The repo file has not been changed.')
+                ),
+                size=parameter.Size(height=height)
+            )
+        else:
+            aliases = get_changed_repos(before, read_repo_files())
+            self._process_changed_repo_config(height, repo_res, aliases)
+
+    def _process_changed_repo_config(self, height, repo_res, aliases):
+        """Fetch and import the key and refresh the changed repositories in the background."""
         header = GText(_("One moment, please ..."))
         footer = GText(_('Fetching GPG-KEY file and refreshing '
                           'repositories. This may take a while ...'))
@@ -397,54 +592,60 @@ class ApplicationHandler(ApplicationModel):
         fil = urwid.Filler(pad)
         linebox = urwid.LineBox(fil)
         frame: parameter.Frame = parameter.Frame(linebox, header, footer)
+        # Keys go to the progress (Esc hides it) instead of the main menu below
+        self.control.app_control.current_window = REPO_UPDATE
         self.dialog(frame)
-        self._draw_progress(20)
-        res: requests.Response = requests.get(repo_res.get("keyurl", None))
-        got_keyfile: bool = False
-        if res.status_code == 200:
-            self._draw_progress(30)
-            tmp = Path(repo_res.get("keyfile", None))
-            with tmp.open('w', encoding="utf-8") as file:
-                file.write(res.content.decode())
-            self._draw_progress(40)
-            with subprocess.Popen(
-                    ["rpm", "--import", repo_res.get("keyfile", None)],
-                    stderr=subprocess.DEVNULL,
-                    stdout=subprocess.DEVNULL,
-            ) as ret_code_rpm:
-                if ret_code_rpm.wait() == 0:
-                    self._draw_progress(60)
-                    with subprocess.Popen(
-                            ["zypper", "--non-interactive", "--gpg-auto-import-keys", "refresh"],
-                            stderr=subprocess.DEVNULL,
-                            stdout=subprocess.DEVNULL,
-                    ) as ret_code_zypper:
-                        if ret_code_zypper.wait() == 0:
-                            self._draw_progress(100)
-                            got_keyfile = True
-        if got_keyfile:
-            self.message_box(
-                parameter.MsgBoxParams(
-                    _('Software repository selection has been '
-                       'updated.'),
-                ),
-                size=parameter.Size(height=height)
-            )
+        self._draw_progress(0)
+
+        def progress(update: RepoUpdate, percent: int):
+            footer.set_text(f"{_(update.steps[update.step].title)} ...")
+            self._draw_progress(min(percent, 99))
+
+        update = RepoUpdate(aliases, repo_res.get("keyurl", None))
+        self.control.menu_control.repo_update = update
+        update.start(
+            self.control.app_control.loop,
+            progress,
+            lambda update: self._repo_config_processed(update, height),
+        )
+
+    def _repo_config_processed(self, update: RepoUpdate, height):
+        """Report the outcome of the changed repository configuration, step by step."""
+        self.control.menu_control.repo_update = None
+        if self.control.app_control.current_window != REPO_UPDATE:
+            # the progress has been hidden
+            if update.ok:
+                self.print(_('Software repository selection has been updated.'))
+            else:
+                self.print(_('Software repository selection has not been updated.'))
+            return
+        self._draw_progress(100)
+        self.control.app_control.current_window = MAIN_MENU
+        lines = []
+        for step in update.steps:
+            if step.ok is None:
+                continue
+            state = _("done") if step.ok else _("failed")
+            lines.append(f"{_(step.title)}: {state}")
+            if step.error:
+                lines.append(step.error.splitlines()[-1])
+        if update.ok:
+            msg = _('Software repository selection has been updated.')
+            if update.aliases:
+                msg += "\n" + _("Refreshed: {repos}").format(repos=", ".join(update.aliases))
         else:
-            self.message_box(
-                parameter.MsgBoxParams(
-                    _('Software repository selection has not been '
-                       'updated. Something went wrong while importing '
-                       'key file.'),
-                ),
-                size=parameter.Size(height=height + 1)
-            )
+            msg = _('Software repository selection has not been updated.')
+            msg += "\n\n" + "\n".join(lines)
+        self.message_box(
+            parameter.MsgBoxParams(msg),
+            size=parameter.Size(width=70, height=height + len(lines))
+        )
 
     def _init_repo_selection(self, key, height):
         self._handle_standard_tab_behaviour(key)
-        keyurl = 'https://download.grommunio.com/RPM-GPG-KEY-grommunio'
-        keyfile = '/tmp/RPM-GPG-KEY-grommunio'
-        repofile = '/etc/zypp/repos.d/grommunio.repo'
+        keyurl = KEY_URL
+        keyfile = util.root_path(KEY_CACHE_FILE)
+        repofile = util.root_path('/etc/zypp/repos.d/grommunio.repo')
         config = cui.classes.parser.ConfigParser(infile=repofile)
         # config.filename = repofile
         if not config.get('grommunio'):
@@ -492,35 +693,44 @@ class ApplicationHandler(ApplicationModel):
                 "FallbackNTP"
             ] = self.timesyncd_body.base_widget[2].edit_text
             util.lineconfig_write(
-                "/etc/systemd/timesyncd.conf", self.control.menu_control.timesyncd_vars
+                util.root_path("/etc/systemd/timesyncd.conf"), self.control.menu_control.timesyncd_vars
             )
-            with subprocess.Popen(
+            self.print(_("Enabling the network time synchronization ..."))
+            runner.run_async(
+                self.control.app_control.loop,
                 ["timedatectl", "set-ntp", "true"],
-                stderr=subprocess.DEVNULL,
-                stdout=subprocess.DEVNULL,
-            ) as ret_code:
-                res = ret_code.wait() == 0
-                success_msg = _("was successful")
-                if not res:
-                    success_msg = _("failed")
-            self.message_box(
-                parameter.MsgBoxParams(
-                    _(f"Timesyncd configuration change {success_msg}!"),
-                    _("Timesyncd Configuration"),
-                ),
-                size=parameter.Size(height=10)
+                self._timesyncd_enabled,
+                timeout=30,
             )
 
+    def _timesyncd_enabled(self, result: CommandResult):
+        """Report the outcome of the timesyncd configuration change."""
+        success_msg = _("was successful")
+        if not result.ok:
+            success_msg = _("failed")
+        msg = _(f"Timesyncd configuration change {success_msg}!")
+        if self.control.app_control.current_window != MAIN_MENU:
+            self.print(msg)
+            return
+        self.message_box(
+            parameter.MsgBoxParams(msg, _("Timesyncd Configuration")),
+            size=parameter.Size(height=10)
+        )
+
     def _key_ev_kbd_switch(self, key: str):
         """Handle event on keyboard switch."""
-        self._handle_standard_tab_behaviour(key)
-        menu_id = self._handle_standard_menu_behaviour(
-            self.control.menu_control.keyboard_switch_body, key
-        )
+        # The list has no footer to tab to, and typed keys filter it
+        menu_id = 1
+        if self.control.menu_control.keyboard_content:
+            menu_id = self._handle_standard_menu_behaviour(
+                self.control.menu_control.keyboard_switch_body, key
+            )
         stay = False
         if (
             key.lower().endswith("enter") and key.lower().startswith("hidden")
         ) or key.lower() in ["space"]:
+            if not self.control.menu_control.keyboard_content:
+                return
             kbd = self.control.menu_control.keyboard_content[menu_id - 1]
             self._set_kbd_layout(kbd)
         elif key.lower() == "esc":
@@ -536,7 +746,7 @@ class ApplicationHandler(ApplicationModel):
         event: Tuple[str, float, int, int] = tuple(event)
         if event[0] == "mouse press" and event[1] == 1:
             # self.handle_event('mouseclick left enter')
-            self.handle_event("my mouseclick left button")
+            self.post_event("my mouseclick left button")
 
     def handle_click(self, creator: urwid.Widget, option: bool = False):
         """
@@ -551,19 +761,9 @@ class ApplicationHandler(ApplicationModel):
         """
         Jump to a shell prompt
         """
-        self.control.app_control.loop.stop()
-        self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.old_termios)
-        print("\x1b[K")
-        print(
-            "\x1b[K \x1b[36m▼\x1b[0m",
-            _("To return to the CUI, issue the `exit` command.")
-        )
-        print("\x1b[J")
         # We have no environment, and so need su instead of just bash to launch
         # a proper PAM session and set $HOME, etc.
-        os.system("/usr/bin/su -l")
-        self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.blank_termios)
-        self.control.app_control.loop.start()
+        self._open_session("su", ["/usr/bin/su", "-l"], _("Terminal"))
 
     def _reboot_confirm(self):
         """Confirm reboot."""
@@ -591,46 +791,54 @@ class ApplicationHandler(ApplicationModel):
             view_buttons=parameter.ViewOkCancel(view_ok=True, view_cancel=True)
         )
 
-    def _run_yast_module(self, modulename: str):
-        """Run yast module `modulename`."""
-        self.control.app_control.loop.stop()
-        self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.old_termios)
-        print("\x1b[K")
-        print(
-            "\x1b[K \x1b[36m▼\x1b[0m",
-            _("Please wait while `yast2 %s` is being run.") % modulename
+    def _run_yast_module(self, modulename: str, on_closed: Callable[[Session], None] = None):
+        """Run yast module `modulename` (on_closed is called when it has exited)."""
+        self._open_session(
+            f"yast2 {modulename}", ["yast2", modulename], f"yast2 {modulename}", on_closed
         )
-        print("\x1b[J")
-        os.system(f"yast2 {modulename}")
-        self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.blank_termios)
-        self.control.app_control.loop.start()
 
     def _run_update(self):
-        """Run zypper modules `ref && up`."""
-        self.control.app_control.loop.stop()
-        self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.old_termios)
-        print("\x1b[K")
-        print("\x1b[K \x1b[36m▼\x1b[0m Please wait while zypper is invoked.")
-        print("\x1b[J")
-        os.system(f"zypper --gpg-auto-import-keys ref")
-        os.system(f"zypper up")
-        input("\n \x1b[36m▼\x1b[0m Press ENTER to return to the CUI.")
-        self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.blank_termios)
-        self.control.app_control.loop.start()
-        #self._run_zypper("ref")
-        #self._run_zypper("up")
+        """Update the system in the background (or show the running update)."""
+        if update_job.running and not self.control.app_control.updating:
+            self.message_box(
+                parameter.MsgBoxParams(_("A system update is already running.")),
+                size=parameter.Size(height=10)
+            )
+            return
+        if not update_job.running:
+            self.control.app_control.updating = update_job.start(
+                self.control.app_control.loop, self._update_progress, self._update_done
+            )
+        self._open_update_dialog()
+
+    def _update_progress(self):
+        """Show the progress of the update (if its dialog is shown)."""
+        if self.control.app_control.current_window == SYSTEM_UPDATE:
+            self._show_update_status()
+
+    def _update_done(self, job: UpdateJob):
+        """Show the outcome of the update, in its dialog if shown."""
+        self.control.app_control.updating = False
+        if self.control.app_control.current_window == SYSTEM_UPDATE:
+            self._show_update_status()
+        elif job.ok:
+            self.print(_("The system has been updated."))
+        else:
+            self.print(_("The system update has failed."))
 
     def _run_zypper(self, subcmd: str):
         """Run zypper modul `subcmd`."""
-        self.control.app_control.loop.stop()
-        self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.old_termios)
-        print("\x1b[K")
-        print("\x1b[K \x1b[36m▼\x1b[0m Please wait while zypper is invoked.")
-        print("\x1b[J")
-        os.system(f"zypper {subcmd}")
-        input("\n \x1b[36m▼\x1b[0m Press ENTER to return to the CUI.")
-        self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.blank_termios)
-        self.control.app_control.loop.start()
+        self._open_session(
+            f"zypper {subcmd}", ["zypper"] + shlex.split(subcmd), f"zypper {subcmd}"
+        )
+
+    def _open_last_session(self):
+        """Show the terminal of the last started tool again."""
+        session = self.control.app_control.sessions.get_last()
+        if session is None:
+            self.print(_("No tool has been started."))
+        elif self.control.app_control.current_window != TERMINAL:
+            self._show_session(session)
 
     def check_login(self):
         """
@@ -0,0 +1,247 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the keymap index and the list of the keyboard switcher"""
+import configparser
+import marshal
+import os
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Pattern, Tuple
+
+import urwid
+
+import cui.util
+
+KEYMAP_DIR: str = "/usr/share/kbd/keymaps"
+KEYMAP_INDEX_FILE: str = "/var/cache/grommunio-cui/keymaps"
+KEYMAP_INDEX_VERSION: int = 1
+KEYMAP_FILTER_FILE: str = "/etc/grommunio-cui/keyboards.conf"
+# Offered keymaps: two-letter layouts plus a few well-known others
+DEFAULT_INCLUDE: Tuple[str, ...] = ("^[a-z][a-z]$",)
+DEFAULT_EXTRA: Tuple[str, ...] = ("de-latin1-nodeadkeys", "us")
+
+
+def scan_keymaps(directory: str) -> Tuple[List[str], Dict[str, int]]:
+    """Return the sorted names of all keymaps below directory and the directory mtimes."""
+    keymaps = set()
+    mtimes: Dict[str, int] = {}
+    for path, _, files in os.walk(directory):
+        mtimes[path] = os.stat(path).st_mtime_ns
+        for file in files:
+            parts = file.split(".")
+            # f.e. de.map.gz
+            if len(parts) >= 2 and parts[1] == "map":
+                keymaps.add(parts[0])
+    return sorted(keymaps), mtimes
+
+
+class KeymapIndex:
+    """
+    The names of all installed keymaps, scanned once and cached on disk. The
+    cache is valid as long as the modification times of the keymap
+    directories are the same (adding or removing a keymap changes the one of
+    its directory), so checking it needs no directory listing.
+    """
+
+    def __init__(self, directory: str = KEYMAP_DIR, file: str = KEYMAP_INDEX_FILE):
+        self.directory = directory
+        self.file = file
+        self.scans: int = 0
+        self._keymaps: List[str] = []
+        self._mtimes: Dict[str, int] = {}
+
+    def get_keymaps(self) -> List[str]:
+        """Return the sorted names of all keymaps, scanning only if they have changed."""
+        directory = cui.util.root_path(self.directory)
+        if self._mtimes and self._is_valid(self._mtimes):
+            return self._keymaps
+        data = self._load()
+        if data and data["directory"] == directory and self._is_valid(data["mtimes"]):
+            self._keymaps, self._mtimes = data["keymaps"], data["mtimes"]
+            return self._keymaps
+        self.scans += 1
+        self._keymaps, self._mtimes = scan_keymaps(directory)
+        self._save({"directory": directory, "mtimes": self._mtimes, "keymaps": self._keymaps})
+        return self._keymaps
+
+    @staticmethod
+    def _is_valid(mtimes: Dict[str, int]) -> bool:
+        """Return if no directory of mtimes has been modified (or removed)."""
+        try:
+            return all(os.stat(path).st_mtime_ns == mtime for path, mtime in mtimes.items())
+        except OSError:
+            return False
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        """Return the cached index or None."""
+        try:
+            with open(cui.util.root_path(self.file), "rb") as file_handle:
+                data = marshal.load(file_handle)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != KEYMAP_INDEX_VERSION:
+            return None
+        return data
+
+    def _save(self, data: Dict[str, Any]):
+        """Save the index atomically (ignoring a read-only cache directory)."""
+        target = Path(cui.util.root_path(self.file))
+        tmp = target.with_name(f".{target.name}.{os.getpid()}")
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "wb") as file_handle:
+                marshal.dump(dict(data, version=KEYMAP_INDEX_VERSION), file_handle)
+            os.replace(tmp, target)
+        except (OSError, ValueError):
+            if tmp.exists():
+                tmp.unlink()
+
+
+class KeymapFilter:
+    """
+    Selects the keymaps offered by the keyboard switcher. The rules can be
+    overridden by the filter file, f.e. to offer all keymaps
+
+        [filter]
+        include = .*
+
+    include and exclude take one regular expression per line (searched in
+    the keymap name), extra names keymaps offered anyway.
+    """
+
+    def __init__(self):
+        self.include: List[Pattern] = [re.compile(rule) for rule in DEFAULT_INCLUDE]
+        self.exclude: List[Pattern] = []
+        self.extra: List[str] = list(DEFAULT_EXTRA)
+
+    def load(self, file: str = None) -> bool:
+        """
+        Override the rules by the filter file.
+
+        :param file: The filter file. KEYMAP_FILTER_FILE (below the root prefix) if None.
+        :return: True if the file has been read, False if not.
+        """
+        config = configparser.ConfigParser(interpolation=None)
+        try:
+            if not config.read(file or cui.util.root_path(KEYMAP_FILTER_FILE), encoding="utf-8"):
+                return False
+            section = config["filter"] if config.has_section("filter") else {}
+            rules = {
+                name: [line.strip() for line in section[name].splitlines() if line.strip()]
+                for name in ("include", "exclude", "extra")
+                if name in section
+            }
+            include = [re.compile(rule) for rule in rules.get("include", [])]
+            exclude = [re.compile(rule) for rule in rules.get("exclude", [])]
+        except (configparser.Error, re.error):
+            return False
+        if "include" in rules:
+            self.include = include
+        if "exclude" in rules:
+            self.exclude = exclude
+        if "extra" in rules:
+            self.extra = rules["extra"]
+        return True
+
+    def match(self, keymap: str) -> bool:
+        """Return if keymap is offered."""
+        return any(rule.search(keymap) for rule in self.include) \
+            and not any(rule.search(keymap) for rule in self.exclude)
+
+    def apply(self, keymaps: List[str]) -> List[str]:
+        """Return the sorted offered keymaps of keymaps plus the extra ones."""
+        return sorted({keymap for keymap in keymaps if self.match(keymap)} | set(self.extra))
+
+
+class KeymapWalker(urwid.ListWalker):
+    """
+    The keymaps shown by the keyboard switcher. The radio buttons are only
+    created when the ListBox shows them, and a type-ahead filter narrows the
+    shown keymaps (`names`) down.
+    """
+
+    def __init__(self, on_select: Callable[[str], None]):
+        self.keymaps: List[str] = []
+        self.names: List[str] = []
+        self.current: str = ""
+        self.filter_text: str = ""
+        self.focus: int = 0
+        self._on_select = on_select
+        self._group: List[urwid.RadioButton] = []
+        self._widgets: Dict[str, urwid.Widget] = {}
+
+    def set_keymaps(self, keymaps: List[str], current: str):
+        """Show keymaps (the current one first and focused) without filter."""
+        self.keymaps = [current] + [keymap for keymap in keymaps if keymap != current]
+        self.current = current
+        self.names[:] = []
+        self._group = []
+        self._widgets = {}
+        self.set_filter("")
+
+    def set_filter(self, text: str):
+        """Show only the keymaps containing text (case insensitive)."""
+        self.filter_text = text
+        text = text.lower()
+        focused = self.names[self.focus] if self.focus < len(self.names) else self.current
+        self.names[:] = [keymap for keymap in self.keymaps if text in keymap.lower()]
+        self.focus = self.names.index(focused) if focused in self.names else 0
+        self._modified()
+
+    def _get_widget(self, position: int) -> urwid.Widget:
+        """Return the radio button of the keymap at position, created on first use."""
+        name = self.names[position]
+        widget = self._widgets.get(name)
+        if widget is None:
+            button = urwid.RadioButton(self._group, name, name == self.current)
+            urwid.connect_signal(button, "change", self._changed)
+            widget = self._widgets[name] = urwid.AttrMap(
+                button, "focus" if name == self.current else "selectable"
+            )
+        return widget
+
+    def _changed(self, button: urwid.RadioButton, is_set: bool):
+        """Select the keymap of button when it gets set."""
+        if is_set:
+            self._on_select(button.label)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def get_focus(self) -> Tuple[Optional[urwid.Widget], Optional[int]]:
+        if not self.names:
+            return None, None
+        return self._get_widget(self.focus), self.focus
+
+    def set_focus(self, position: int):
+        self.focus = position
+        self._modified()
+
+    def get_next(self, position: int) -> Tuple[Optional[urwid.Widget], Optional[int]]:
+        if position + 1 >= len(self.names):
+            return None, None
+        return self._get_widget(position + 1), position + 1
+
+    def get_prev(self, position: int) -> Tuple[Optional[urwid.Widget], Optional[int]]:
+        if position <= 0 or position > len(self.names):
+            return None, None
+        return self._get_widget(position - 1), position - 1
+
+
+class KeymapList(urwid.ListBox):
+    """The ListBox of the keyboard switcher, typed characters filter the keymaps."""
+
+    def keypress(self, size: Tuple[int, int], key: str) -> Optional[str]:
+        walker: KeymapWalker = self.body
+        if len(key) == 1 and key.isprintable() and key != " ":
+            walker.set_filter(walker.filter_text + key)
+            return None
+        if key == "backspace" and walker.filter_text:
+            walker.set_filter(walker.filter_text[:-1])
+            return None
+        if not walker.names:
+            return key
+        return super().keypress(size, key)
+
+
+keymap_index: KeymapIndex = KeymapIndex()
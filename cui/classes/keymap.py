@@ -0,0 +1,98 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the keymap registry dispatching the keystrokes"""
+import configparser
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cui.util
+
+KEYMAP_FILE: str = "/etc/grommunio-cui/keymap.conf"
+# Section of the keymap file containing the bindings of all windows
+GLOBAL_SECTION: str = "global"
+# Binding a key to this action removes the binding
+UNBOUND: str = "none"
+
+
+class Keymap:
+    """
+    Maps keystrokes to handlers. It is built once per application: every window
+    has a handler getting all its keys, and (window, key) bindings with global
+    fallbacks (window None) name the actions run after it. The bindings can be
+    overridden by the keymap file, f.e.
+
+        [global]
+        f9 = exit
+        Q = none
+        [MAIN]
+        x = main_menu
+    """
+
+    def __init__(self):
+        self.actions: Dict[str, Tuple[Callable, str]] = {}
+        self.window_handlers: Dict[str, Callable] = {}
+        self.bindings: Dict[Tuple[Optional[str], str], str] = {}
+
+    def add_action(self, name: str, func: Callable, description: str = ""):
+        """Register func as action name (described in the help)."""
+        self.actions[name] = (func, description)
+
+    def set_window_handler(self, window: str, handler: Callable):
+        """Set the handler getting all keys of window."""
+        self.window_handlers[window] = handler
+
+    def bind(self, key: str, action: str, window: Optional[str] = None):
+        """Bind key to action on window (on all windows if None)."""
+        if action == UNBOUND:
+            self.bindings.pop((window, key), None)
+        elif action in self.actions:
+            self.bindings[(window, key)] = action
+
+    def get_action(self, window: str, key: str) -> Optional[Callable]:
+        """Return the action bound to key on window, the global one or None."""
+        action = self.bindings.get((window, key)) or self.bindings.get((None, key))
+        return self.actions[action][0] if action else None
+
+    def dispatch(self, window: str, key: str):
+        """Run the window handler and the action bound to key."""
+        handler = self.window_handlers.get(window)
+        if handler is not None:
+            handler(key)
+        action = self.get_action(window, key)
+        if action is not None:
+            action()
+
+    def load(self, file: str = None) -> bool:
+        """
+        Override the bindings by the keymap file.
+
+        :param file: The keymap file. KEYMAP_FILE (below the root prefix) if None.
+        :return: True if the file has been read, False if not.
+        """
+        config = configparser.ConfigParser(interpolation=None)
+        # keys are case sensitive, f.e. "Q" and "q"
+        config.optionxform = str
+        try:
+            if not config.read(file or cui.util.root_path(KEYMAP_FILE), encoding="utf-8"):
+                return False
+        except configparser.Error:
+            return False
+        for section in config.sections():
+            window = None if section == GLOBAL_SECTION else section
+            for key, action in config.items(section):
+                self.bind(key, action.strip(), window)
+        return True
+
+    def get_help(self, window: str) -> List[Tuple[str, str]]:
+        """Return (keys, description) of all actions usable on window."""
+        keys: Dict[str, List[str]] = {}
+        for (bound_window, key), action in self.bindings.items():
+            if bound_window is None and self.bindings.get((window, key)):
+                # overridden on this window
+                continue
+            if bound_window in (None, window):
+                keys.setdefault(action, []).append(key)
+        return [
+            (", ".join(keys[action]), self.actions[action][1])
+            for action in self.actions
+            if action in keys
+        ]
@@ -0,0 +1,62 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the cache of the wrapped text layouts"""
+import collections
+from typing import Any, Hashable, List, Optional
+
+import urwid
+
+# Number of layouts kept (f.e. the lines of a big log at two widths)
+LAYOUT_CACHE_SIZE: int = 50000
+
+
+class LayoutCache:
+    """
+    LRU cache of the line layouts (urwid line translations) of wrapped texts.
+    The layouts are keyed by text, width, alignment and wrap mode instead of
+    the widget, so identical texts (like repeated log lines) share one entry
+    and the layouts of the previous width survive a resize.
+    """
+
+    def __init__(self, size: int = LAYOUT_CACHE_SIZE):
+        self.size = size
+        self.hits: int = 0
+        self.misses: int = 0
+        self._layouts: "collections.OrderedDict[Hashable, List[Any]]" = collections.OrderedDict()
+
+    @staticmethod
+    def _key(widget: urwid.Text, text: Any, maxcol: int) -> Hashable:
+        """Return the key of the layout of text in widget at maxcol."""
+        return text, maxcol, widget.align, widget.wrap
+
+    def peek(self, widget: urwid.Text, text: Any, maxcol: int) -> Optional[List[Any]]:
+        """Return the cached layout (None if not cached) without counting it as use."""
+        return self._layouts.get(self._key(widget, text, maxcol))
+
+    def get(self, widget: urwid.Text, text: Any, maxcol: int) -> List[Any]:
+        """
+        Return the layout of text in widget at maxcol, wrapping it if not cached.
+
+        :param widget: The text widget (its layout, alignment and wrap mode are used).
+        :param text: The text of the widget.
+        :param maxcol: The available columns.
+        """
+        key = self._key(widget, text, maxcol)
+        layout = self._layouts.get(key)
+        if layout is not None:
+            self._layouts.move_to_end(key)
+            self.hits += 1
+            return layout
+        self.misses += 1
+        layout = widget.layout.layout(text, maxcol, widget.align, widget.wrap)
+        self._layouts[key] = layout
+        if len(self._layouts) > self.size:
+            self._layouts.popitem(last=False)
+        return layout
+
+    def clear(self):
+        """Forget all layouts."""
+        self._layouts.clear()
+
+
+layout_cache: LayoutCache = LayoutCache()
@@ -2,12 +2,9 @@
 # SPDX-FileCopyrightText: 2022 grommunio GmbH
 """The module contains the application model of the grommunio-cui"""
 import datetime
-import os
 import re
-import subprocess
-import time
 from pathlib import Path
-from typing import Dict, Any, List, Tuple, Set
+from typing import Any, Callable, Dict, List, Tuple
 
 import urwid
 import yaml
@@ -16,14 +13,26 @@ from systemd import journal
 import cui.classes
 import cui.classes.button
 from cui.symbol import LOG_VIEWER, MAIN, MESSAGE_BOX, INPUT_BOX, PASSWORD, \
-    MAIN_MENU, ADMIN_WEB_PW, TIMESYNCD, REPO_SELECTION, KEYBOARD_SWITCH
+    MAIN_MENU, ADMIN_WEB_PW, TIMESYNCD, REPO_SELECTION, KEYBOARD_SWITCH, TERMINAL, SYSTEM_UPDATE
 from cui import util, parameter
 from cui.util import _
 from cui.classes.interface import BaseApplication
 from cui.classes.button import GButton, GBoxButton
-from cui.classes.application import MainFrame, setup_state
-from cui.classes.gwidgets import GText, GEdit
+from cui.classes.application import MainFrame, SetupState, setup_state
+from cui.classes.collector import collector, TTL_CONFIG, TTL_JOURNAL, TTL_SYSINFO
+from cui.classes.snapshot import load_snapshot, save_snapshot
+from cui.classes.worker import CoalescingJob, run_in_background
+from cui.classes.runner import runner, CommandResult
+from cui.classes.profiler import profiled
+from cui.classes.stats import timed
+from cui.classes.render import HEADER, FOOTER
+from cui.classes.bandwidth import LOW_BANDWIDTH_FPS, LOW_BANDWIDTH_TICK
+from cui.classes.exporter import exporter
+from cui.classes.gwidgets import GText, GEdit, GLine
+from cui.classes.keyboard import KeymapFilter, KeymapList, KeymapWalker, keymap_index
 from cui.classes.scroll import ScrollBar, Scrollable
+from cui.classes.session import Session
+from cui.classes.zypper import ZYPPER_SUCCESS, update_job
 
 _ = cui.util.init_localization()
 
@@ -36,14 +45,39 @@ class ApplicationModel(BaseApplication):
     view: cui.classes.application.View
     control: cui.classes.application.Control
 
-    def __init__(self):
-        setup_state.set_setup_states()
+    def __init__(
+            self, tty: str = None, event_loop: urwid.EventLoop = None, count_output: bool = False
+    ):
+        # Paint from the last snapshot (if any) and refresh it in the background
+        snapshot: Dict[str, Any] = load_snapshot()
+        if snapshot:
+            self._restore_snapshot(snapshot)
+        else:
+            setup_state.set_setup_states()
         self.admin_api_config = {}
         self.view = cui.classes.application.View(self)
+        if snapshot:
+            self.view.header.set_kbdlayout(snapshot.get("kbdlayout", "us"))
         self.control = cui.classes.application.Control(MAIN)
         # MAIN Page
-        self.control.app_control.loop = util.create_main_loop(self)
-        self.control.app_control.loop.set_alarm_in(1, self._update_clock)
+        self.control.app_control.loop = util.create_main_loop(
+            self, tty, event_loop, count_output
+        )
+        # Rendering is profiled and measured as well (if enabled)
+        self.control.app_control.loop.draw_screen = self.control.app_control.frame_stats.wrap(
+            "render",
+            self.control.app_control.profiler.wrap(self.control.app_control.loop.draw_screen),
+        )
+        # Handlers only mark regions dirty, the loop draws once when getting idle
+        self.control.app_control.render.set_refresher(HEADER, self._refresh_header)
+        self.control.app_control.render.set_refresher(FOOTER, self._refresh_footer)
+        self.control.app_control.render.install(self.control.app_control.loop)
+        self.control.app_control.kbd_layout_job = CoalescingJob(
+            self._apply_kbd_layout, self._kbd_layout_applied
+        )
+        self.control.app_control.clock_alarm = self.control.app_control.loop.set_alarm_in(
+            1, self._update_clock
+        )
 
         cui.classes.button.create_application_buttons(self)
 
@@ -67,8 +101,88 @@ class ApplicationModel(BaseApplication):
         # some settings
         GButton.application = self
 
+        if snapshot:
+            self._refresh_main_screen_async()
+        else:
+            save_snapshot(self._get_main_screen_data())
+
+    @staticmethod
+    def _restore_snapshot(snapshot: Dict[str, Any]):
+        """Seed setup state and collector with the (stale) snapshot data."""
+        setup_state.restore_setup_states(snapshot.get("setup_states", {}))
+        for key in ("sysinfo-top", "sysinfo-bottom", "admin-api-config"):
+            if key in snapshot:
+                collector.put(key, snapshot[key], stale=True)
+
+    def _collect_main_screen(self) -> Dict[str, Any]:
+        """Collect all main-screen data from scratch. Runs in a thread."""
+        state = SetupState()
+        state.collect_setup_states()
+        return {
+            "setup_states": state.get_setup_states(),
+            "sysinfo-top": util.get_system_info_top(),
+            "sysinfo-bottom": util.get_system_info_bottom(state),
+            "admin-api-config": self._reduce_admin_api_config(self._read_admin_api_config()),
+            "kbdlayout": util.get_current_kbdlayout(),
+        }
+
+    def _refresh_main_screen_async(self):
+        """Collect the main-screen data in the background (once at a time) and repaint it."""
+        if self.control.app_control.refreshing:
+            return
+        self.control.app_control.refreshing = True
+        run_in_background(
+            self.control.app_control.loop, self._collect_main_screen, self._refresh_main_screen
+        )
+
+    def _refresh_main_screen(self, data: Dict[str, Any], error: Exception):
+        """Replace the stale snapshot (or expired) data with freshly collected data."""
+        self.control.app_control.refreshing = False
+        if error is not None:
+            # Collect synchronously on the next access
+            collector.invalidate()
+            setup_state.set_setup_states()
+        else:
+            setup_state.restore_setup_states(data["setup_states"])
+            for key in ("sysinfo-top", "sysinfo-bottom", "admin-api-config"):
+                collector.put(key, data[key])
+            self.view.header.set_kbdlayout(data["kbdlayout"])
+            save_snapshot(data)
+        self._load_journal_units()
+        self.view.header.refresh_header()
+        if self.control.app_control.current_window == MAIN:
+            self.prepare_mainscreen()
+            self.control.app_control.loop.widget = self.control.app_control.body
+
+    def _get_main_screen_data(self) -> Dict[str, Any]:
+        """Return the current main-screen data to be saved in a snapshot."""
+        return {
+            "setup_states": setup_state.get_setup_states(),
+            "sysinfo-top": util.get_system_info("top"),
+            "sysinfo-bottom": util.get_system_info("bottom"),
+            "admin-api-config": self._reduce_admin_api_config(self.admin_api_config),
+            "kbdlayout": self.view.header.get_kbdlayout(),
+        }
+
+    @staticmethod
+    def _reduce_admin_api_config(config: Dict[str, Any]) -> Dict[str, Any]:
+        """Return only the parts of the admin-API config the CUI uses."""
+        log_format = (
+            config.get("logging", {}).get("formatters", {}).get("mi-default", {}).get("format")
+        )
+        reduced: Dict[str, Any] = {"logs": config.get("logs", {})}
+        if log_format:
+            reduced["logging"] = {"formatters": {"mi-default": {"format": log_format}}}
+        return reduced
+
     def prepare_mainscreen(self):
         """Prepare main screen."""
+        # Show the expired system info once more (collecting it runs `last` and
+        # more) and refresh it in the background
+        if any([collector.renew_expired(key, TTL_SYSINFO) for key in (
+                "sysinfo-top", "sysinfo-bottom"
+        )]):
+            self._refresh_main_screen_async()
         # self.view.header = Header()
         self.view.main_frame = MainFrame(self)
         self.view.header.refresh_header()
@@ -115,40 +229,53 @@ class ApplicationModel(BaseApplication):
 
     def _create_password_dialog(self, msg, title, current_window):
         width = 60
-        input_text = ""
         height = 14
-        mask = "*"
         self.control.app_control.input_box_caller = self.control.app_control.current_window
         self.control.app_control.input_box_caller_body = self.control.app_control.loop.widget
         self.control.app_control.current_window = current_window
+        body, header = self.control.app_control.dialogs.get(
+            "password", self._build_password_dialog
+        )
+        pile = body.base_widget
+        pile[0].set_text(msg)
+        pile[2].set_edit_text("")
+        pile[4].set_edit_text("")
+        pile.focus_position = 2
+        footer = self._create_footer(True, True)
+        if title is None:
+            title = "Input expected"
+        header.set_text(title)
+        frame: parameter.Frame = parameter.Frame(
+            body=body,
+            header=header,
+            footer=footer,
+            focus_part="body",
+        )
+        alignment: parameter.Alignment = parameter.Alignment(urwid.CENTER, urwid.MIDDLE)
+        size: parameter.Size = parameter.Size(width, height)
+        self.dialog(frame, alignment=alignment, size=size, kind="password")
+
+    @staticmethod
+    def _build_password_dialog() -> Tuple[urwid.Widget, GText]:
+        """Build the body (message and two edits) and header of the password dialog."""
+        mask = "*"
         body = urwid.LineBox(
             urwid.Padding(
                 urwid.Filler(
                     urwid.Pile(
                         [
-                            GText(msg, urwid.CENTER),
+                            GText("", urwid.CENTER),
                             urwid.Divider(),
-                            GEdit("", input_text, False, urwid.CENTER, mask=mask),
+                            GEdit("", "", False, urwid.CENTER, mask=mask),
                             urwid.Divider(),
-                            GEdit("", input_text, False, urwid.CENTER, mask=mask),
+                            GEdit("", "", False, urwid.CENTER, mask=mask),
                         ]
                     ),
                     urwid.TOP,
                 )
             )
         )
-        footer = self._create_footer(True, True)
-        if title is None:
-            title = "Input expected"
-        frame: parameter.Frame = parameter.Frame(
-            body=body,
-            header=GText(title, urwid.CENTER),
-            footer=footer,
-            focus_part="body",
-        )
-        alignment: parameter.Alignment = parameter.Alignment(urwid.CENTER, urwid.MIDDLE)
-        size: parameter.Size = parameter.Size(width, height)
-        self.dialog(frame, alignment=alignment, size=size)
+        return body, GText("", urwid.CENTER)
 
     def _prepare_password_dialog(self):
         """Prepare the QuickNDirty password dialog."""
@@ -161,25 +288,36 @@ class ApplicationModel(BaseApplication):
             ),
         )
 
-    def _load_journal_units(self):
-        exe = "/usr/sbin/grommunio-admin"
+    @staticmethod
+    def _read_admin_api_config() -> Dict[str, Any]:
+        """Read the admin-API config which is the same for all consoles."""
+        exe = util.root_path("/usr/sbin/grommunio-admin")
         out = ""
         if Path(exe).exists():
-            with subprocess.Popen(
-                [exe, "config", "dump"],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            ) as process:
-                out = process.communicate()[0]
-            if isinstance(out, bytes):
-                out = out.decode()
+            out = runner.run([exe, "config", "dump"], timeout=30).stdout
         if out == "":
-            self.admin_api_config = {
+            return {
                 "logs": {"gromox-http": {"source": "gromox-http.service"}}
             }
-        else:
-            self.admin_api_config = yaml.load(out, Loader=yaml.SafeLoader)
+        return yaml.load(out, Loader=yaml.SafeLoader)
+
+    def _load_journal_units(self):
+        """
+        Take over the log units of the admin-API config. The config is re-read
+        in the background once expired, so changes are picked up as well.
+        """
+        config = collector.get_async(
+            self.control.app_control.loop,
+            "admin-api-config",
+            self._read_admin_api_config,
+            self._set_admin_api_config,
+            ttl=TTL_CONFIG,
+        )
+        self._set_admin_api_config(config if config is not None else {})
+
+    def _set_admin_api_config(self, config: Dict[str, Any]):
+        """Use config as admin-API config and take over its log units."""
+        self.admin_api_config = config
         self.control.log_control.log_units = self.admin_api_config.get(
             "logs", {"gromox-http": {"source": "gromox-http.service"}}
         )
@@ -217,31 +355,9 @@ class ApplicationModel(BaseApplication):
         unitname: str = (
             unit if unit.strip().endswith(".service") else f"{unit}.service"
         )
-
-        reader = journal.Reader()
-        reader.this_boot()
-        # reader.log_level(sj.LOG_INFO)
-        reader.add_match(_SYSTEMD_UNIT=unitname)
-        # h = 60 * 60
-        # d = 24 * h
-        # sincetime = time.time() - 4 * d
-        # reader.seek_realtime(sincetime)
-        line_list: List[str] = []
-        for entry in reader:
-            if entry.get("__REALTIME_TIMESTAMP", "") == "":
-                continue
-            format_dict = {
-                "asctime": entry.get(
-                    "__REALTIME_TIMESTAMP",
-                    datetime.datetime(1970, 1, 1, 0, 0, 0),
-                ).isoformat(),
-                "levelname": entry.get("PRIORITY", ""),
-                "module": entry.get(
-                    "_SYSTEMD_UNIT", "gromox-http.service"
-                ).split(".service")[0],
-                "message": entry.get("MESSAGE", ""),
-            }
-            line_list.append(self._get_logging_formatter() % format_dict)
+        line_list: List[str] = collector.get(
+            ("journal", unitname), self._read_journal, unitname, ttl=TTL_JOURNAL
+        )
         self.log_file_content = line_list[-lines:]
         found: bool = False
         pre: List[str] = []
@@ -305,7 +421,7 @@ class ApplicationModel(BaseApplication):
                                 Scrollable(
                                     urwid.Pile(
                                         [
-                                            GText(line)
+                                            GLine(line)
                                             for line in self.log_file_content
                                         ]
                                     )
@@ -319,6 +435,36 @@ class ApplicationModel(BaseApplication):
             )
         )
 
+    def _read_journal(self, unitname: str) -> List[str]:
+        """Read and format the journal entries of unitname of this boot."""
+        reader = journal.Reader()
+        reader.this_boot()
+        # reader.log_level(sj.LOG_INFO)
+        reader.add_match(_SYSTEMD_UNIT=unitname)
+        # h = 60 * 60
+        # d = 24 * h
+        # sincetime = time.time() - 4 * d
+        # reader.seek_realtime(sincetime)
+        formatter: str = self._get_logging_formatter()
+        line_list: List[str] = []
+        for entry in reader:
+            if entry.get("__REALTIME_TIMESTAMP", "") == "":
+                continue
+            format_dict = {
+                "asctime": entry.get(
+                    "__REALTIME_TIMESTAMP",
+                    datetime.datetime(1970, 1, 1, 0, 0, 0),
+                ).isoformat(),
+                "levelname": entry.get("PRIORITY", ""),
+                "module": entry.get(
+                    "_SYSTEMD_UNIT", "gromox-http.service"
+                ).split(".service")[0],
+                "message": entry.get("MESSAGE", ""),
+            }
+            line_list.append(formatter % format_dict)
+        self.control.app_control.frame_stats.add_journal_entries(len(line_list))
+        return line_list
+
     def _open_log_viewer(self, unit: str, lines: int = 0):
         """
         Opens log file viewer.
@@ -328,6 +474,7 @@ class ApplicationModel(BaseApplication):
             self.control.app_control.log_file_caller_body = self.control.app_control.body
             self.control.app_control.current_window = LOG_VIEWER
         self.print(_("Log file viewer has to open file {%s} ...") % unit)
+        self._load_journal_units()
         self._prepare_log_viewer(unit, lines)
         self.control.app_control.body = self.control.log_control.log_viewer
         self.control.app_control.loop.widget = self.control.app_control.body
@@ -355,18 +502,22 @@ class ApplicationModel(BaseApplication):
             header: Any,
             footer_buttons: List[Tuple[int, GBoxButton]]
     ):
-        footer = urwid.AttrMap(
-            urwid.Columns(footer_buttons), "buttonbar"
+        dialogs = self.control.app_control.dialogs
+        footer = dialogs.get(
+            ("conf footer",) + tuple(footer_buttons),
+            lambda: urwid.AttrMap(urwid.Columns(footer_buttons), "buttonbar"),
         )
+        body = dialogs.get("conf body", lambda: urwid.AttrMap(body_widget, "body"))
+        body.original_widget = body_widget
         frame: parameter.Frame = parameter.Frame(
-            body=urwid.AttrMap(body_widget, "body"),
+            body=body,
             header=header,
             footer=footer,
             focus_part="body",
         )
         alignment: parameter.Alignment = parameter.Alignment(urwid.CENTER, urwid.MIDDLE)
         size: parameter.Size = parameter.Size(60, 15)
-        self.dialog(frame, alignment=alignment, size=size)
+        self.dialog(frame, alignment=alignment, size=size, kind="conf")
 
     def _prepare_timesyncd_config(self):
         """Prepare timesyncd configuration form."""
@@ -383,7 +534,7 @@ class ApplicationModel(BaseApplication):
             "3.opensuse.pool.ntp.org",
         ]
         self.control.menu_control.timesyncd_vars = util.lineconfig_read(
-            "/etc/systemd/timesyncd.conf"
+            util.root_path("/etc/systemd/timesyncd.conf")
         )
         ntp_from_file = self.control.menu_control.timesyncd_vars.get("NTP", " ".join(ntp_server))
         fallback_from_file = self.control.menu_control.timesyncd_vars.get(
@@ -428,7 +579,7 @@ class ApplicationModel(BaseApplication):
         """Prepare repository configuration form."""
         baseurl = 'https://download.grommunio.com/community/openSUSE_Leap_' \
                   '15.5/?ssl_verify=no'
-        repofile = '/etc/zypp/repos.d/grommunio.repo'
+        repofile = util.root_path('/etc/zypp/repos.d/grommunio.repo')
         config = cui.classes.parser.ConfigParser(infile=repofile)
         default_type = 'community'
         default_user = ''
@@ -470,14 +621,77 @@ class ApplicationModel(BaseApplication):
 
     def _open_setup_wizard(self):
         """Open grommunio setup wizard."""
-        self.control.app_control.loop.stop()
-        self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.old_termios)
-        if Path("/usr/sbin/grommunio-setup").exists():
-            os.system("/usr/sbin/grommunio-setup")
+        exe = util.root_path("/usr/sbin/grommunio-setup")
+        if not Path(exe).exists():
+            exe = util.root_path("/usr/sbin/grammm-setup")
+        self._open_session("setup", [exe], _("grommunio setup"))
+
+    def _open_session(
+            self, name: str, args: List[str], title: str,
+            on_closed: Callable[[Session], None] = None
+    ):
+        """
+        Run the tool args in an embedded terminal (or show it if still running).
+        The main loop keeps running, the CUI can be used beside the tool.
+
+        :param name: The name of the session, f.e. "yast2 lan".
+        :param args: The command and its arguments.
+        :param title: The title of the terminal.
+        :param on_closed: Is called with the session when the tool has exited,
+            f.e. to take over what it has changed.
+        """
+        def closed(session: Session):
+            self._session_closed(session)
+            if on_closed is not None:
+                on_closed(session)
+
+        session = self.control.app_control.sessions.open(
+            name, args, title, self.control.app_control.loop.event_loop, closed
+        )
+        self._show_session(session)
+
+    def _show_session(self, session: Session):
+        """Show the terminal of session."""
+        self._reset_layout()
+        if self.control.app_control.current_window != TERMINAL:
+            self.control.app_control.session_caller = self.control.app_control.current_window
+        self.control.app_control.current_window = TERMINAL
+        session.grab()
+        self._set_session_hint(session)
+        self.control.app_control.body = session.widget
+        self.control.app_control.loop.widget = self.control.app_control.body
+        self.print(_("Running `{name}` ...").format(name=session.name))
+
+    @staticmethod
+    def _set_session_hint(session: Session):
+        """Explain the keys of the session above its terminal."""
+        if session.running:
+            session.set_hint(_(
+                "<Ctrl-A> releases the keyboard: then <ESC> returns to the CUI (the tool "
+                "keeps running, <F6> shows it again) and <PgUp>/<PgDn> scroll back."
+            ))
         else:
-            os.system("/usr/sbin/grammm-setup")
-        self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.blank_termios)
-        self.control.app_control.loop.start()
+            session.set_hint(_(
+                "`{name}` has finished. <PgUp>/<PgDn> scroll back, <ENTER> or <ESC> "
+                "returns to the CUI."
+            ).format(name=session.name))
+
+    def _session_closed(self, session: Session):
+        """Note the exit of the tool of session."""
+        self._set_session_hint(session)
+        if self.control.app_control.body is session.widget:
+            self.print(_("`{name}` has finished.").format(name=session.name))
+        else:
+            self.print(_("`{name}` has finished, <F6> shows its output.").format(
+                name=session.name
+            ))
+
+    def _return_from_session(self):
+        """Return from the terminal to the window it has been opened from."""
+        if self.control.app_control.session_caller == MAIN:
+            self._open_mainframe()
+        else:
+            self._open_main_menu()
 
     def _open_main_menu(self):
         """
@@ -507,80 +721,100 @@ class ApplicationModel(BaseApplication):
         self.print(_("Opening keyboard configuration"))
         self.control.app_control.last_current_window = self.control.app_control.current_window
         self.control.app_control.current_window = KEYBOARD_SWITCH
-        header = None
         self._prepare_kbd_config()
+        body = self.control.app_control.dialogs.get(
+            "keyboard body",
+            lambda: urwid.AttrMap(self.control.menu_control.keyboard_switch_body, "body"),
+        )
         footer = None
         frame: parameter.Frame = parameter.Frame(
-            body=urwid.AttrMap(self.control.menu_control.keyboard_switch_body, "body"),
-            header=header,
+            body=body,
+            header=self.control.menu_control.keyboard_header,
             footer=footer,
             focus_part="body",
         )
         alignment: parameter.Alignment = parameter.Alignment(urwid.CENTER, urwid.MIDDLE)
-        size: parameter.Size = parameter.Size(30, 10)
-        self.dialog(frame, alignment=alignment, size=size)
+        size: parameter.Size = parameter.Size(30, 11)
+        self.dialog(frame, alignment=alignment, size=size, kind="keyboard")
 
     def _set_kbd_layout(self, layout):
         """Set and save selected keyboard layout."""
         # Do read the file again so newly added keys do not get lost
-        file = "/etc/vconsole.conf"
+        file = util.root_path("/etc/vconsole.conf")
         var = util.minishell_read(file)
         var["KEYMAP"] = layout
         util.minishell_write(file, var)
-        os.system("systemctl restart systemd-vconsole-setup")
+        # Quickly repeated selections only apply the last layout
+        self.control.app_control.kbd_layout_job.request(self.control.app_control.loop, layout)
+        self.print(_("Applying keyboard layout {layout} ...").format(layout=layout))
         self.view.header.set_kbdlayout(layout)
         self.view.header.refresh_head_text()
         self.view.header.refresh_content()
 
+    def _apply_kbd_layout(self, layout: str) -> Tuple[CommandResult, CommandResult]:
+        """
+        Load layout on this console right away, then restart systemd-vconsole-setup
+        for all consoles. Runs in the background.
+        """
+        tty = self.view.gscreen.tty
+        loaded = runner.run(
+            ["loadkeys", "-C", f"/dev/{tty}", layout] if tty else ["loadkeys", layout]
+        )
+        restarted = runner.run(["systemctl", "restart", "systemd-vconsole-setup"])
+        return loaded, restarted
+
+    def _kbd_layout_applied(
+            self, layout: str, results: Tuple[CommandResult, CommandResult], error: Exception
+    ):
+        """Report the applied keyboard layout (unless a newer one is waiting)."""
+        if self.control.app_control.kbd_layout_job.has_pending:
+            return
+        if error is not None or not results[0].ok:
+            self.print(_("Loading the keyboard layout failed."))
+        elif not results[1].ok:
+            self.print(_("Applying the keyboard layout failed."))
+        else:
+            self.print(_("Keyboard layout {layout} applied.").format(layout=layout))
+
     def _prepare_kbd_config(self):
         """Prepare keyboard config form."""
-        def sub_press(button, is_set=True):
-            if is_set:
-                layout = button.label
-                self._set_kbd_layout(layout)
-                self._return_to()
-
-        keyboards: Set[str] = {"de-latin1-nodeadkeys", "us"}
-        all_kbds = [
-            y.split(".")
-            for x in os.walk("/usr/share/kbd/keymaps")
-            for y in x[2]
-        ]
-        all_kbds = [x[0] for x in all_kbds if len(x) >= 2 and x[1] == "map"]
-        _ = [
-            keyboards.add(kbd)
-            for kbd in all_kbds
-            if re.match("^[a-z][a-z]$", kbd)
-        ]
-        keyboard_list = [util.get_current_kbdlayout()]
-        _ = [
-            keyboard_list.append(kbd)
-            for kbd in sorted(keyboards)
-            if kbd != self.view.header.get_kbdlayout()
-        ]
-        self.control.menu_control.keyboard_rb = []
-        self.control.menu_control.keyboard_content = []
-        for kbd in keyboard_list:
-            self.control.menu_control.keyboard_content.append(
-                urwid.AttrMap(
-                    urwid.RadioButton(
-                        self.control.menu_control.keyboard_rb, kbd, "first True", sub_press
-                    ),
-                    "focus" if kbd == self.view.header.get_kbdlayout() else "selectable",
-                )
+        def sub_press(layout):
+            self._return_to()
+            # after returning, so the footer shows the progress
+            self._set_kbd_layout(layout)
+
+        menu_control = self.control.menu_control
+        if menu_control.keyboard_walker is None:
+            menu_control.keymap_filter = KeymapFilter()
+            menu_control.keymap_filter.load()
+            menu_control.keyboard_walker = KeymapWalker(sub_press)
+            menu_control.keyboard_header = GText("", urwid.CENTER)
+            urwid.connect_signal(
+                menu_control.keyboard_walker, "modified", self._refresh_kbd_filter
             )
-        self.control.menu_control.keyboard_list = ScrollBar(Scrollable(
-            urwid.Pile(self.control.menu_control.keyboard_content)
-        ))
-        self.control.menu_control.keyboard_switch_body = self.control.menu_control.keyboard_list
+            menu_control.keyboard_list = KeymapList(menu_control.keyboard_walker)
+            menu_control.keyboard_switch_body = menu_control.keyboard_list
+        menu_control.keyboard_walker.set_keymaps(
+            menu_control.keymap_filter.apply(keymap_index.get_keymaps()),
+            util.get_current_kbdlayout(),
+        )
+        menu_control.keyboard_content = menu_control.keyboard_walker.names
+
+    def _refresh_kbd_filter(self):
+        """Show the type-ahead filter of the keyboard switcher in its header."""
+        filter_text = self.control.menu_control.keyboard_walker.filter_text
+        self.control.menu_control.keyboard_header.set_text(
+            _("Filter: {text}").format(text=filter_text) if filter_text else _("Type to filter")
+        )
 
     def redraw(self):
         """
-        Redraws screen.
+        Redraws screen (with the next frame).
         """
-        if getattr(self.control.app_control, "loop", None):
-            if self.control.app_control.loop:
-                self.control.app_control.loop.draw_screen()
+        self.control.app_control.render.mark_dirty(HEADER)
+
+    def _refresh_header(self):
+        """Refresh the header before it is drawn."""
         if getattr(self, "view", None):
             if getattr(self.view, "header", None):
                 self.view.header.refresh_header()
@@ -592,16 +826,22 @@ class ApplicationModel(BaseApplication):
 
         if getattr(self.control.app_control, "loop", None):
             self.control.app_control.loop.widget = self.control.app_control.body
-            self.control.app_control.loop.draw_screen()
 
     def print(self, string="", align="left"):
         """
-        Prints a string to the console UI
+        Prints a string to the console UI (with the next frame)
 
         Args:
             string (str): The string to print
             align (str): The alignment of the printed text
         """
+        self.control.app_control.current_bottom_info = string
+        self.control.app_control.render.mark_dirty(FOOTER)
+        self.redraw()
+
+    @profiled
+    def _refresh_footer(self):
+        """Rebuild the footer with the last printed string before it is drawn."""
 
         def glen(widget_list):
             wlist = widget_list
@@ -620,17 +860,10 @@ class ApplicationModel(BaseApplication):
                 res += 0
             return res
 
-        clock = GText(util.get_clockstring(), right=1)
+        clock = GText(util.get_clockstring(not self.view.gscreen.low_bandwidth), right=1)
         footerbar = GText(util.get_footerbar(2, 10), left=1, right=0)
         avg_load = GText(util.get_load_avg_format_list(), left=1, right=2)
-        gstring = GText(("footer", string), left=1, right=2)
-        gdebug = GText(
-            [
-                "\n",
-                ("", f"({self.control.app_control.current_event})"),
-                ("", f" on {self.control.app_control.current_window}"),
-            ]
-        )
+        gstring = GText(("footer", self.control.app_control.current_bottom_info), left=1, right=2)
         footer_elements = [clock, footerbar, avg_load]
         if not self.view.gscreen.quiet:
             footer_elements += [gstring]
@@ -645,6 +878,17 @@ class ApplicationModel(BaseApplication):
         if len(rest) > 0:
             col_list += [urwid.Columns([(len(elem), elem) for elem in rest])]
         if self.view.gscreen.debug:
+            gdebug = GText(
+                [
+                    "\n",
+                    ("", f"({self.control.app_control.current_event})"),
+                    ("", f" on {self.control.app_control.current_window}"),
+                    ("", f" | {self.control.app_control.frame_stats.get_text()}"),
+                    ("", f" | {self.control.app_control.render.frames} frames"),
+                    ("", f" | {self.view.gscreen.output.get_bytes_per_minute()} B/min"
+                     if self.view.gscreen.output is not None else ""),
+                ]
+            )
             col_list += [urwid.Columns([gdebug])]
         self.view.main_footer.footer_content = col_list
         self.view.main_footer.footer = urwid.AttrMap(
@@ -654,8 +898,6 @@ class ApplicationModel(BaseApplication):
         swap_widget = getattr(self.control.app_control, "body", None)
         if swap_widget:
             swap_widget.footer = self.view.main_footer.footer
-            self.redraw()
-        self.control.app_control.current_bottom_info = string
 
     def _create_progress_bar(self, max_progress=100):
         """Create progressbar"""
@@ -664,16 +906,79 @@ class ApplicationModel(BaseApplication):
         )
         return self.control.app_control.progressbar
 
+    def _open_update_dialog(self):
+        """Show the progress of the system update."""
+        self._reset_layout()
+        self.control.app_control.current_window = SYSTEM_UPDATE
+        body, header = self.control.app_control.dialogs.get(
+            "update", self._build_update_body
+        )
+        header.set_text(_("System update"))
+        body.base_widget[3].set_text(_("Overall progress"))
+        self._show_update_status()
+        frame: parameter.Frame = parameter.Frame(
+            body=body,
+            header=header,
+            footer=self._create_footer(True, False),
+            focus_part="footer",
+        )
+        self.dialog(
+            frame,
+            alignment=parameter.Alignment(urwid.CENTER, urwid.MIDDLE),
+            size=parameter.Size(70, 16),
+            kind="update",
+        )
+
+    @staticmethod
+    def _build_update_body() -> Tuple[urwid.Widget, GText]:
+        """Build the body (step, task with progress, overall progress, message) and header."""
+        body = urwid.LineBox(urwid.Padding(urwid.Filler(urwid.Pile([
+            GText(""),
+            GText("", wrap=urwid.ELLIPSIS),
+            urwid.ProgressBar("PB.normal", "PB.complete", 0, 100, "PB.satt"),
+            GText(""),
+            urwid.ProgressBar("PB.normal", "PB.complete", 0, 100, "PB.satt"),
+            urwid.Divider(),
+            GText(""),
+        ]), urwid.TOP), left=1, right=1))
+        return body, GText("", urwid.CENTER)
+
+    def _show_update_status(self):
+        """Show the state of the system update in its (maybe hidden) dialog."""
+        body, _header = self.control.app_control.dialogs.get(
+            "update", self._build_update_body
+        )
+        pile = body.base_widget
+        if update_job.running:
+            status = update_job.get_status()
+            pile[0].set_text(_(status.title))
+            pile[1].set_text(status.task)
+            pile[2].set_completion(status.task_percent)
+            pile[4].set_completion(status.percent)
+            pile[6].set_text(status.message)
+            return
+        if update_job.ok:
+            pile[0].set_text(_("The system has been updated."))
+            pile[4].set_completion(100)
+        else:
+            pile[0].set_text(_("The system update has failed."))
+        pile[1].set_text("")
+        pile[2].set_completion(0)
+        messages = list(update_job.progress.errors[-3:])
+        messages += [result.stderr.strip() or result.error for result in update_job.results
+                     if result.returncode not in ZYPPER_SUCCESS]
+        if update_job.reboot_needed:
+            messages.append(_("A reboot is needed to complete the update."))
+        pile[6].set_text("\n".join(message for message in messages if message))
+
     def _draw_progress(self, progress, max_progress=100):
         """Draw progress at progressbar"""
         # completion = float(float(progress)/float(max_progress))
         # self.control.app_control.progressbar.set_completion(completion)
-        time.sleep(0.1)
         self.control.app_control.progressbar.done = max_progress
         self.control.app_control.progressbar.current = progress
         if progress == max_progress:
             self._reset_layout()
-        self.control.app_control.loop.draw_screen()
 
     def message_box(
             self,
@@ -707,22 +1012,34 @@ class ApplicationModel(BaseApplication):
             self.control.app_control.message_box_caller = self.control.app_control.current_window
             self.control.app_control.message_box_caller_body = self.control.app_control.loop.widget
             self.control.app_control.current_window = MESSAGE_BOX
-        body = urwid.LineBox(urwid.Padding(
-            urwid.Filler(urwid.Pile([GText(mb_params.msg, urwid.CENTER)]), urwid.TOP)
-        ))
+        body, header = self.control.app_control.dialogs.get(
+            "message_box", self._build_message_box
+        )
+        body.base_widget[0].set_text(mb_params.msg)
         footer = self._create_footer(view_buttons.view_ok, view_buttons.view_cancel)
 
         if mb_params.title is None:
             title = _("Message")
         else:
             title = mb_params.title
+        header.set_text(title)
         frame: parameter.Frame = parameter.Frame(
             body=body,
-            header=GText(title, urwid.CENTER),
+            header=header,
             footer=footer,
             focus_part="footer",
         )
-        self.dialog(frame, alignment=alignment, size=size, modal=mb_params.modal)
+        self.dialog(
+            frame, alignment=alignment, size=size, modal=mb_params.modal, kind="message_box"
+        )
+
+    @staticmethod
+    def _build_message_box() -> Tuple[urwid.Widget, GText]:
+        """Build the body (message) and header of the message box."""
+        body = urwid.LineBox(urwid.Padding(
+            urwid.Filler(urwid.Pile([GText("", urwid.CENTER)]), urwid.TOP)
+        ))
+        return body, GText("", urwid.CENTER)
 
     def input_box(
             self,
@@ -766,40 +1083,60 @@ class ApplicationModel(BaseApplication):
         self.control.app_control.input_box_caller = self.control.app_control.current_window
         self.control.app_control.input_box_caller_body = self.control.app_control.loop.widget
         self.control.app_control.current_window = INPUT_BOX
+        body, header = self.control.app_control.dialogs.get("input_box", self._build_input_box)
+        pile = body.base_widget
+        pile[0].set_text(ib_params.msg)
+        edit = pile[1].edit_widget
+        edit.multiline = ib_params.multiline
+        edit.set_mask(ib_params.mask)
+        edit.set_edit_text(ib_params.input_text)
+        edit.set_edit_pos(len(edit.edit_text))
+        pile.focus_position = 1
+        footer = self._create_footer(view_buttons.view_ok, view_buttons.view_cancel)
+
+        if ib_params.title is None:
+            title = _("Input expected")
+        else:
+            title = ib_params.title
+        header.set_text(title)
+        frame: parameter.Frame = parameter.Frame(
+            body=body,
+            header=header,
+            footer=footer,
+            focus_part="body",
+        )
+        self.dialog(
+            frame, alignment=alignment, size=size, modal=ib_params.modal, kind="input_box"
+        )
+
+    @staticmethod
+    def _build_input_box() -> Tuple[urwid.Widget, GText]:
+        """Build the body (message and edit) and header of the input box."""
         body = urwid.LineBox(
             urwid.Padding(
                 urwid.Filler(
                     urwid.Pile(
                         [
-                            GText(ib_params.msg, urwid.CENTER),
-                            GEdit(
-                                "",
-                                ib_params.input_text,
-                                ib_params.multiline,
-                                urwid.CENTER,
-                                mask=ib_params.mask
-                            ),
+                            GText("", urwid.CENTER),
+                            GEdit("", "", False, urwid.CENTER),
                         ]
                     ),
                     urwid.TOP,
                 )
             )
         )
-        footer = self._create_footer(view_buttons.view_ok, view_buttons.view_cancel)
+        return body, GText("", urwid.CENTER)
 
-        if ib_params.title is None:
-            title = _("Input expected")
-        else:
-            title = ib_params.title
-        frame: parameter.Frame = parameter.Frame(
-            body=body,
-            header=GText(title, urwid.CENTER),
-            footer=footer,
-            focus_part="body",
+    def _create_footer(self, view_ok: bool = True, view_cancel: bool = False):
+        """Return the footer (built once per shown buttons)."""
+        ok_button = self.view.button_store.ok_button
+        cancel_button = self.view.button_store.cancel_button
+        return self.control.app_control.dialogs.get(
+            ("footer", view_ok and ok_button, view_cancel and cancel_button),
+            lambda: self._build_footer(view_ok, view_cancel),
         )
-        self.dialog(frame, alignment=alignment, size=size, modal=ib_params.modal)
 
-    def _create_footer(self, view_ok: bool = True, view_cancel: bool = False):
+    def _build_footer(self, view_ok: bool = True, view_cancel: bool = False):
         """Create and return footer."""
         cols = [("weight", 1, GText(""))]
         if view_ok:
@@ -841,36 +1178,99 @@ class ApplicationModel(BaseApplication):
         :param yes: True for on and False for off.
         """
         self.view.gscreen.debug = yes
+        self.control.app_control.frame_stats.set_enabled(yes)
+
+    def set_low_bandwidth(self, tick: float = LOW_BANDWIDTH_TICK):
+        """
+        Switches to the low-bandwidth mode for slow (f.e. serial) consoles:
+        16 colors, no seconds in the clock, fewer clock ticks and frames.
+
+        :param tick: Seconds between two clock ticks (0 for no ticks at all).
+        """
+        self.view.gscreen.low_bandwidth = True
+        self.view.gscreen.screen.set_terminal_properties(colors=16)
+        self.control.app_control.render.set_max_fps(LOW_BANDWIDTH_FPS)
+        self.set_tick_interval(tick)
+
+    def set_tick_interval(self, interval: float):
+        """
+        Sets the seconds between two clock ticks.
+
+        :param interval: The seconds, 0 stops the clock.
+        """
+        self.control.app_control.tick_interval = interval
+        loop: urwid.MainLoop = self.control.app_control.loop
+        if self.control.app_control.clock_alarm is not None:
+            loop.remove_alarm(self.control.app_control.clock_alarm)
+            self.control.app_control.clock_alarm = None
+        if interval > 0:
+            self.control.app_control.clock_alarm = loop.set_alarm_in(interval, self._update_clock)
+
+    def start_metrics_export(self):
+        """Export the metrics every metrics interval (independent of the clock tick)."""
+        loop: urwid.MainLoop = self.control.app_control.loop
+        if self.control.app_control.metrics_alarm is not None:
+            loop.remove_alarm(self.control.app_control.metrics_alarm)
+        self.control.app_control.metrics_alarm = loop.set_alarm_in(0, self._export_metrics)
+
+    def _export_metrics(self, cb_loop: urwid.MainLoop, data: Any = None):
+        """Export the metrics (rate-limited across all consoles) and schedule the next export."""
+        exporter.update(self)
+        self.control.app_control.metrics_alarm = cb_loop.set_alarm_in(
+            exporter.interval, self._export_metrics, data
+        )
 
+    @timed("tick")
     def _update_clock(self, cb_loop: urwid.MainLoop, data: Any = None):
         """
-        Updates taskbar every second.
+        Updates taskbar every tick (every second by default).
 
         :param cb_loop: The event loop calling next update_clock()
         :param data: Optional user data
         """
         self.print(self.control.app_control.current_bottom_info)
-        cb_loop.set_alarm_in(1, self._update_clock, data)
+        self.control.app_control.clock_alarm = cb_loop.set_alarm_in(
+            self.control.app_control.tick_interval, self._update_clock, data
+        )
 
-    def start(self, immediate_restart: bool = False):
+    def start(self):
         """
         Starts the console UI
         """
         # set_trace(term_size=(129, 18))
         # set_trace()
-        if immediate_restart:
-            raise urwid.ExitMainLoop()
         self.prepare_mainscreen()
         self.control.app_control.loop.widget = self.control.app_control.body
         self.control.app_control.loop.run()
+        self.control.app_control.sessions.terminate_all()
         if self.view.gscreen.old_termios is not None:
-            self.view.gscreen.screen.tty_signal_keys(*self.view.gscreen.old_termios)
+            self.view.gscreen.set_signal_keys(self.view.gscreen.old_termios)
+
+    def shutdown(self):
+        """
+        Stops the console UI without leaving the shared event loop, f.e. when one
+        of several consoles is closed.
+        """
+        loop: urwid.MainLoop = self.control.app_control.loop
+        if self.control.app_control.clock_alarm is not None:
+            loop.remove_alarm(self.control.app_control.clock_alarm)
+            self.control.app_control.clock_alarm = None
+        if self.control.app_control.metrics_alarm is not None:
+            loop.remove_alarm(self.control.app_control.metrics_alarm)
+            self.control.app_control.metrics_alarm = None
+        loop.stop()
+        self.control.app_control.sessions.terminate_all()
+        if self.view.gscreen.old_termios is not None:
+            self.view.gscreen.set_signal_keys(self.view.gscreen.old_termios)
+        for tty_file in self.view.gscreen.tty_files:
+            tty_file.close()
 
     def dialog(
             self, frame: parameter.Frame,
             alignment: parameter.Alignment = parameter.Alignment(),
             size: parameter.Size = parameter.Size(),
-            modal: bool = False
+            modal: bool = False,
+            kind: str = None
     ):
         """
         urwid.Overlays a dialog box on top of the console UI
@@ -880,7 +1280,11 @@ class ApplicationModel(BaseApplication):
             @param alignment: The alignment in align and valign.
             @param size: The size with width and height.
             @param modal: Dialog is locked / modal until user closes it.
+            @param kind: Reopen the Frame and Overlay built for this kind of
+                dialog on its first open (None builds them every time).
         """
+        # pylint: disable=unused-argument
+        # because all dialogs are drawn with the next frame, modal or not
         # Body
         if isinstance(frame.body, str) and frame.body == "":
             body = GText(_("No body"), align="center")
@@ -914,22 +1318,43 @@ class ApplicationModel(BaseApplication):
         if self.view.gscreen.layout is not None:
             self.view.gscreen.old_layout = self.view.gscreen.layout
 
-        self.view.gscreen.layout = urwid.Frame(
-            body, header=header, footer=footer, focus_part=focus_part
-        )
+        if kind is None:
+            self.view.gscreen.layout = urwid.Frame(
+                body, header=header, footer=footer, focus_part=focus_part
+            )
 
-        # self.control.app_control.body = body
+            # self.control.app_control.body = body
 
-        widget = urwid.Overlay(
-            urwid.LineBox(self.view.gscreen.layout),
-            self.control.app_control.body,
-            align=alignment.align,
-            width=size.width,
-            valign=alignment.valign,
-            height=size.height,
-        )
+            widget = urwid.Overlay(
+                urwid.LineBox(self.view.gscreen.layout),
+                self.control.app_control.body,
+                align=alignment.align,
+                width=size.width,
+                valign=alignment.valign,
+                height=size.height,
+            )
+        else:
+            layout, widget = self.control.app_control.dialogs.get(
+                ("dialog", kind), lambda: self._build_dialog(body, header, footer)
+            )
+            layout.body = body
+            layout.header = header
+            layout.footer = footer
+            layout.focus_position = focus_part
+            self.view.gscreen.layout = layout
+            widget.bottom_w = self.control.app_control.body
+            widget.set_overlay_parameters(
+                alignment.align, size.width, alignment.valign, size.height
+            )
 
         if getattr(self.control.app_control, "loop", None):
             self.control.app_control.loop.widget = widget
-            if not modal:
-                self.control.app_control.loop.draw_screen()
+
+    def _build_dialog(self, body, header, footer) -> Tuple[urwid.Frame, urwid.Overlay]:
+        """Build the Frame of a dialog and the Overlay showing it on the body."""
+        layout = urwid.Frame(body, header=header, footer=footer)
+        widget = urwid.Overlay(
+            urwid.LineBox(layout), self.control.app_control.body,
+            align=urwid.CENTER, width=10, valign=urwid.MIDDLE, height=10,
+        )
+        return layout, widget
@@ -0,0 +1,151 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the on-demand profiler of a running console"""
+import cProfile
+import functools
+import os
+import pstats
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cui.util
+
+PROFILE_DIR: str = "/run/grommunio-cui"
+PROFILE_TOP: int = 12
+
+
+class Profiler:
+    """
+    Profiles (cProfile and tracemalloc) only the sections run through it, like
+    handling events and rendering, so the idle time of the main loop does not
+    show up in the results. Memory is traced per section and the blocks a
+    section leaves allocated are summed up by allocation site. If tracemalloc
+    is traced by someone else already (f.e. PYTHONTRACEMALLOC), it is not
+    stopped and all blocks allocated while sampling are reported instead.
+    """
+
+    def __init__(self, top: int = PROFILE_TOP):
+        self.top = top
+        self._profile: Optional[cProfile.Profile] = None
+        self._depth: int = 0
+        self._own_tracemalloc: bool = False
+        self._memory: Dict[Tuple[str, int], List[int]] = {}
+        self._started: float = 0.0
+
+    @property
+    def active(self) -> bool:
+        """Return if the profiler is currently sampling."""
+        return self._profile is not None
+
+    def start(self):
+        """Start sampling the profiled sections."""
+        if self.active:
+            return
+        self._profile = cProfile.Profile()
+        self._depth = 0
+        self._own_tracemalloc = not tracemalloc.is_tracing()
+        self._memory = {}
+        self._started = time.monotonic()
+
+    def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) as profiled section (nested sections allowed)."""
+        if self._profile is None:
+            return func(*args, **kwargs)
+        self._depth += 1
+        if self._depth == 1:
+            if self._own_tracemalloc:
+                tracemalloc.start()
+            self._profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._depth -= 1
+            if self._depth == 0 and self._profile is not None:
+                self._profile.disable()
+                if self._own_tracemalloc:
+                    self._add_memory(tracemalloc.take_snapshot())
+                    tracemalloc.stop()
+
+    def _add_memory(self, snapshot: tracemalloc.Snapshot):
+        """Add the blocks left allocated by a section to their allocation sites."""
+        for stat in snapshot.statistics("lineno"):
+            frame = stat.traceback[0]
+            site = self._memory.setdefault((frame.filename, frame.lineno), [0, 0])
+            site[0] += stat.size
+            site[1] += stat.count
+
+    def wrap(self, func: Callable) -> Callable:
+        """Return func running as profiled section, f.e. MainLoop.draw_screen."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(func, *args, **kwargs)
+        return wrapper
+
+    def stop(self, tty: str = None) -> Tuple[str, List[str]]:
+        """
+        Stop sampling and write the results.
+
+        :param tty: The console name used in the file name.
+        :return: The written pstats file and the top-N summary lines.
+        """
+        if self._profile is None:
+            return "", []
+        profile, self._profile = self._profile, None
+        profile.disable()
+        duration = time.monotonic() - self._started
+        if self._own_tracemalloc:
+            memory = [(size, count, *site) for site, (size, count) in self._memory.items()]
+        else:
+            memory = [
+                (stat.size, stat.count, stat.traceback[0].filename, stat.traceback[0].lineno)
+                for stat in tracemalloc.take_snapshot().statistics("lineno")
+            ]
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        target = Path(cui.util.root_path(PROFILE_DIR)) / \
+            f"profile-{(tty or 'console').replace('/', '-')}-{stamp}.pstats"
+        try:
+            target.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            profile.dump_stats(target)
+        except OSError as err:
+            target = Path(f"{target} ({err.strerror})")
+        return str(target), self._summarize(profile, memory, duration)
+
+    def _summarize(
+            self, profile: cProfile.Profile, memory: List[Tuple[int, int, str, int]],
+            duration: float
+    ) -> List[str]:
+        """
+        Return the top-N functions by cumulative time and allocation sites.
+
+        :param memory: The size, count, file name and line of every allocation site.
+        """
+        stats = pstats.Stats(profile)
+        stats.sort_stats("cumulative")
+        lines = [f"{duration:.1f} s sampled, {stats.total_tt * 1000:.1f} ms profiled"]
+        for func in stats.fcn_list[:self.top]:
+            _, ncalls, _, cumtime, _ = stats.stats[func]
+            filename, lineno, name = func
+            lines.append(
+                f"{cumtime * 1000:9.1f} ms {ncalls:7d}x {name} "
+                f"({os.path.basename(filename)}:{lineno})"
+            )
+        if memory:
+            lines.append("")
+            for size, count, filename, lineno in sorted(memory, reverse=True)[:self.top // 2]:
+                lines.append(
+                    f"{size / 1024:9.1f} KiB {count:7d}x {os.path.basename(filename)}:{lineno}"
+                )
+        return lines
+
+
+def profiled(method: Callable) -> Callable:
+    """Decorate an application method to run as section of its profiler."""
+    @functools.wraps(method)
+    def wrapper(app, *args, **kwargs):
+        control = getattr(app, "control", None)
+        if control is None or not control.app_control.profiler.active:
+            return method(app, *args, **kwargs)
+        return control.app_control.profiler.run(method, app, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,75 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the render scheduler coalescing the screen updates"""
+import time
+from typing import Any, Callable, Dict, Optional, Set
+
+import urwid
+
+HEADER: str = "header"
+FOOTER: str = "footer"
+
+
+class RenderScheduler:
+    """
+    Coalesces the screen updates of one console. Handlers only mark regions
+    (like header and footer) dirty, the main loop draws once when it gets idle,
+    i.e. after all pending input has been handled, and refreshes the dirty
+    regions right before. An optional frame-rate cap delays draws coming in too
+    fast (f.e. the clock tick or a held key on a slow console).
+    """
+
+    def __init__(self, max_fps: float = 0):
+        self.loop: Optional[urwid.MainLoop] = None
+        self.refreshers: Dict[str, Callable] = {}
+        self.dirty: Set[str] = set()
+        self.frames: int = 0
+        self.min_interval: float = 0.0
+        self._draw: Optional[Callable] = None
+        self._last: float = 0.0
+        self._alarm: Any = None
+        self.set_max_fps(max_fps)
+
+    def set_max_fps(self, max_fps: float):
+        """Cap the drawn frames per second (0 = no cap)."""
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+
+    def install(self, loop: urwid.MainLoop):
+        """Let loop draw through the scheduler when getting idle."""
+        self.loop = loop
+        self._draw = loop.draw_screen
+        loop.draw_screen = self.draw
+
+    def set_refresher(self, region: str, func: Callable):
+        """Set the function refreshing region before it is drawn."""
+        self.refreshers[region] = func
+
+    def mark_dirty(self, region: str):
+        """Mark region to be refreshed with the next frame."""
+        self.dirty.add(region)
+
+    def draw(self):
+        """Draw the screen unless the frame-rate cap defers it. Run on idle."""
+        if self._alarm is not None:
+            return
+        wait = self._last + self.min_interval - time.monotonic()
+        if wait > 0 and self.loop is not None:
+            # the loop gets idle (and draws) again after the alarm
+            self._alarm = self.loop.set_alarm_in(wait, self._deferred)
+            return
+        self.flush()
+
+    def _deferred(self, *_args):
+        """End the deferral, the following idle draws the frame."""
+        self._alarm = None
+
+    def flush(self):
+        """Refresh the dirty regions and draw the screen now."""
+        dirty, self.dirty = self.dirty, set()
+        for region, func in self.refreshers.items():
+            if region in dirty:
+                func()
+        if self._draw is not None:
+            self._last = time.monotonic()
+            self.frames += 1
+            self._draw()
@@ -0,0 +1,423 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""
+The module contains the check of the repository credentials, the download of
+its key and the refresh of changed repositories
+"""
+import configparser
+import hashlib
+import marshal
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+import urwid
+
+import cui.util
+from cui.classes.runner import runner
+from cui.classes.translation import N_
+from cui.classes.worker import ProgressPipe, run_in_background
+
+# The download server, f.e. a local stand-in server for the benchmarks
+REPO_SERVER: str = os.environ.get("GROMMUNIO_CUI_REPO_SERVER", "https://download.grommunio.com")
+# Connect and read timeout (in seconds) of a check
+REPO_CHECK_TIMEOUT: Tuple[float, float] = (5.0, 15.0)
+# Seconds the answer of the server to some credentials is kept
+REPO_CHECK_TTL: float = 60.0
+# The key the repository is signed with, kept to revalidate it by ETag and Last-Modified
+KEY_URL: str = f"{REPO_SERVER}/RPM-GPG-KEY-grommunio"
+KEY_CACHE_FILE: str = "/var/cache/grommunio-cui/RPM-GPG-KEY-grommunio"
+KEY_CACHE_VERSION: int = 1
+# Connect and read timeout (in seconds) of the key download
+KEY_TIMEOUT: Tuple[float, float] = (5.0, 60.0)
+KEY_CHUNK_SIZE: int = 16384
+# The repository files of zypper
+REPO_DIR: str = "/etc/zypp/repos.d"
+# Share of the overall progress (in percent) of fetching and importing the key
+# and refreshing the changed repositories
+REPO_UPDATE_SHARES: Tuple[int, int, int] = (40, 20, 40)
+# Timeouts (in seconds) of the key import and the refresh
+KEY_IMPORT_TIMEOUT: float = 120.0
+REFRESH_TIMEOUT: float = 600.0
+
+# The sections of the repository files by file, f.e. {"grommunio.repo": {"grommunio": {...}}}
+RepoFiles = Dict[str, Dict[str, Dict[str, str]]]
+
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return the session shared by all requests to the download server, created on first use."""
+    global _SESSION  # pylint: disable=global-statement
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = requests.Session()
+        return _SESSION
+
+
+def get_check_url() -> str:
+    """Return the url of a file of the "supported" repository, requiring credentials."""
+    return f"{REPO_SERVER}/supported/openSUSE_Leap_{cui.util.get_distribution_level()}" \
+           f"/repodata/repomd.xml"
+
+
+class RepoCheck:
+    """The outcome of one credentials check."""
+
+    def __init__(self, status: Optional[int] = None, error: str = ""):
+        self.status = status
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """Return if the server has accepted the credentials."""
+        return self.status == 200
+
+
+class PendingCheck:
+    """A running check, its callback is not called after it has been canceled."""
+
+    def __init__(self, callback: Callable[[RepoCheck], None]):
+        self.callback = callback
+        self.canceled: bool = False
+        self.done: bool = False
+
+    def cancel(self):
+        """Drop the outcome of the check (the request itself ends by its timeout)."""
+        self.canceled = True
+
+    def finish(self, result: RepoCheck):
+        """Hand the outcome over to the callback unless canceled."""
+        self.done = True
+        if not self.canceled:
+            self.callback(result)
+
+
+class RepoChecker:
+    """
+    Checks credentials of the repositories by fetching a file with them.
+    All checks share one session (and so its connections) and time out,
+    the answers of the server are kept for a short time by a hash of url and
+    credentials, so saving the same selection again does not ask again.
+    """
+
+    def __init__(
+            self, timeout: Tuple[float, float] = REPO_CHECK_TIMEOUT, ttl: float = REPO_CHECK_TTL
+    ):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.requests: int = 0
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[float, RepoCheck]] = {}
+
+    @staticmethod
+    def _key(url: str, user: str, password: str) -> str:
+        """Return the cache key of the credentials (not keeping them in memory)."""
+        return hashlib.sha256("\0".join([url, user, password]).encode("utf-8")).hexdigest()
+
+    def get_cached(self, url: str, user: str, password: str) -> Optional[RepoCheck]:
+        """Return the kept outcome of checking the credentials or None."""
+        with self._lock:
+            cached = self._cache.get(self._key(url, user, password))
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        return None
+
+    def check(self, url: str, user: str, password: str) -> RepoCheck:
+        """
+        Return if the server accepts the credentials for url (blocking).
+
+        :param url: The url of a file only accessible with valid credentials.
+        :param user: The username.
+        :param password: The password.
+        """
+        result = self.get_cached(url, user, password)
+        if result is not None:
+            return result
+        self.requests += 1
+        try:
+            response = get_session().get(url, auth=(user, password), timeout=self.timeout)
+            result = RepoCheck(response.status_code)
+        except requests.RequestException as err:
+            # not kept, the network may be back with the next try
+            return RepoCheck(error=str(err))
+        with self._lock:
+            self._cache[self._key(url, user, password)] = (time.monotonic(), result)
+        return result
+
+    def check_async(
+            self, loop: urwid.MainLoop, url: str, user: str, password: str,
+            callback: Callable[[RepoCheck], None]
+    ) -> PendingCheck:
+        """
+        Check the credentials in the background and call callback(result) on
+        the loop. A kept outcome is handed over right away.
+
+        :return: The pending check, f.e. to cancel it.
+        """
+        pending = PendingCheck(callback)
+        result = self.get_cached(url, user, password)
+        if result is not None:
+            pending.finish(result)
+            return pending
+
+        def done(result: RepoCheck, error: Exception):
+            pending.finish(result if error is None else RepoCheck(error=str(error)))
+
+        run_in_background(loop, self.check, done, url, user, password)
+        return pending
+
+    def clear(self):
+        """Forget all kept outcomes."""
+        with self._lock:
+            self._cache.clear()
+
+
+class KeyFetch:
+    """The outcome of one key download."""
+
+    def __init__(self, path: str = "", downloaded: bool = False, size: int = 0, error: str = ""):
+        self.path = path
+        self.downloaded = downloaded
+        self.size = size
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """Return if the key is there (downloaded or unchanged)."""
+        return bool(self.path) and not self.error
+
+
+class KeyFetcher:
+    """
+    Downloads the key of the repository into the cache file, streamed in
+    chunks so the progress is known byte by byte. The ETag and
+    Last-Modified of the download are kept beside it and sent along with the
+    next download, the server answers with 304 (and no key) if unchanged.
+    """
+
+    def __init__(self, file: str = KEY_CACHE_FILE, timeout: Tuple[float, float] = KEY_TIMEOUT):
+        self.file = file
+        self.timeout = timeout
+        self.downloads: int = 0
+        self.revalidations: int = 0
+
+    def _meta_file(self) -> Path:
+        """Return the file keeping ETag and Last-Modified of the cached key."""
+        target = Path(cui.util.root_path(self.file))
+        return target.with_name(f"{target.name}.meta")
+
+    def _load_meta(self) -> Optional[Dict[str, Any]]:
+        """Return the kept ETag and Last-Modified of the cached key or None."""
+        try:
+            with open(self._meta_file(), "rb") as file_handle:
+                data = marshal.load(file_handle)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != KEY_CACHE_VERSION:
+            return None
+        return data
+
+    def _save_meta(self, data: Dict[str, Any]):
+        """Save ETag and Last-Modified atomically (a lost one only costs a download)."""
+        target = self._meta_file()
+        tmp = target.with_name(f".{target.name}.{os.getpid()}")
+        try:
+            with open(tmp, "wb") as file_handle:
+                marshal.dump(dict(data, version=KEY_CACHE_VERSION), file_handle)
+            os.replace(tmp, target)
+        except (OSError, ValueError):
+            if tmp.exists():
+                tmp.unlink()
+
+    def fetch(self, url: str = KEY_URL, progress: Callable[[int, int], None] = None) -> KeyFetch:
+        """
+        Return the cached key, downloading it if changed (blocking).
+
+        :param url: The url of the key.
+        :param progress: Is called with the received and the total bytes (0 if
+            unknown) while downloading.
+        """
+        target = Path(cui.util.root_path(self.file))
+        meta = self._load_meta()
+        headers: Dict[str, str] = {}
+        if meta and meta.get("url") == url and target.exists():
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        tmp = target.with_name(f".{target.name}.{os.getpid()}")
+        try:
+            with get_session().get(
+                    url, headers=headers, timeout=self.timeout, stream=True
+            ) as response:
+                if response.status_code == 304 and headers:
+                    self.revalidations += 1
+                    size = target.stat().st_size
+                    if progress:
+                        progress(size, size)
+                    return KeyFetch(str(target), size=size)
+                if response.status_code != 200:
+                    return KeyFetch(error=f"HTTP {response.status_code}")
+                self.downloads += 1
+                total = int(response.headers.get("Content-Length") or 0)
+                received = 0
+                target.parent.mkdir(parents=True, exist_ok=True)
+                with open(tmp, "wb") as file_handle:
+                    for chunk in response.iter_content(KEY_CHUNK_SIZE):
+                        file_handle.write(chunk)
+                        received += len(chunk)
+                        if progress:
+                            progress(received, total)
+                os.replace(tmp, target)
+                self._save_meta({
+                    "url": url,
+                    "etag": response.headers.get("ETag", ""),
+                    "last_modified": response.headers.get("Last-Modified", ""),
+                })
+                return KeyFetch(str(target), downloaded=True, size=received)
+        except (requests.RequestException, OSError, ValueError) as err:
+            if tmp.exists():
+                tmp.unlink()
+            return KeyFetch(error=str(err))
+
+
+def read_repo_files(directory: str = REPO_DIR) -> RepoFiles:
+    """Return the sections of all repository files in directory (below the root prefix)."""
+    files: RepoFiles = {}
+    try:
+        paths = sorted(Path(cui.util.root_path(directory)).glob("*.repo"))
+    except OSError:
+        return files
+    for path in paths:
+        config = configparser.ConfigParser(interpolation=None, strict=False)
+        try:
+            config.read(path, encoding="utf-8")
+        except (OSError, UnicodeDecodeError, configparser.Error):
+            # compared as unreadable, so any readable content counts as change
+            files[path.name] = {}
+            continue
+        files[path.name] = {
+            alias: dict(config.items(alias, raw=True)) for alias in config.sections()
+        }
+    return files
+
+
+def get_changed_repos(before: RepoFiles, after: RepoFiles) -> List[str]:
+    """Return the aliases of the enabled repositories added or changed from before to after."""
+    old = {alias: section for sections in before.values() for alias, section in sections.items()}
+    return sorted(
+        alias
+        for sections in after.values()
+        for alias, section in sections.items()
+        if old.get(alias) != section and section.get("enabled", "1").strip() != "0"
+    )
+
+
+class RepoUpdateStep:
+    """One step of applying a changed repository selection."""
+
+    def __init__(self, title: str):
+        self.title = title
+        # None as long as not run
+        self.ok: Optional[bool] = None
+        self.error: str = ""
+
+
+class RepoUpdate:
+    """
+    Applies a changed repository selection in the background, one step after
+    another until one fails: fetches the key (see KeyFetcher), imports it
+    and refreshes only the repositories whose files have changed (instead of
+    all configured ones, which takes long with several remote repositories).
+    """
+
+    def __init__(self, aliases: List[str], keyurl: str = KEY_URL):
+        """
+        :param aliases: The aliases of the repositories to refresh (none skips the refresh).
+        :param keyurl: The url of the key.
+        """
+        self.aliases = aliases
+        self.keyurl = keyurl
+        self.steps: List[RepoUpdateStep] = [
+            RepoUpdateStep(N_("Fetching the key")),
+            RepoUpdateStep(N_("Importing the key")),
+            RepoUpdateStep(N_("Refreshing the changed repositories")),
+        ]
+        self.step: int = 0
+
+    @property
+    def ok(self) -> bool:
+        """Return if no step has failed."""
+        return all(step.ok is not False for step in self.steps)
+
+    def start(
+            self, loop: urwid.MainLoop, on_progress: Callable[["RepoUpdate", int], None],
+            on_done: Callable[["RepoUpdate"], None]
+    ):
+        """
+        Start the steps in the background.
+
+        :param loop: The main loop the callbacks are called on.
+        :param on_progress: Is called with the update and the overall percentage.
+        :param on_done: Is called with the update when all steps have run (or one has failed).
+        """
+        progress = ProgressPipe(loop, lambda done, _total: on_progress(self, done))
+
+        def done(_result, error: Exception):
+            progress.close()
+            if error is not None:
+                self.steps[self.step].ok = False
+                self.steps[self.step].error = str(error)
+            on_done(self)
+
+        run_in_background(loop, self._run, done, progress)
+
+    def _report(self, progress: ProgressPipe, step_percent: int = 0):
+        """Report the overall percentage of the running step at step_percent."""
+        done = sum(REPO_UPDATE_SHARES[:self.step])
+        progress.report(done + REPO_UPDATE_SHARES[self.step] * step_percent // 100, 100)
+
+    def _run(self, progress: ProgressPipe):
+        """Run the steps (in the background)."""
+        self._report(progress)
+
+        def downloading(received: int, total: int):
+            if total:
+                self._report(progress, 100 * min(received, total) // total)
+
+        fetched = key_fetcher.fetch(self.keyurl, downloading)
+        if not self._finish(fetched.ok, fetched.error):
+            return
+        self.step = 1
+        self._report(progress)
+        result = runner.run(["rpm", "--import", fetched.path], timeout=KEY_IMPORT_TIMEOUT)
+        if not self._finish(result.ok, result.error or result.stderr.strip()):
+            return
+        self.step = 2
+        self._report(progress)
+        if self.aliases:
+            result = runner.run(
+                ["zypper", "--non-interactive", "--gpg-auto-import-keys", "refresh"]
+                + self.aliases,
+                timeout=REFRESH_TIMEOUT,
+            )
+            if not self._finish(result.ok, result.error or result.stderr.strip()):
+                return
+        else:
+            self._finish(True)
+        self._report(progress, 100)
+
+    def _finish(self, ok: bool, error: str = "") -> bool:
+        """Set the outcome of the running step, return ok."""
+        self.steps[self.step].ok = ok
+        self.steps[self.step].error = "" if ok else error
+        return ok
+
+
+repo_checker: RepoChecker = RepoChecker()
+key_fetcher: KeyFetcher = KeyFetcher()
@@ -0,0 +1,277 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the runner every external command is started with"""
+import contextlib
+import errno
+import os
+import pty
+import select
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, IO, List, Optional, Sequence
+
+import urwid
+
+from cui.classes.worker import run_in_background
+
+# Default timeout (in seconds) of non-interactive commands
+TIMEOUT: float = 30.0
+# Number of non-interactive commands running in the background at the same time
+MAX_CONCURRENT: int = 4
+
+
+class CommandResult:
+    """The outcome of one command."""
+
+    def __init__(self, args: Sequence[str]):
+        self.args: List[str] = list(args)
+        self.returncode: Optional[int] = None
+        self.stdout: str = ""
+        self.stderr: str = ""
+        self.duration: float = 0.0
+        self.timed_out: bool = False
+        self.error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        """Return if the command has run successfully."""
+        return self.returncode == 0
+
+
+class CommandMetrics:
+    """The accumulated metrics of all runs of one command."""
+
+    def __init__(self):
+        self.calls: int = 0
+        self.failures: int = 0
+        self.timeouts: int = 0
+        self.wall_time: float = 0.0
+        self.max_wall_time: float = 0.0
+        self.last_returncode: Optional[int] = None
+
+    def add(self, result: CommandResult):
+        """Account the result of one run."""
+        self.calls += 1
+        self.failures += 0 if result.ok else 1
+        self.timeouts += 1 if result.timed_out else 0
+        self.wall_time += result.duration
+        self.max_wall_time = max(self.max_wall_time, result.duration)
+        self.last_returncode = result.returncode
+
+
+def _kill(proc: subprocess.Popen):
+    """Kill the process group of proc, so no child keeps the output open."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        proc.kill()
+
+
+class CommandRunner:
+    """
+    Runs external commands with timeouts and accounts wall time and exit codes
+    per command. Commands run by background threads share a limited number of
+    slots, the UI (main) thread never waits for one, so long background jobs
+    cannot freeze the input. Commands can run blocking, in the background
+    (completing by callback on the urwid loop) or interactively on the
+    console. The tools in embedded terminals (see cui.classes.session) are
+    spawned by urwid.Terminal, which keeps their exit code to itself, so they
+    are not accounted here.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT):
+        self.metrics: Dict[str, CommandMetrics] = {}
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+
+    def _account(self, result: CommandResult):
+        """Add result to the metrics of its command."""
+        name = Path(result.args[0]).name if result.args else ""
+        with self._lock:
+            self.metrics.setdefault(name, CommandMetrics()).add(result)
+
+    def _slot(self):
+        """Return the slot to run a command in, none on the UI (main) thread."""
+        if threading.current_thread() is threading.main_thread():
+            return contextlib.nullcontext()
+        return self._slots
+
+    def run(
+            self,
+            args: Sequence[str],
+            timeout: Optional[float] = TIMEOUT,
+            stdin: str = None,
+            use_pty: bool = False,
+            on_output: Callable[[bytes], Any] = None,
+    ) -> CommandResult:
+        """
+        Run a command and wait for it (at most timeout seconds).
+
+        :param args: The command and its arguments.
+        :param timeout: Seconds after which the command is killed (None = no limit).
+        :param stdin: Text written to the standard input of the command.
+        :param use_pty: Run the command on a pseudo terminal (f.e. for progress output).
+        :param on_output: Is called with each chunk of the standard output as it
+            arrives (which is not kept in the result then), f.e. to parse progress.
+        :return: The result. A command that could not be started has no returncode.
+        """
+        result = CommandResult(args)
+        with self._slot():
+            start = time.monotonic()
+            try:
+                if use_pty:
+                    self._run_pty(result, timeout)
+                elif on_output is not None:
+                    self._run_stream(result, timeout, on_output)
+                else:
+                    self._run_pipe(result, timeout, stdin)
+            except OSError as err:
+                result.error = err.strerror or str(err)
+            result.duration = time.monotonic() - start
+        self._account(result)
+        return result
+
+    @staticmethod
+    def _run_pipe(result: CommandResult, timeout: Optional[float], stdin: Optional[str]):
+        """Run the command with pipes."""
+        with subprocess.Popen(
+            result.args,
+            stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        ) as proc:
+            try:
+                out, err = proc.communicate(
+                    stdin.encode() if stdin is not None else None, timeout=timeout
+                )
+            except subprocess.TimeoutExpired:
+                _kill(proc)
+                out, err = proc.communicate()
+                result.timed_out = True
+            result.returncode = None if result.timed_out else proc.returncode
+        result.stdout = out.decode(errors="replace")
+        result.stderr = err.decode(errors="replace")
+
+    @staticmethod
+    def _run_stream(
+            result: CommandResult, timeout: Optional[float], on_output: Callable[[bytes], Any]
+    ):
+        """Run the command with pipes, handing the standard output over chunk by chunk."""
+        with subprocess.Popen(
+            result.args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        ) as proc:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            streams = {proc.stdout.fileno(): on_output, proc.stderr.fileno(): None}
+            errors: List[bytes] = []
+            while streams:
+                wait = None if deadline is None else deadline - time.monotonic()
+                if wait is not None and wait <= 0:
+                    _kill(proc)
+                    result.timed_out = True
+                    break
+                readable, _, _ = select.select(list(streams), [], [], wait)
+                for file_descriptor in readable:
+                    data = os.read(file_descriptor, 65536)
+                    if not data:
+                        del streams[file_descriptor]
+                    elif streams[file_descriptor] is None:
+                        errors.append(data)
+                    else:
+                        on_output(data)
+            proc.wait()
+            result.returncode = None if result.timed_out else proc.returncode
+        result.stderr = b"".join(errors).decode(errors="replace")
+
+    @staticmethod
+    def _run_pty(result: CommandResult, timeout: Optional[float]):
+        """Run the command on a pseudo terminal, stdout contains all output."""
+        master, slave = pty.openpty()
+        try:
+            proc = subprocess.Popen(  # pylint: disable=consider-using-with
+                result.args, stdin=slave, stdout=slave, stderr=slave, start_new_session=True
+            )
+        finally:
+            os.close(slave)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        chunks: List[bytes] = []
+        try:
+            while True:
+                wait = None if deadline is None else deadline - time.monotonic()
+                if wait is not None and wait <= 0:
+                    _kill(proc)
+                    result.timed_out = True
+                    break
+                readable, _, _ = select.select([master], [], [], wait)
+                if not readable:
+                    continue
+                try:
+                    data = os.read(master, 4096)
+                except OSError as err:
+                    # EIO signals the end of the output on Linux
+                    if err.errno != errno.EIO:
+                        raise
+                    data = b""
+                if not data:
+                    break
+                chunks.append(data)
+        finally:
+            os.close(master)
+            proc.wait()
+        result.returncode = None if result.timed_out else proc.returncode
+        result.stdout = b"".join(chunks).decode(errors="replace")
+
+    def run_async(
+            self,
+            loop: urwid.MainLoop,
+            args: Sequence[str],
+            callback: Callable[[CommandResult], Any] = None,
+            **kwargs,
+    ):
+        """
+        Run a command in the background, so it does not block any input.
+
+        :param loop: The main loop the callback is called on.
+        :param args: The command and its arguments.
+        :param callback: Is called with the CommandResult on the loop when done.
+        :param kwargs: The options of run().
+        """
+        def done(result: CommandResult, error: Exception):
+            if error is not None:
+                result = CommandResult(args)
+                result.error = str(error)
+            if callback is not None:
+                callback(result)
+
+        run_in_background(loop, lambda: self.run(args, **kwargs), done)
+
+    def run_interactive(self, args: Sequence[str], console: Sequence[IO] = ()) -> CommandResult:
+        """
+        Run a command interactively on the console (f.e. su, yast2, zypper up)
+        and wait for it without timeout. The caller stops the urwid screen before.
+
+        :param args: The command and its arguments.
+        :param console: The (input, output) files of the console, the ones of the
+            process if empty.
+        :return: The result, the output went to the console.
+        """
+        result = CommandResult(args)
+        stdin, stdout = console if console else (None, None)
+        start = time.monotonic()
+        try:
+            result.returncode = subprocess.call(args, stdin=stdin, stdout=stdout, stderr=stdout)
+        except OSError as err:
+            result.error = err.strerror or str(err)
+        result.duration = time.monotonic() - start
+        self._account(result)
+        return result
+
+
+runner: CommandRunner = CommandRunner()
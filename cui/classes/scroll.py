@@ -1,8 +1,11 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 # SPDX-FileCopyrightText: 2021 grommunio GmbH
 """This module contains Scrollable widgets"""
+import bisect
+from typing import Any, Dict, List, Set, Tuple
+
 import urwid
-from urwid.widget import BOX, FIXED, FLOW
+from urwid.widget import BOX, FIXED, FLOW, GIVEN
 
 # Scroll actions
 SCROLL_LINE_UP = "line up"
@@ -16,6 +19,149 @@ SCROLL_TO_END = "to end"
 SCROLLBAR_LEFT = "left"
 SCROLLBAR_RIGHT = "right"
 
+# Sizes the row heights are kept for (f.e. with and without scrollbar)
+ROW_INDEX_SIZES = 4
+
+
+def is_canvas_cached(canvas):
+    """Return if canvas is still in urwid's canvas cache, i.e. if neither its
+    widget nor any widget below has been invalidated since it was rendered"""
+    if canvas is None or not canvas.widget_info:
+        return False
+    widget, size, focus = canvas.widget_info
+    # The cache is keyed by the class whose render method has been wrapped
+    for wcls in type(widget).__mro__:
+        if "render" in wcls.__dict__:
+            return urwid.CanvasCache.fetch(widget, wcls, size, focus) is canvas
+    return False
+
+
+class RowIndex:
+    """
+    The row heights of the children of a Pile at one size (a width or fixed)
+    with their prefix sums. Text children are only measured again if their
+    text has changed, all other children on every update. Read-only children
+    able to estimate their rows (like GLine) are not measured at a width but
+    estimated, until they are rendered and `set_rows` corrects them. `checked`
+    is the canvas the heights are known to be valid for.
+    """
+
+    def __init__(self, ow_size: Tuple[int, ...]):
+        self.ow_size = ow_size
+        self.checked = None
+        self.estimable = False
+        self._contents: List[Tuple[Any, Any]] = []
+        self._entries: List[Tuple[Any, Any]] = []
+        self._heights: List[int] = []
+        self._estimated: Set[int] = set()
+        self._prefix: List[int] = [0]
+        self._first_dirty: int = 0
+
+    @staticmethod
+    def _signature(widget: urwid.Widget) -> Any:
+        """Return what the height of widget depends on besides the width (None = unknown)."""
+        get_text = getattr(widget.base_widget, "get_text", None)
+        return get_text() if get_text is not None else None
+
+    def is_current(self, contents: List[Tuple[urwid.Widget, Tuple[Any, Any]]]) -> bool:
+        """Return if contents are the same children with the same options as on the last update."""
+        return self._contents == contents
+
+    def update(self, contents: List[Tuple[urwid.Widget, Tuple[Any, Any]]]) -> int:
+        """
+        Measure (or estimate) the changed children and return the total number of rows.
+
+        :param contents: The contents of the Pile.
+        """
+        if self.estimable and self._contents == contents:
+            # Only the same read-only children, nothing to measure
+            return self.rows
+        first_changed = len(contents)
+        del self._entries[len(contents):]
+        del self._heights[len(contents):]
+        self._estimated = {idx for idx in self._estimated if idx < len(contents)}
+        # Estimates only at a width, a fixed size needs no wrapping
+        estimable = len(self.ow_size) == 1
+        for idx, (widget, (height_type, height)) in enumerate(contents):
+            estimate_rows = getattr(widget, "estimate_rows", None) if estimable else None
+            if estimate_rows is None or height_type == GIVEN:
+                estimate_rows = None
+                estimable = False
+            signature = widget if estimate_rows is not None else self._signature(widget)
+            if idx < len(self._entries):
+                old_widget, old_signature = self._entries[idx]
+                if old_widget is widget and signature is not None and old_signature == signature:
+                    continue
+            if height_type == GIVEN:
+                rows = height
+            elif estimate_rows is not None:
+                rows = estimate_rows(self.ow_size)
+                self._estimated.add(idx)
+            else:
+                rows = self._measure(widget)
+            if idx < len(self._entries):
+                self._entries[idx] = (widget, signature)
+                if self._heights[idx] == rows:
+                    continue
+                self._heights[idx] = rows
+            else:
+                self._entries.append((widget, signature))
+                self._heights.append(rows)
+            first_changed = min(first_changed, idx)
+        if not estimable:
+            # Between other children the heights have to match the full canvas
+            for idx in sorted(self._estimated):
+                self.set_rows(idx, self._measure(contents[idx][0]))
+        self.estimable = estimable
+        self._contents = list(contents)
+        self._first_dirty = min(self._first_dirty, first_changed)
+        if len(self._prefix) != len(self._heights) + 1:
+            self._first_dirty = min(self._first_dirty, len(self._prefix) - 1, len(self._heights))
+        return self.rows
+
+    def set_rows(self, position: int, rows: int):
+        """Set the (rendered) rows of child position, replacing an estimate."""
+        self._estimated.discard(position)
+        if self._heights[position] != rows:
+            self._heights[position] = rows
+            self._first_dirty = min(self._first_dirty, position)
+
+    def _sync(self):
+        """Update the prefix sums after the first changed child."""
+        start = self._first_dirty
+        if start >= len(self._heights) and len(self._prefix) == len(self._heights) + 1:
+            return
+        # Prefix sums before the first changed child stay valid
+        start = min(start, len(self._prefix) - 1)
+        del self._prefix[start + 1:]
+        total = self._prefix[start]
+        for rows in self._heights[start:]:
+            total += rows
+            self._prefix.append(total)
+        self._first_dirty = len(self._heights)
+
+    def _measure(self, widget: urwid.Widget) -> int:
+        """Return the rows of widget."""
+        if self.ow_size:
+            return widget.rows(self.ow_size)
+        return widget.pack(self.ow_size)[1]
+
+    @property
+    def rows(self) -> int:
+        """Return the total number of rows."""
+        self._sync()
+        return self._prefix[-1]
+
+    def get_row(self, position: int) -> int:
+        """Return the first row of child position."""
+        self._sync()
+        return self._prefix[position]
+
+    def get_position(self, row: int) -> int:
+        """Return the child position containing row."""
+        self._sync()
+        return max(0, min(len(self._heights) - 1, bisect.bisect_right(self._prefix, row) - 1))
+
 
 class Scrollable(urwid.WidgetDecoration):
     """The Scrollable class to create a urwid scrollable widget base."""
@@ -46,6 +192,11 @@ class Scrollable(urwid.WidgetDecoration):
         self._forward_keypress = None
         self._old_cursor_coords = None
         self._rows_max_cached = 0
+        self._canv_full = None
+        self._row_indexes: Dict[Tuple[int, ...], RowIndex] = {}
+        self._ow_sizing = None
+        self._ow_sizing_checked = None
+        self._lazy_index = None
         super().__init__(widget)
 
     def render(self, size, focus=False):
@@ -61,10 +212,20 @@ class Scrollable(urwid.WidgetDecoration):
 
         var = {"maxcol": size[0], "maxrow": size[1]}
 
-        # Render complete original widget
+        # Render complete original widget. Its canvas of the last render is
+        # kept, so urwid's canvas cache returns it again as long as the original
+        # widget is not invalidated and size and focus are unchanged (a scroll
+        # step then only trims it again).
         original_widget = self._original_widget
         var["ow_size"] = self._get_original_widget_size(size)
+        if isinstance(original_widget, urwid.Pile) and var["ow_size"]:
+            self.rows_max(size)
+            row_index = self._row_indexes[var["ow_size"]]
+            if row_index.estimable:
+                return self._render_lazy(size, focus, row_index)
+        self._lazy_index = None
         var["canv_full"] = original_widget.render(var["ow_size"], focus)
+        self._canv_full = var["canv_full"]
 
         # Make full canvas editable
         canv = urwid.CompositeCanvas(var["canv_full"])
@@ -88,7 +249,7 @@ class Scrollable(urwid.WidgetDecoration):
             # Canvas is small enough to fit without trimming
             return canv
 
-        self._adjust_trim_top(canv, size)
+        self._adjust_trim_top(canv_rows, canv.cursor, size)
 
         # Trim canvas if necessary
         trim_top = self._trim_top
@@ -129,6 +290,63 @@ class Scrollable(urwid.WidgetDecoration):
             self._forward_keypress = original_widget.selectable()
         return canv
 
+    def _render_lazy(self, size, focus, row_index):
+        """Render only the visible children of the wrapped Pile. The rows of
+        all others are estimated, so f.e. a resize does not wrap all of them.
+        Their canvas does not depend on the Pile, so it is not cached"""
+        maxcol, maxrow = size
+        original_widget = self._original_widget
+        contents = original_widget.contents
+        self._lazy_index = row_index
+        self._canv_full = None
+        self._forward_keypress = original_widget.selectable()
+        if not contents:
+            canv = urwid.CompositeCanvas(urwid.SolidCanvas(" ", maxcol, maxrow))
+            canv.cacheable = False
+            return canv
+        self._adjust_trim_top(row_index.rows, None, size)
+        focus_position = original_widget.focus_position
+        canvases = []
+
+        def render_child(position):
+            child_canv = contents[position][0].render(
+                row_index.ow_size, focus and position == focus_position
+            )
+            row_index.set_rows(position, child_canv.rows())
+            return child_canv, position, position == focus_position
+
+        # Render the children from the first visible row (at the end from the
+        # last child backwards), wrapping them corrects their estimated rows
+        if self._trim_top >= row_index.rows - maxrow:
+            first = last = len(contents)
+            skip = 0
+        else:
+            first = last = row_index.get_position(self._trim_top)
+            skip = self._trim_top - row_index.get_row(first)
+        rows = 0
+        while last < len(contents) and rows < skip + maxrow:
+            canvases.append(render_child(last))
+            rows += canvases[-1][0].rows()
+            last += 1
+        if rows < skip + maxrow:
+            # The end has been reached: show the last rows
+            while first > 0 and rows < maxrow:
+                first -= 1
+                canvases.insert(0, render_child(first))
+                rows += canvases[0][0].rows()
+            skip = max(0, rows - maxrow)
+        self._trim_top = row_index.get_row(first) + skip
+
+        canv = urwid.CanvasCombine(canvases)
+        if skip > 0:
+            canv.trim(skip)
+        if rows - skip > maxrow:
+            canv.trim_end(rows - skip - maxrow)
+        elif rows - skip < maxrow:
+            canv.pad_trim_top_bottom(0, maxrow - rows + skip)
+        canv.cacheable = False
+        return canv
+
     def keypress(self, size, key):
         """Handle key event while event is NOT a mouse event in the
         form size, event"""
@@ -173,20 +391,37 @@ class Scrollable(urwid.WidgetDecoration):
         """Handle mouse event while event is a mouse event in the
         form size, event, button, col, row, focus"""
         original_widget = self._original_widget
+        if self._lazy_index is not None:
+            return self._lazy_mouse_event(size, event, button, col, row + self._trim_top, focus)
         if hasattr(original_widget, "mouse_event"):
             ow_size = self._get_original_widget_size(size)
             row += self._trim_top
             return original_widget.mouse_event(ow_size, event, button, col, row, focus)
         return False
 
-    def _adjust_trim_top(self, canv, size):
+    # pylint: disable=too-many-arguments
+    # because mouse_event method on urwid is the same
+    def _lazy_mouse_event(self, size, event, button, col, row, focus):
+        """Pass a mouse event to the child at row of a lazily rendered Pile"""
+        row_index = self._row_indexes.get(self._get_original_widget_size(size))
+        contents = self._original_widget.contents
+        if row_index is None or row >= row_index.rows or not contents:
+            return False
+        position = row_index.get_position(row)
+        widget = contents[position][0]
+        if not hasattr(widget, "mouse_event"):
+            return False
+        return widget.mouse_event(
+            row_index.ow_size, event, button, col, row - row_index.get_row(position), focus
+        )
+
+    def _adjust_trim_top(self, canv_rows, cursor, size):
         """Adjust self._trim_top according to self._scroll_action"""
         action = self._scroll_action
         self._scroll_action = None
 
         var = {"maxcol": size[0], "maxrow": size[1]}
         trim_top = self._trim_top
-        canv_rows = canv.rows()
 
         if trim_top < 0:
             # Negative trim_top values use bottom of canvas as reference
@@ -223,18 +458,33 @@ class Scrollable(urwid.WidgetDecoration):
         # still scroll out
         if (
             self._old_cursor_coords is not None
-            and self._old_cursor_coords != canv.cursor
+            and cursor is not None
+            and self._old_cursor_coords != cursor
         ):
             self._old_cursor_coords = None
-            _, cursrow = canv.cursor
+            _, cursrow = cursor
             if cursrow < self._trim_top:
                 self._trim_top = cursrow
             elif cursrow >= self._trim_top + var["maxrow"]:
                 self._trim_top = max(0, cursrow - var["maxrow"] + 1)
 
+    def _get_original_widget_sizing(self):
+        """Return the sizing of the original widget. A Pile asks all children
+        for it (urwid >= 2.2), so it is kept while nothing has been invalidated
+        (or while a lazily rendered Pile has the same children)"""
+        lazy_index = self._lazy_index
+        if lazy_index is not None and self._ow_sizing is not None:
+            if lazy_index.is_current(self._original_widget.contents):
+                return self._ow_sizing
+            self._lazy_index = None
+        unchanged = is_canvas_cached(self._canv_full)
+        if not unchanged or self._ow_sizing_checked is not self._canv_full:
+            self._ow_sizing = self._original_widget.sizing()
+            self._ow_sizing_checked = self._canv_full if unchanged else None
+        return self._ow_sizing
+
     def _get_original_widget_size(self, size):
-        original_widget = self._original_widget
-        sizing = original_widget.sizing()
+        sizing = self._get_original_widget_sizing()
         if FIXED in sizing:
             return ()
         if FLOW in sizing:
@@ -262,15 +512,42 @@ class Scrollable(urwid.WidgetDecoration):
         self._trim_top = int(position)
         self._invalidate()
 
+    def _get_row_index(self, ow_size):
+        """Return the row index of the wrapped Pile for ow_size."""
+        row_index = self._row_indexes.get(ow_size)
+        if row_index is None:
+            if len(self._row_indexes) >= ROW_INDEX_SIZES:
+                del self._row_indexes[next(iter(self._row_indexes))]
+            row_index = self._row_indexes[ow_size] = RowIndex(ow_size)
+        return row_index
+
+    def scroll_to_position(self, size, position):
+        """Scroll child `position` of the wrapped Pile to the top"""
+        self.rows_max(size)
+        row_index = self._row_indexes.get(self._get_original_widget_size(size))
+        if row_index is not None:
+            self.set_scrollpos(row_index.get_row(position))
+
     def rows_max(self, size=None, focus=False):
         """Return the number of rows for `size`
         If `size` is not given, the currently rendered number of rows is returned.
+        The row heights of a wrapped Pile are kept per size. They are valid as
+        long as the full canvas of the last render is cached (nothing has been
+        invalidated since), otherwise only the changed children are measured
+        (or estimated, see RowIndex).
         """
         if size is not None:
             original_widget = self._original_widget
             ow_size = self._get_original_widget_size(size)
-            sizing = original_widget.sizing()
-            if FIXED in sizing:
+            sizing = self._get_original_widget_sizing()
+            if isinstance(original_widget, urwid.Pile) and ow_size is not None:
+                row_index = self._get_row_index(ow_size)
+                unchanged = is_canvas_cached(self._canv_full)
+                if not unchanged or row_index.checked is not self._canv_full:
+                    row_index.update(original_widget.contents)
+                    row_index.checked = self._canv_full if unchanged else None
+                self._rows_max_cached = row_index.rows
+            elif FIXED in sizing:
                 self._rows_max_cached = original_widget.pack(ow_size, focus)[1]
             elif FLOW in sizing:
                 self._rows_max_cached = original_widget.rows(ow_size, focus)
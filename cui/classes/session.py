@@ -0,0 +1,156 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the host of the tools running in embedded terminals"""
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import urwid
+
+from cui.classes.gwidgets import GText
+
+# The key releasing the terminal, the next key goes to the CUI (twice sends it to the tool)
+SESSION_ESCAPE: str = "ctrl a"
+
+
+class SessionTerminal(urwid.Terminal):
+    """
+    The terminal of a session. The signal keys of the console are disabled by
+    the CUI itself (on its own tty), so they are not switched on focus changes.
+    """
+
+    def render(self, size: Tuple[int, int], focus: bool = False) -> urwid.Canvas:
+        if self.terminated and self.term is not None and (self.width, self.height) != size:
+            # the output of an exited tool is still shown, f.e. after a resize
+            self.width, self.height = size
+            self.term.resize(*size)
+        return super().render(size, focus)
+
+    def change_focus(self, has_focus: bool):
+        if self.terminated:
+            return
+        self.has_focus = has_focus
+        if self.term is not None:
+            self.term.has_focus = has_focus
+            self.term.set_term_cursor()
+
+
+class Session:
+    """
+    One tool (f.e. `yast2 lan` or `su -l`) running in an embedded terminal.
+    It keeps running while other windows are shown, and the terminal keeps
+    the output (incl. the scrollback) after the tool has exited.
+    """
+
+    def __init__(
+            self, name: str, args: Sequence[str], title: str, event_loop: urwid.EventLoop,
+            on_closed: Callable[["Session"], None] = None
+    ):
+        """
+        :param name: The name the session is found by, f.e. "yast2 lan".
+        :param args: The command and its arguments.
+        :param title: The title of the terminal.
+        :param event_loop: The event loop the output of the tool is read on.
+        :param on_closed: Is called with the session when the tool has exited.
+        """
+        self.name = name
+        self.args: List[str] = list(args)
+        self.title = title
+        self.started: float = time.monotonic()
+        self.finished: Optional[float] = None
+        self._on_closed = on_closed
+        self.terminal = SessionTerminal(
+            self.args, main_loop=event_loop, escape_sequence=SESSION_ESCAPE
+        )
+        # all keys go to the tool until the escape key releases the terminal
+        self.terminal.keygrab = True
+        urwid.connect_signal(self.terminal, "closed", self._closed)
+        self.hint = GText("", urwid.CENTER)
+        self.widget = urwid.Frame(
+            urwid.LineBox(self.terminal, title=title),
+            header=urwid.AttrMap(self.hint, "header"),
+        )
+
+    @property
+    def running(self) -> bool:
+        """Return if the tool is still running."""
+        return self.finished is None
+
+    def set_hint(self, text: str):
+        """Set the text shown above the terminal."""
+        self.hint.set_text(text)
+
+    def grab(self):
+        """Send the keys to the tool again (after the escape key released the terminal)."""
+        if self.running:
+            self.terminal.keygrab = True
+
+    def scroll(self, up: bool = True):
+        """Scroll the output back (up) or forth, like the terminal does on page up/down."""
+        if self.terminal.term is not None:
+            self.terminal.term.scroll_buffer(up=up)
+            self.terminal._invalidate()  # pylint: disable=protected-access
+
+    def _closed(self, *_args):
+        """Note the exit of the tool."""
+        self.finished = time.monotonic()
+        if self._on_closed is not None:
+            self._on_closed(self)
+
+    def terminate(self):
+        """Kill the tool (if still running)."""
+        if self.running:
+            # spawned with the first render
+            if self.terminal.pid is not None:
+                self.terminal.terminate()
+            self.finished = time.monotonic()
+
+
+class SessionHost:
+    """
+    The sessions of one console. A tool is started once, opening it again
+    while it runs shows the running session.
+    """
+
+    def __init__(self):
+        self.sessions: Dict[str, Session] = {}
+        self.last: Optional[str] = None
+
+    def open(
+            self, name: str, args: Sequence[str], title: str, event_loop: urwid.EventLoop,
+            on_closed: Callable[[Session], None] = None
+    ) -> Session:
+        """
+        Return the session name, started if not running.
+
+        :param name: The name the session is found by.
+        :param args: The command and its arguments.
+        :param title: The title of the terminal.
+        :param event_loop: The event loop the output of the tool is read on.
+        :param on_closed: Is called with the session when the tool has exited.
+        """
+        session = self.sessions.get(name)
+        if session is None or not session.running:
+            session = self.sessions[name] = Session(name, args, title, event_loop, on_closed)
+        self.last = name
+        return session
+
+    def get_last(self) -> Optional[Session]:
+        """Return the last opened session (running or not) or None."""
+        return self.sessions.get(self.last) if self.last else None
+
+    def get_running(self) -> List[Session]:
+        """Return the running sessions."""
+        return [session for session in self.sessions.values() if session.running]
+
+    def close(self, name: str):
+        """Forget the session name, killing its tool if still running."""
+        session = self.sessions.pop(name, None)
+        if session is not None:
+            session.terminate()
+        if self.last == name:
+            self.last = None
+
+    def terminate_all(self):
+        """Kill all running tools, f.e. when the console is left."""
+        for name in list(self.sessions):
+            self.close(name)
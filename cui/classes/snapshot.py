@@ -0,0 +1,53 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the warm-start snapshot of the main screen"""
+import marshal
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+import cui.util
+
+SNAPSHOT_DIR: str = "/run/grommunio-cui"
+SNAPSHOT_FILE: str = f"{SNAPSHOT_DIR}/state"
+SNAPSHOT_VERSION: int = 1
+
+
+def load_snapshot(file: str = None) -> Dict[str, Any]:
+    """
+    Return the last saved main-screen data or an empty dict if there is none
+    (or it has been written by another version).
+    """
+    if file is None:
+        file = cui.util.root_path(SNAPSHOT_FILE)
+    try:
+        with open(file, "rb") as file_handle:
+            data = marshal.load(file_handle)
+    except (OSError, EOFError, ValueError, TypeError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        return {}
+    return data
+
+
+def save_snapshot(data: Dict[str, Any], file: str = None) -> bool:
+    """
+    Save the main-screen data atomically, so a starting CUI never reads a
+    partial snapshot.
+
+    :param data: The data to save. It must only contain marshal-able types.
+    :param file: The snapshot file. SNAPSHOT_FILE (below the root prefix) if None.
+    :return: True on success, False if not.
+    """
+    target = Path(cui.util.root_path(SNAPSHOT_FILE) if file is None else file)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}")
+    try:
+        target.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with open(tmp, "wb") as file_handle:
+            marshal.dump(dict(data, version=SNAPSHOT_VERSION), file_handle)
+        os.replace(tmp, target)
+    except (OSError, ValueError):
+        if tmp.exists():
+            tmp.unlink()
+        return False
+    return True
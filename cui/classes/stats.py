@@ -0,0 +1,116 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the frame timing and cache statistics of the debug footer"""
+import collections
+import functools
+import sys
+import time
+from typing import Callable, Deque, Dict
+
+import urwid
+
+# Spawned subprocesses of this process (monotonic timestamps of the last minute)
+_SPAWNS: Deque[float] = collections.deque()
+_SPAWN_EVENTS = ("subprocess.Popen", "os.system", "os.posix_spawn")
+_counting: Dict[str, bool] = {"installed": False, "enabled": False}
+
+
+def _audit_spawn(event: str, _args):
+    """Audit hook remembering spawned subprocesses while counting is enabled."""
+    if _counting["enabled"] and event in _SPAWN_EVENTS:
+        _SPAWNS.append(time.monotonic())
+
+
+def count_spawns(enabled: bool):
+    """Enable or disable counting the spawned subprocesses (Python 3.8+)."""
+    _counting["enabled"] = enabled
+    if enabled and not _counting["installed"] and hasattr(sys, "addaudithook"):
+        sys.addaudithook(_audit_spawn)
+        _counting["installed"] = True
+
+
+def get_spawns_per_minute() -> int:
+    """Return the number of subprocesses spawned in the last minute."""
+    limit = time.monotonic() - 60
+    while _SPAWNS and _SPAWNS[0] < limit:
+        _SPAWNS.popleft()
+    return len(_SPAWNS)
+
+
+def get_canvas_cache_hit_rate() -> float:
+    """Return the hit rate of the urwid canvas cache in percent."""
+    fetches = getattr(urwid.CanvasCache, "fetches", 0)
+    return 100.0 * getattr(urwid.CanvasCache, "hits", 0) / fetches if fetches else 0.0
+
+
+class FrameStats:
+    """
+    Timings of one console shown in the debug footer. Nothing is measured while
+    debug mode is off, the instrumented calls only check the enabled flag.
+    """
+
+    def __init__(self):
+        self.enabled: bool = False
+        self.durations: Dict[str, float] = {"render": 0.0, "event": 0.0, "tick": 0.0}
+        self.journal_entries: int = 0
+        # Handled events (incl. follow-up events) of the last and the busiest input
+        self.input_events: int = 0
+        self.max_input_events: int = 0
+
+    def set_enabled(self, enabled: bool):
+        """Switch collecting the statistics on or off."""
+        self.enabled = enabled
+        count_spawns(enabled)
+
+    def run(self, name: str, func: Callable, *args, **kwargs):
+        """Run func(*args, **kwargs) and remember its duration as name."""
+        if not self.enabled:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.durations[name] = time.perf_counter() - start
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """Return func measured as name, f.e. MainLoop.draw_screen as render."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(name, func, *args, **kwargs)
+        return wrapper
+
+    def add_journal_entries(self, count: int):
+        """Count read journal entries."""
+        if self.enabled:
+            self.journal_entries += count
+
+    def add_input_events(self, count: int):
+        """Account the number of events one input has caused."""
+        if self.enabled:
+            self.input_events = count
+            self.max_input_events = max(self.max_input_events, count)
+
+    def get_text(self) -> str:
+        """Return the statistics as one footer line."""
+        return (
+            f"render {self.durations['render'] * 1000:.2f}ms"
+            f" | event {self.durations['event'] * 1000:.1f}ms"
+            f" | tick {self.durations['tick'] * 1000:.1f}ms"
+            f" | {self.input_events}/{self.max_input_events} events/input"
+            f" | {get_spawns_per_minute()} proc/min"
+            f" | {self.journal_entries} journal entries"
+            f" | canvas cache {get_canvas_cache_hit_rate():.0f}% hits"
+        )
+
+
+def timed(name: str) -> Callable:
+    """Decorate an application method to be measured as name by its frame stats."""
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(app, *args, **kwargs):
+            control = getattr(app, "control", None)
+            if control is None or not control.app_control.frame_stats.enabled:
+                return method(app, *args, **kwargs)
+            return control.app_control.frame_stats.run(name, method, app, *args, **kwargs)
+        return wrapper
+    return decorator
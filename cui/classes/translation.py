@@ -0,0 +1,114 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the catalog manager holding the loaded translations"""
+import gettext
+import locale
+import os
+import weakref
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+DOMAIN: str = "cui"
+
+
+# pylint: disable=invalid-name
+# because N_ is the common name of the gettext noop marker
+def N_(msg: str) -> str:
+    """Mark msg for translation without translating it (f.e. to register it)."""
+    return msg
+
+
+class Catalog:
+    """
+    Loads the translation object of every language only once and memoizes the
+    lookups per language, so translating constant strings is a dict lookup.
+    """
+
+    def __init__(self, domain: str = DOMAIN):
+        self.domain = domain
+        self.language: Optional[str] = None
+        self._translations: Dict[str, gettext.NullTranslations] = {}
+        self._lookups: Dict[str, Dict[str, str]] = {}
+        self._translation: gettext.NullTranslations = gettext.NullTranslations()
+        self._lookup: Dict[str, str] = {}
+        self._registry: "weakref.WeakKeyDictionary[Any, Tuple[Any, str]]" = \
+            weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def get_localedir() -> Optional[str]:
+        """Return the local locale dir if run from source, None for the system one."""
+        return "locale" if os.path.exists("locale/de/LC_MESSAGES/cui.mo") else None
+
+    def _load(self, language: str) -> gettext.NullTranslations:
+        """Load the translation object of language (once)."""
+        if language not in self._translations:
+            self._translations[language] = gettext.translation(
+                self.domain,
+                self.get_localedir(),
+                languages=[language] if language else None,
+                fallback=True,
+            )
+            self._lookups[language] = {}
+        return self._translations[language]
+
+    def activate(self, language: Union[str, Iterable[str], None] = "") -> bool:
+        """
+        Activate language. An empty language uses the environment (LANG etc.).
+
+        :param language: The language (f.e. de_DE.UTF-8) to activate.
+        :return: True if the language has been changed, False otherwise.
+        """
+        if language is None:
+            language = ""
+        elif not isinstance(language, str):
+            language = ".".join(language)
+        if language == self.language:
+            return False
+        try:
+            locale.setlocale(locale.LC_ALL, language)
+        except locale.Error:
+            pass
+        self._translation = self._load(language)
+        self._lookup = self._lookups[language]
+        self.language = language
+        return True
+
+    def gettext(self, msg: str) -> str:
+        """Return the translation of msg in the active language."""
+        try:
+            return self._lookup[msg]
+        except KeyError:
+            translated = self._translation.gettext(msg)
+            self._lookup[msg] = translated
+            return translated
+
+    def translate(self, markup: Any) -> Any:
+        """Return the translation of an urwid markup, f.e. ("header", "Login")."""
+        if isinstance(markup, str):
+            return self.gettext(markup)
+        if isinstance(markup, tuple) and markup:
+            return markup[:-1] + (self.translate(markup[-1]),)
+        if isinstance(markup, list):
+            return [self.translate(elem) for elem in markup]
+        return markup
+
+    def register(self, widget: Any, source: Any, setter: str = "set_text") -> Any:
+        """
+        Register widget to be translated from its untranslated source markup now
+        and on every language switch.
+
+        :param widget: The widget containing translatable text.
+        :param source: The untranslated markup of the widget.
+        :param setter: The name of the widget method setting the text.
+        :return: The widget.
+        """
+        self._registry[widget] = (source, setter)
+        getattr(widget, setter)(self.translate(source))
+        return widget
+
+    def retranslate(self):
+        """Set the text of all registered widgets in the active language."""
+        for widget, (source, setter) in list(self._registry.items()):
+            getattr(widget, setter)(self.translate(source))
+
+
+catalog: Catalog = Catalog()
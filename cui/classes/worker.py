@@ -0,0 +1,158 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains helpers running work beside the urwid main loop"""
+import os
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+import urwid
+
+
+def run_in_background(
+        loop: urwid.MainLoop, func: Callable, callback: Callable[[Any, Exception], Any], *args
+):
+    """
+    Run func(*args) in a thread and call callback(result, error) on the urwid loop
+    when it is done. Exactly one of result and error is not None.
+
+    :param loop: The main loop (or PipeWatcher) the callback is called on.
+    :param func: The (blocking) function to run.
+    :param callback: Is called with the return value or the raised exception.
+    """
+    outcome: Dict[str, Any] = {"result": None, "error": None}
+
+    def done(_data):
+        callback(outcome["result"], outcome["error"])
+        # remove the watch and close the pipe
+        return False
+
+    pipe_fd = loop.watch_pipe(done)
+
+    def target():
+        # pylint: disable=broad-except
+        # because the error is handed over to the callback
+        try:
+            outcome["result"] = func(*args)
+        except Exception as err:
+            outcome["error"] = err
+        os.write(pipe_fd, b"1")
+        os.close(pipe_fd)
+
+    threading.Thread(target=target, daemon=True).start()
+
+
+class PipeWatcher:
+    """
+    Offers watch_pipe() of urwid.MainLoop on a bare event loop, so
+    run_in_background can call back on a loop no single console owns.
+    """
+
+    def __init__(self, event_loop: urwid.EventLoop):
+        self.event_loop = event_loop
+
+    def watch_pipe(self, callback: Callable[[bytes], Any]) -> int:
+        """
+        Call callback with the data written to the returned pipe until it returns False.
+
+        :param callback: Is called on the loop with the data read.
+        :return: The writing end of the pipe.
+        """
+        pipe_rd, pipe_wr = os.pipe()
+        os.set_blocking(pipe_rd, False)
+
+        def readable():
+            try:
+                data = os.read(pipe_rd, 4096)
+            except BlockingIOError:
+                return
+            if callback(data) is False:
+                self.event_loop.remove_watch_file(handle)
+                os.close(pipe_rd)
+
+        handle = self.event_loop.watch_file(pipe_rd, readable)
+        return pipe_wr
+
+
+class CoalescingJob:
+    """
+    Runs func in the background for one value at a time, f.e. applying a
+    keyboard layout. Values requested while it runs are coalesced: only the
+    last of them runs afterwards, the ones in between are dropped.
+    """
+
+    def __init__(self, func: Callable[[Any], Any], callback: Callable[[Any, Any, Exception], Any]):
+        """
+        :param func: The (blocking) function run with the value.
+        :param callback: Is called with value, result and error on the loop when done.
+        """
+        self.func = func
+        self.callback = callback
+        self.running: bool = False
+        self.dropped: int = 0
+        self.has_pending: bool = False
+        self._pending: Any = None
+
+    def request(self, loop: urwid.MainLoop, value: Any):
+        """Run func(value) now or after the running one, replacing a waiting value."""
+        if self.running:
+            if self.has_pending:
+                self.dropped += 1
+            self._pending = value
+            self.has_pending = True
+            return
+        self._start(loop, value)
+
+    def _start(self, loop: urwid.MainLoop, value: Any):
+        """Run func(value) in the background."""
+        self.running = True
+
+        def done(result: Any, error: Exception):
+            self.running = False
+            self.callback(value, result, error)
+            if self.has_pending:
+                pending, self._pending, self.has_pending = self._pending, None, False
+                self._start(loop, pending)
+
+        run_in_background(loop, self.func, done, value)
+
+
+class ProgressPipe:
+    """
+    Hands the progress of work running in the background over to the loop.
+    report() may be called from any thread (as often as it likes), the
+    callback is called on the loop with the latest progress only.
+    """
+
+    def __init__(self, loop: urwid.MainLoop, callback: Callable[[int, int], Any]):
+        """
+        :param loop: The main loop the callback is called on.
+        :param callback: Is called with the done and the total amount of work.
+        """
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._latest: Tuple[int, int] = (0, 0)
+        self._notified: bool = False
+        self._pipe_fd = loop.watch_pipe(self._received)
+
+    def report(self, done: int, total: int):
+        """Set the progress, waking up the loop unless it has not seen the last one yet."""
+        with self._lock:
+            self._latest = (done, total)
+            notify, self._notified = not self._notified, True
+        if notify:
+            os.write(self._pipe_fd, b"1")
+
+    def _received(self, data: bytes) -> bool:
+        """Call the callback with the latest progress."""
+        if not data:
+            # closed, remove the watch
+            return False
+        with self._lock:
+            done, total = self._latest
+            self._notified = False
+        self.callback(done, total)
+        return True
+
+    def close(self):
+        """Stop watching, a progress reported before is still handed over."""
+        os.close(self._pipe_fd)
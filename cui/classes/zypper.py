@@ -0,0 +1,251 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2022 grommunio GmbH
+"""The module contains the system update running zypper in the background"""
+import collections
+import re
+import threading
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+from xml.etree import ElementTree
+
+import urwid
+
+from cui.classes.runner import runner, CommandResult
+from cui.classes.translation import N_
+from cui.classes.worker import ProgressPipe, run_in_background
+
+# The steps of the update: their title, share of the overall progress (in percent)
+# and zypper command
+UPDATE_COMMANDS: Tuple[Tuple[str, int, Sequence[str]], ...] = (
+    (N_("Refreshing repositories"), 10, (
+        "zypper", "--non-interactive", "--xmlout", "--gpg-auto-import-keys", "refresh",
+    )),
+    (N_("Updating packages"), 90, (
+        "zypper", "--non-interactive", "--xmlout", "update", "--auto-agree-with-licenses",
+    )),
+)
+# Exit codes of zypper meaning success: 102 (reboot needed), 103 (zypper itself
+# updated) and 106 (some repositories skipped)
+ZYPPER_SUCCESS: Tuple[int, ...] = (0, 102, 103, 106)
+ZYPPER_REBOOT_NEEDED: int = 102
+# Number of kept messages of zypper
+MESSAGE_COUNT: int = 5
+# "(2/13) Installing: ..." and "Retrieving: ... (2/13), 1.2 MiB"
+STEP_PATTERN = re.compile(r"\((\d+)/(\d+)\)")
+
+
+class ZypperProgress:
+    """
+    The progress of one zypper run, parsed from its --xmlout stream while it
+    is running. Every <progress> starts, advances or ends a task, every
+    <download> advances the task by its percentage, and the "(n/N)" in the
+    task names tells the package steps done. Each package is retrieved
+    (unless nothing is to download) and installed, maybe interleaved, so
+    both kinds of steps are counted on their own.
+    """
+
+    def __init__(self):
+        self.task: str = ""
+        self.task_percent: int = 0
+        self.steps: int = 0
+        self.downloads: bool = True
+        self.packages: List[str] = []
+        self.messages: Deque[Tuple[str, str]] = collections.deque(maxlen=MESSAGE_COUNT)
+        self.errors: List[str] = []
+        # the steps done per kind ("download" or "install"), the kind and number
+        # of the running step
+        self._done: Dict[str, int] = {}
+        self._kind: str = ""
+        self._step: int = 0
+        self._parser = ElementTree.XMLPullParser(events=("end",))
+
+    @property
+    def percent(self) -> int:
+        """Return the overall progress of the run (by its package steps)."""
+        if not self.steps:
+            return 0
+        done = sum(self._done.values())
+        if self._kind:
+            done += self.task_percent / 100
+        total = self.steps * (2 if self.downloads else 1)
+        return min(int(100 * done / total), 100)
+
+    def feed(self, data: bytes):
+        """Parse the next chunk of the stream."""
+        if self._parser is None:
+            return
+        try:
+            self._parser.feed(data)
+            for _, element in self._parser.read_events():
+                self._handle(element)
+        except ElementTree.ParseError as err:
+            # not parsable any more, f.e. not a zypper --xmlout stream
+            self.errors.append(str(err))
+            self._parser = None
+
+    def _handle(self, element: ElementTree.Element):
+        """Take over the progress of a complete element."""
+        handler = {
+            "progress": self._handle_progress,
+            "download": self._handle_download,
+            "message": self._handle_message,
+            "solvable": self._handle_solvable,
+            "install-summary": self._handle_summary,
+        }.get(element.tag)
+        if handler is not None:
+            handler(element)
+            # keep the memory of long streams low
+            element.clear()
+
+    def _handle_progress(self, element: ElementTree.Element):
+        name = element.get("name", "")
+        if "done" in element.attrib:
+            self.task_percent = 100
+            if element.get("done") != "0":
+                self.errors.append(name)
+            if self._kind:
+                self._done[self._kind] = self._step
+                self._kind = ""
+        elif "value" in element.attrib:
+            self.task_percent = _to_percent(element.get("value"))
+        else:
+            self.task = name
+            self.task_percent = 0
+            match = STEP_PATTERN.search(name)
+            self._kind = ""
+            if match:
+                self._kind = "download" if name.startswith("Retrieving") else "install"
+                self._step, self.steps = int(match.group(1)), int(match.group(2))
+                self._done[self._kind] = self._step - 1
+
+    def _handle_download(self, element: ElementTree.Element):
+        if "done" in element.attrib:
+            self.task_percent = 100
+        else:
+            self.task_percent = _to_percent(element.get("percent"))
+
+    def _handle_message(self, element: ElementTree.Element):
+        kind = element.get("type", "info")
+        text = (element.text or "").strip()
+        self.messages.append((kind, text))
+        if kind == "error":
+            self.errors.append(text)
+
+    def _handle_solvable(self, element: ElementTree.Element):
+        self.packages.append(f"{element.get('name', '')}-{element.get('edition', '')}")
+
+    def _handle_summary(self, element: ElementTree.Element):
+        # all packages cached (or only removed), nothing is retrieved
+        self.downloads = element.get("download-size", "0") != "0"
+
+
+def _to_percent(value: Optional[str]) -> int:
+    """Return value as percentage (0 if unknown, f.e. -1)."""
+    try:
+        return min(max(int(float(value)), 0), 100)
+    except (TypeError, ValueError):
+        return 0
+
+
+class UpdateStatus:
+    """A consistent view on the update, taken on the loop while it is running."""
+
+    def __init__(self, title: str, task: str, task_percent: int, percent: int, message: str):
+        self.title = title
+        self.task = task
+        self.task_percent = task_percent
+        self.percent = percent
+        self.message = message
+
+
+class UpdateJob:
+    """
+    Updates the system in the background: refreshes the repositories and
+    updates the packages by zypper, non-interactively. The progress is
+    parsed from the output as it arrives and handed over to the loop, so a
+    dialog can show it while the CUI keeps working.
+    """
+
+    def __init__(self, commands: Sequence[Tuple[str, int, Sequence[str]]] = UPDATE_COMMANDS):
+        self.commands = commands
+        self.running: bool = False
+        self.results: List[CommandResult] = []
+        self.progress: ZypperProgress = ZypperProgress()
+        self.step: int = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ok(self) -> bool:
+        """Return if all commands of the last update have succeeded."""
+        return len(self.results) == len(self.commands) \
+            and all(result.returncode in ZYPPER_SUCCESS for result in self.results)
+
+    @property
+    def reboot_needed(self) -> bool:
+        """Return if zypper asks for a reboot after the last update."""
+        return any(result.returncode == ZYPPER_REBOOT_NEEDED for result in self.results)
+
+    def start(
+            self, loop: urwid.MainLoop, on_progress: Callable[[], None],
+            on_done: Callable[["UpdateJob"], None]
+    ) -> bool:
+        """
+        Start the update unless it is running.
+
+        :param loop: The main loop the callbacks are called on.
+        :param on_progress: Is called when the progress has changed (see get_status).
+        :param on_done: Is called with the job when all commands have run.
+        :return: True if started, False if already running.
+        """
+        if self.running:
+            return False
+        self.running = True
+        self.results = []
+        progress = ProgressPipe(loop, lambda *_args: on_progress())
+
+        def done(_result, error: Exception):
+            progress.close()
+            self.running = False
+            if error is not None:
+                failed = CommandResult([])
+                failed.error = str(error)
+                self.results.append(failed)
+            on_done(self)
+
+        run_in_background(loop, self._run, done, progress)
+        return True
+
+    def _run(self, progress: ProgressPipe):
+        """Run the commands one after another until one fails (in the background)."""
+        for step, (_title, _share, args) in enumerate(self.commands):
+            with self._lock:
+                self.step = step
+                self.progress = ZypperProgress()
+            progress.report(step, len(self.commands))
+
+            def feed(data: bytes, step=step):
+                with self._lock:
+                    self.progress.feed(data)
+                progress.report(step, len(self.commands))
+
+            result = runner.run(args, timeout=None, on_output=feed)
+            self.results.append(result)
+            if result.returncode not in ZYPPER_SUCCESS:
+                break
+
+    def get_status(self) -> UpdateStatus:
+        """Return the state of the running (or last) update."""
+        with self._lock:
+            progress = self.progress
+            title, share, _args = self.commands[self.step]
+            done = sum(command[1] for command in self.commands[:self.step])
+            messages = [text for _kind, text in progress.messages if text]
+            return UpdateStatus(
+                title,
+                progress.task,
+                progress.task_percent,
+                done + share * progress.percent // 100,
+                messages[-1] if messages else "",
+            )
+
+
+update_job: UpdateJob = UpdateJob()
@@ -10,6 +10,8 @@ REBOOT: str = "REBOOT"
 SHUTDOWN: str = "SHUTDOWN"
 NETWORK_CONFIG_MENU: str = "NETWORK-CONFIG-MENU"
 UNSUPPORTED: str = "UNSUPPORTED"
+# Hidden input toggling the profiler (in the log viewer like UNSUPPORTED)
+PROFILER: str = "PERF"
 PASSWORD: str = "PASSWORD"
 DEVICE_CONFIG: str = "DEVICE-CONFIG"
 IP_CONFIG: str = "IP-CONFIG"
@@ -22,3 +24,5 @@ ADMIN_WEB_PW: str = "ADMIN-WEB-PW"
 TIMESYNCD: str = "TIMESYNCD"
 KEYBOARD_SWITCH: str = "KEYBOARD_SWITCH"
 REPO_SELECTION: str = "REPOSITORY-SELECTION"
+SYSTEM_UPDATE: str = "SYSTEM-UPDATE"
+REPO_UPDATE: str = "REPOSITORY-UPDATE"
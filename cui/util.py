@@ -2,26 +2,25 @@
 # SPDX-FileCopyrightText: 2021 grommunio GmbH
 """The module contains all cui utilities/functions"""
 import os
-import subprocess
-import sys
-import time
 from pathlib import Path
 import ipaddress
 import locale
 import platform
 import socket
 import shlex
+import sys
 from typing import Any, Dict, List, Tuple, Union, Iterable
 from datetime import datetime
 
 import psutil
-import requests
 from pamela import authenticate, PAMError
 
-from requests import Response
-
 import urwid
 import cui
+from cui.classes.bandwidth import OutputCounter
+from cui.classes.collector import collector, TTL_SYSINFO
+from cui.classes.runner import runner
+from cui.classes.translation import catalog
 
 
 def _(msg):
@@ -29,7 +28,16 @@ def _(msg):
     return msg
 
 
-STATES = {
+# Prefix of all system paths, f.e. a fake root tree for the benchmarks
+ROOT_PREFIX: str = os.environ.get("GROMMUNIO_CUI_ROOT", "")
+
+
+def root_path(path: str) -> str:
+    """Return the system path below ROOT_PREFIX."""
+    return f"{ROOT_PREFIX}{path}"
+
+
+STATES_SOURCE = {
     1: _("System password is not set."),
     2: _("Network configuration is missing."),
     4: _("grommunio-setup has not been run yet."),
@@ -37,6 +45,7 @@ STATES = {
     16: _("nginx is not running."),
     32: _("grommunio-admin is not installed."),
 }
+STATES = dict(STATES_SOURCE)
 
 
 def reset_states():
@@ -44,33 +53,15 @@ def reset_states():
     # pylint: disable=global-statement
     # because that is needed for on the fly translation
     global STATES
-    new_states = {}
-    if STATES:
-        for key, val in STATES.items():
-            new_states[key] = _(val)
-    STATES = new_states
+    STATES = {key: catalog.gettext(val) for key, val in STATES_SOURCE.items()}
     return STATES
 
 
 def init_localization(language: Union[str, str, Iterable[Union[str, str]], None] = ''):
-    """Initialize localisation"""
-    locale.setlocale(locale.LC_ALL, language)
-    try:
-        locale.bindtextdomain(
-            'cui', 'locale' if os.path.exists("locale/de/LC_MESSAGES/cui.mo") else None
-        )
-        locale.textdomain('cui')
-        _ = locale.gettext
-        reset_states()
-        return _
-    except OSError:
-        def _(msg):
-            """
-            Function for tagging text for translations.
-            """
-            return msg
+    """Initialize localisation. The catalog is only reloaded if language changes."""
+    if catalog.activate(language):
         reset_states()
-        return _
+    return catalog.gettext
 
 
 _ = init_localization()
@@ -102,40 +93,55 @@ def get_button_type(key, open_func_on_ok, mb_func, cancel_msgbox_params, size):
     return val
 
 
-def restart_gui():
-    """Restart complete GUI to source language in again."""
-    ret_val = _
-    langfile = '/etc/sysconfig/language'
+def switch_language():
+    """Switch the GUI in place to the language configured in /etc/locale.conf."""
+    langfile = root_path('/etc/sysconfig/language')
     config = cui.classes.parser.ConfigParser(infile=langfile)
     config['ROOT_USES_LANG'] = '"yes"'
     config.write()
-    # assert os.getenv('PPID') == 1, 'Gugg mal rein da!'
-    locale_conf = minishell_read('/etc/locale.conf')
-    # _ = util.init_localization()
-    # mainapp()
-    if os.getppid() == 1:
-        # from pudb.remote import set_trace; set_trace(term_size=(230, 60))
-        ret_val = init_localization(language=locale_conf.get('LANG', ''))
-        cui.main_app(True)
-        # raise ExitMainLoop()
-    else:
-        env = {}
-        for k in os.environ:
-            env[k] = os.environ.get(k)
-        for k in locale_conf:
-            env[k] = locale_conf.get(k)
-        os.execve(sys.executable, [sys.executable] + sys.argv, env)
+    locale_conf = minishell_read(root_path('/etc/locale.conf'))
+    # Started tools (yast2, su, ...) should follow the new language, too
+    for key, value in locale_conf.items():
+        os.environ[key] = value
+    ret_val = init_localization(language=locale_conf.get('LANG', ''))
+    catalog.retranslate()
+    # Collected texts like the sysinfo panes are translated, so collect them again
+    collector.invalidate()
     return ret_val
 
 
-def create_main_loop(app):
-    """Create urwid main loop"""
+def create_main_loop(
+        app, tty: str = None, event_loop: urwid.EventLoop = None, count_output: bool = False
+):
+    """Create urwid main loop
+
+    :param app: The application the loop is created for.
+    :param tty: The console device (f.e. tty2) to draw on instead of stdin/stdout.
+    :param event_loop: The event loop to share with the loops of other consoles.
+    :param count_output: Count the bytes written to the screen (debug and low-bandwidth mode).
+    """
     urwid.set_encoding("utf-8")
     app.view.gscreen = cui.classes.application.GScreen()
-    app.view.gscreen.screen = urwid.raw_display.Screen()
-    app.view.gscreen.old_termios = app.view.gscreen.screen.tty_signal_keys()
+    if tty:
+        # pylint: disable=consider-using-with
+        # because the console stays open as long as the screen is alive
+        app.view.gscreen.tty = tty
+        tty_in = open(f"/dev/{tty}", "rb", buffering=0)
+        tty_out = open(f"/dev/{tty}", "w", encoding="utf-8")
+        app.view.gscreen.tty_files = (tty_in, tty_out)
+        app.view.gscreen.tty_fileno = tty_in.fileno()
+    else:
+        tty_in, tty_out = sys.stdin, sys.stdout
+    if count_output:
+        app.view.gscreen.output = OutputCounter(tty_out)
+    app.view.gscreen.screen = urwid.raw_display.Screen(
+        input=tty_in, output=app.view.gscreen.output or tty_out
+    )
+    app.view.gscreen.old_termios = app.view.gscreen.screen.tty_signal_keys(
+        fileno=app.view.gscreen.tty_fileno
+    )
     app.view.gscreen.blank_termios = ["undefined" for _ in range(0, 5)]
-    app.view.gscreen.screen.tty_signal_keys(*app.view.gscreen.blank_termios)
+    app.view.gscreen.set_signal_keys(app.view.gscreen.blank_termios)
     app.prepare_mainscreen()
     # Loop
     return urwid.MainLoop(
@@ -144,12 +150,13 @@ def create_main_loop(app):
         unhandled_input=app.handle_event,
         screen=app.view.gscreen.screen,
         handle_mouse=False,
+        event_loop=event_loop,
     )
 
 
 def get_distribution_level():
     """Return the distribution level depending on os-release"""
-    if lineconfig_read('/etc/os-release').get('VERSION', '"2022.05.2"').startswith('"2022.12'):
+    if lineconfig_read(root_path('/etc/os-release')).get('VERSION', '"2022.05.2"').startswith('"2022.12'):
         return '15.4'
     return '15.5'
 
@@ -164,36 +171,16 @@ def get_repo_url(user: str = None, password: str = None):
     return ''.join([url, '?ssl_verify=no'])
 
 
-def check_repo_dialog(app, height):
-    """Check the repository selection dialog"""
-    updateable = False
-    if app.control.menu_control.repo_selection_body.base_widget[3].state:
-        # supported selected
-        user = app.control.menu_control.repo_selection_body.base_widget[4][1].edit_text
-        password = app.control.menu_control.repo_selection_body.base_widget[5][1].edit_text
-        testurl = f"https://download.grommunio.com/supported/open" \
-                  f"SUSE_Leap_{get_distribution_level()}/repodata/repomd.xml"
-        req: Response = requests.get(testurl, auth=(user, password))
-        if req.status_code == 200:
-            updateable = True
-        else:
-            app.message_box(
-                cui.parameter.MsgBoxParams(
-                    _('Please check the credentials for "supported"'
-                      '-version or use "community"-version.'),
-                ),
-                size=cui.parameter.Size(height=height + 1)
-            )
-    else:
-        # community selected
-        updateable = True
-        user = None
-        password = None
-    return updateable, get_repo_url(user, password)
+def get_repo_selection(app) -> Tuple[bool, str, str]:
+    """Return if "supported" is selected in the repository selection dialog and its credentials"""
+    body = app.control.menu_control.repo_selection_body.base_widget
+    if body[3].state:
+        return True, body[4][1].edit_text, body[5][1].edit_text
+    return False, "", ""
 
 
 def check_if_gradmin_exists():
-    exe = "/usr/sbin/grommunio-admin"
+    exe = root_path("/usr/sbin/grommunio-admin")
     if Path(exe).exists():
         return True
     return False
@@ -250,6 +237,7 @@ _PALETTES: Dict[str, List[Tuple[str, ...]]] = {
             "#aaa",
         ),
         ("disabled", FG_DARK_GRAY, BG_BLACK, "", "#fff", "#111"),
+        ("stale", FG_DARK_GRAY, BG_BLACK, "", "#fff", "#111"),
         ("selectable", FG_WHITE, BG_BLACK, "", "#fff", "#111"),
         ("focus", FG_BLACK, BG_LIGHT_GRAY, "", "#111", "#ccc"),
         (
@@ -294,6 +282,7 @@ _PALETTES: Dict[str, List[Tuple[str, ...]]] = {
             "#111",
         ),
         ("disabled", FG_DARK_GRAY, BG_LIGHT_GRAY, "", "#111", "#fff"),
+        ("stale", FG_DARK_GRAY, BG_LIGHT_GRAY, "", "#111", "#fff"),
         ("selectable", FG_BLACK, BG_LIGHT_GRAY, "", "#111", "#fff"),
         ("focus", FG_WHITE, BG_BLACK, "", "#fff", "#888"),
         (
@@ -338,6 +327,7 @@ _PALETTES: Dict[str, List[Tuple[str, ...]]] = {
             "#fff",
         ),
         ("disabled", FG_DARK_GRAY, BG_BLACK, "", "#fff", "#111"),
+        ("stale", FG_DARK_GRAY, BG_BLACK, "", "#fff", "#111"),
         ("selectable", FG_WHITE, BG_BLACK, "", "#fff", "#111"),
         ("focus", FG_BLACK, BG_LIGHT_GRAY, "", "#111", "#ccc"),
         (
@@ -382,6 +372,7 @@ _PALETTES: Dict[str, List[Tuple[str, ...]]] = {
             "#111",
         ),
         ("disabled", FG_DARK_GRAY, BG_LIGHT_GRAY, "", "#111", "#fff"),
+        ("stale", FG_DARK_GRAY, BG_LIGHT_GRAY, "", "#111", "#fff"),
         ("selectable", FG_BLACK, BG_LIGHT_GRAY, "", "#111", "#fff"),
         ("focus", FG_WHITE, BG_BLACK, "", "#fff", "#888"),
         (
@@ -476,7 +467,7 @@ def make_list_gtext(list_wowo_gtext):
 
 def check_if_password_is_set(user):
     """Check if user exists in /etc/shadow and has his password set."""
-    file = "/etc/shadow"
+    file = root_path("/etc/shadow")
     items = {}
     if os.access(file, os.R_OK):
         with open(file, encoding="utf-8") as file_handle:
@@ -508,7 +499,7 @@ def authenticate_user(username: str, password: str, service: str = "login") -> b
 
 def get_os_release() -> Tuple[str, str]:
     """Return os release"""
-    osr: Path = Path("/etc/os-release")
+    osr: Path = Path(root_path("/etc/os-release"))
     name: str = _("No name found")
     version: str = _("No version detectable")
     with osr.open("r", encoding="utf-8") as file_handle:
@@ -541,14 +532,8 @@ def get_ip_list() -> List[str]:
 
 def get_last_login_time():
     """Return last login time as string"""
-    with subprocess.Popen(
-        ["last", "-1", "root"],
-        stderr=subprocess.DEVNULL,
-        stdout=subprocess.PIPE,
-    ) as proc:
-        res, _ = proc.communicate()
-        out = bytes(res).decode()
-        lines = out.splitlines()
+    out = runner.run(["last", "-1", "root"], timeout=5).stdout
+    lines = out.splitlines()
     last_login = ""
     if len(lines) > 0:
         parts = out.splitlines()[0].split("              ")
@@ -559,7 +544,7 @@ def get_last_login_time():
 
 def get_load():
     """Return current average load"""
-    with open("/proc/loadavg", "r", encoding="utf-8") as file_handle:
+    with open(root_path("/proc/loadavg"), "r", encoding="utf-8") as file_handle:
         out = file_handle.read()
     lines = out.splitlines()
     load_1min = 0
@@ -576,7 +561,7 @@ def get_load():
 
 def get_load_avg_format_list():
     """Return list of average load"""
-    load_avg = get_load()
+    load_avg = collector.get("load", get_load)
     load_format = [("footer", _(" Average load: "))]
     for i, time_unit in enumerate([1, 5, 15]):
         load_format.append(("footer", f"{time_unit} min:"))
@@ -627,16 +612,18 @@ def get_system_info_top():
     return ret_val
 
 
-def get_system_info_bottom():
+def get_system_info_bottom(state=None):
+    """Return bottom sysinfo of state (the global setup state if None)"""
     from cui.classes.application import setup_state
-    """Return bottom sysinfo"""
+    if state is None:
+        state = setup_state
     ret_val: List[Union[str, Tuple[str, str]]] = []
     uname = platform.uname()
     if_addrs = psutil.net_if_addrs()
     boot_time_timestamp = psutil.boot_time()
     boot_time = datetime.fromtimestamp(boot_time_timestamp)
     proto = "http"
-    if setup_state.check_setup_state() == 0:
+    if state.check_setup_state() == 0:
         ret_val += [
             "\n",
             _("For further configuration, these URLs can be used:"),
@@ -676,10 +663,10 @@ def get_system_info_bottom():
             _("There are still some tasks missing to run/use grommunio.")
         )
         ret_val.append("\n")
-        statelist = extract_bits(setup_state.check_setup_state())
-        for state in statelist:
+        statelist = extract_bits(state.check_setup_state())
+        for state_bit in statelist:
             ret_val.append("\n")
-            ret_val.append(("important", STATES.get(state)))
+            ret_val.append(("important", STATES.get(state_bit)))
         ret_val.append("\n")
     ret_val.append("\n")
     ret_val.append(_("Boot Time: "))
@@ -704,9 +691,9 @@ def get_system_info(which: str) -> List[Union[str, Tuple[str, str]]]:
     """
     ret_val: List[Union[str, Tuple[str, str]]] = []
     if which == "top":
-        ret_val = get_system_info_top()
+        ret_val = collector.get("sysinfo-top", get_system_info_top, ttl=TTL_SYSINFO)
     elif which == "bottom":
-        ret_val = get_system_info_bottom()
+        ret_val = collector.get("sysinfo-bottom", get_system_info_bottom, ttl=TTL_SYSINFO)
     else:
         ret_val.append(_("Oops!"))
         ret_val.append(_("There should be nothing."))
@@ -754,10 +741,11 @@ def get_hr(formatbytes, suffix="B", factor=1024):
     return f"{formatbytes:.2f} {suffix}"
 
 
-def get_clockstring() -> str:
+def get_clockstring(seconds: bool = True) -> str:
     """
     Returns the current date and clock formatted correctly.
 
+    :param seconds: Include the seconds (changing with every tick).
     :return: The formatted clockstring.
     """
     current_time: datetime = datetime.now()
@@ -766,6 +754,8 @@ def get_clockstring() -> str:
     day: str = pad(current_time.day, "0", 2)
     hour: str = pad(current_time.hour, "0", 2)
     minute: str = pad(current_time.minute, "0", 2)
+    if not seconds:
+        return f"{year}-{month}-{day} {hour}:{minute}"
     second: str = pad(current_time.second, "0", 2)
     return f"{year}-{month}-{day} {hour}:{minute}:{second}"
 
@@ -891,7 +881,7 @@ def minishell_write(file, items):
 
 def get_current_kbdlayout():
     """Return current keyboard layout"""
-    items = minishell_read("/etc/vconsole.conf")
+    items = minishell_read(root_path("/etc/vconsole.conf"))
     return items.get("KEYMAP", "us").strip('"')
 
 
@@ -899,21 +889,7 @@ def reset_system_passwd(new_pw: str) -> bool:
     """Reset the system password."""
     if new_pw:
         if new_pw != "":
-            with subprocess.Popen(
-                ["passwd"],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            ) as proc:
-                proc.stdin.write(f"{new_pw}\n{new_pw}\n".encode())
-                proc.stdin.flush()
-                i = 0
-                while i < 10 and proc.poll() is None:
-                    time.sleep(0.1)
-                    i += 1
-                proc.terminate()
-                proc.kill()
-                return proc.returncode == 0
+            return runner.run(["passwd"], timeout=5, stdin=f"{new_pw}\n{new_pw}\n").ok
     return False
 
 
@@ -922,12 +898,7 @@ def reset_aapi_passwd(new_pw: str) -> bool:
     if new_pw:
         if new_pw != "":
             exe = "grammm-admin"
-            if Path("/usr/sbin/grommunio-admin").exists():
+            if Path(root_path("/usr/sbin/grommunio-admin")).exists():
                 exe = "grommunio-admin"
-            with subprocess.Popen(
-                [exe, "passwd", "--password", new_pw],
-                stderr=subprocess.DEVNULL,
-                stdout=subprocess.DEVNULL,
-            ) as proc:
-                return proc.wait() == 0
+            return runner.run([exe, "passwd", "--password", new_pw], timeout=30).ok
     return False